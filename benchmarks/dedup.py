@@ -0,0 +1,97 @@
+"""
+Benchmark the deduplication filter.
+
+Measures the throughput of the exact (LRU) and Bloom filter modes, and the
+memory they use, for a stream of GPS reports where a fraction of the events
+are retransmitted. Run with:
+
+    $ python benchmarks/dedup.py
+
+"""
+
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import partial
+from typing import Callable, List
+
+from senor_octopus.filters.dedup import (
+    LRUSet,
+    RotatingBloomFilter,
+    SeenSet,
+    fingerprint,
+)
+from senor_octopus.types import Event
+
+KEYS = ["name", "value.serial", "value.timestamp"]
+
+
+def make_events(number: int, duplicates: float = 0.1) -> List[Event]:
+    """
+    Build a list of events, with a fraction of retransmissions.
+    """
+    timestamp = datetime.now(timezone.utc)
+    events: List[Event] = []
+    for i in range(number):
+        if events and random.random() < duplicates:
+            events.append(random.choice(events[-1000:]))
+            continue
+        events.append(
+            {
+                "timestamp": timestamp,
+                "name": "hub.micron",
+                "value": {
+                    "serial": f"{i % 100:06d}",
+                    "timestamp": i,
+                    "lat": 37.751 + random.random(),
+                    "lon": -97.822 + random.random(),
+                },
+            },
+        )
+    return events
+
+
+def run(name: str, factory: Callable[[], SeenSet], events: List[Event]) -> None:
+    """
+    Run a single benchmark.
+    """
+    digests = [fingerprint(event, KEYS) for event in events]
+
+    seen = factory()
+    start = time.perf_counter()
+    dropped = sum(seen.check(digest, 0) for digest in digests)
+    elapsed = time.perf_counter() - start
+
+    # measure memory in a separate run, since tracing slows things down
+    tracemalloc.start()
+    seen = factory()
+    for digest in digests:
+        seen.check(digest, 0)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(
+        f"{name:<12} {len(events) / elapsed:>12,.0f} {dropped:>10,} "
+        f"{memory / 1e6:>10.1f} {seen.memory / 1e6:>10.1f}",
+    )
+
+
+def main(number: int = 200000) -> None:
+    """
+    Run the benchmark.
+    """
+    events = make_events(number)
+    fingerprint_time = time.perf_counter()
+    for event in events:
+        fingerprint(event, KEYS)
+    fingerprint_time = time.perf_counter() - fingerprint_time
+
+    print(f"{'mode':<12} {'events/s':>12} {'dropped':>10} {'MB':>10} {'est. MB':>10}")
+    print(f"{'fingerprint':<12} {number / fingerprint_time:>12,.0f}")
+    run("exact", partial(LRUSet, number, None), events)
+    run("bloom", partial(RotatingBloomFilter, number, 0.001, 3600), events)
+
+
+if __name__ == "__main__":
+    main()
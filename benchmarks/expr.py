@@ -0,0 +1,81 @@
+"""
+Benchmark the expression filter against the JSON Path and Jinja2 filters.
+
+Each filter selects random readings above a threshold; the expression and
+Jinja2 filters also convert the value. Run with:
+
+    $ python benchmarks/expr.py
+
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, List
+
+from asyncstdlib.builtins import aiter as aiter_
+
+from senor_octopus.filters.expr import expr
+from senor_octopus.filters.jinja import jinja
+from senor_octopus.filters.jpath import jsonpath
+from senor_octopus.types import Event, Stream
+
+FILTERS = {
+    "jsonpath": (jsonpath, {"filter": "$.events[?(@.value>0.5)]"}),
+    "jinja": (
+        jinja,
+        {
+            "template": (
+                "{% if event['value'] > 0.5 %}"
+                "{{ event['value'] * 1.8 + 32 }}"
+                "{% endif %}"
+            ),
+        },
+    ),
+    "expr": (expr, {"filter": "value > 0.5", "value": "value * 1.8 + 32"}),
+}
+
+
+async def consume(
+    plugin: Callable[..., Stream], events: List[Event], **kwargs: Any
+) -> int:
+    """
+    Run a filter over a list of events, returning how many were emitted.
+    """
+    return len([event async for event in plugin(aiter_(events), **kwargs)])
+
+
+def main(number: int = 100000) -> None:
+    """
+    Run the benchmark.
+    """
+    timestamp = datetime.now(timezone.utc)
+    events: List[Event] = [
+        {"timestamp": timestamp, "name": "hub.random", "value": random.random()}
+        for _ in range(number)
+    ]
+    batch: List[Event] = [
+        {
+            "timestamp": timestamp,
+            "name": "hub.random",
+            "value": [event["value"] for event in events],
+        },
+    ]
+
+    print(f"{'filter':<16} {'events/s':>12} {'emitted':>10}")
+    for name, (plugin, kwargs) in FILTERS.items():
+        start = time.perf_counter()
+        emitted = asyncio.run(consume(plugin, events, **kwargs))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} {number / elapsed:>12,.0f} {emitted:>10,}")
+
+    # a single event with a list of values is evaluated with NumPy
+    start = time.perf_counter()
+    asyncio.run(consume(expr, batch, **FILTERS["expr"][1]))
+    elapsed = time.perf_counter() - start
+    print(f"{'expr (batch)':<16} {number / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
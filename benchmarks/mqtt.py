@@ -0,0 +1,113 @@
+"""
+Benchmark the MQTT source with a local stand-in for the broker.
+
+The stand-in client delivers pre-built messages as fast as the source can
+consume them, so the benchmark measures the cost of routing and decoding
+messages, without the network. Run with:
+
+    $ python benchmarks/mqtt.py
+
+"""
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List
+
+from paho.mqtt.client import MQTTMessage
+
+import senor_octopus.mqtt
+import senor_octopus.sources.mqtt
+from senor_octopus.mqtt import close_connections
+from senor_octopus.sources.mqtt import mqtt
+
+PAYLOAD = json.dumps(
+    {"device": "awair-element-12345", "temp": 21.45, "humid": 48.2, "co2": 612},
+).encode()
+
+CONFIGURATIONS = {
+    "text": {},
+    "json": {"message_is_json": True, "loads": json.loads},
+    "orjson": {"message_is_json": True},
+    "orjson (batch)": {"message_is_json": True, "batch_size": 256},
+    "raw (batch)": {"raw": True, "batch_size": 256},
+}
+
+
+class StandInClient:
+    """
+    A client that receives the same messages over and over.
+    """
+
+    messages: List[MQTTMessage] = []
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        pass
+
+    async def __aenter__(self) -> "StandInClient":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        pass
+
+    async def subscribe(self, *args: Any, **kwargs: Any) -> None:
+        """
+        Subscribe to a topic.
+        """
+
+    async def unsubscribe(self, *args: Any, **kwargs: Any) -> None:
+        """
+        Unsubscribe from topics.
+        """
+
+    @asynccontextmanager
+    async def unfiltered_messages(self) -> AsyncIterator[AsyncIterator[MQTTMessage]]:
+        """
+        Deliver the messages, yielding to the loop between bursts.
+        """
+
+        async def messages() -> AsyncIterator[MQTTMessage]:
+            while True:
+                for message in self.messages:
+                    yield message
+                await asyncio.sleep(0)
+
+        yield messages()
+
+
+async def consume(number: int, **kwargs: Any) -> None:
+    """
+    Read a number of events from the source.
+    """
+    stream = mqtt(["sensors/#"], **kwargs)
+    for _ in range(number):
+        await stream.__anext__()
+    await stream.aclose()
+    await close_connections()
+
+
+def main(number: int = 200000) -> None:
+    """
+    Run the benchmark.
+    """
+    StandInClient.messages = []
+    for i in range(100):
+        message = MQTTMessage(topic=f"sensors/{i}".encode())
+        message.payload = PAYLOAD
+        StandInClient.messages.append(message)
+    senor_octopus.mqtt.Client = StandInClient  # type: ignore
+
+    print(f"{'configuration':<16} {'messages/s':>12}")
+    default_loads = senor_octopus.sources.mqtt.json_loads
+    for name, kwargs in CONFIGURATIONS.items():
+        kwargs = dict(kwargs)
+        senor_octopus.sources.mqtt.json_loads = kwargs.pop("loads", default_loads)
+        start = time.perf_counter()
+        asyncio.run(consume(number, **kwargs))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} {number / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
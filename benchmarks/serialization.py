@@ -0,0 +1,74 @@
+"""
+Benchmark the serialization codecs.
+
+The payloads mimic what flows through the MQTT source/sink (a small JSON
+object with sensor readings) and the Postgres sink (an event with a nested
+value). Run with:
+
+    $ python benchmarks/serialization.py
+
+"""
+
+import timeit
+from functools import partial
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.serialization import get_codec
+
+FORMATS = ["json", "orjson", "msgpack", "cbor", "yaml"]
+
+PAYLOADS = {
+    "mqtt": {
+        "device": "awair-element-12345",
+        "score": 87,
+        "temp": 21.45,
+        "humid": 48.2,
+        "co2": 612,
+        "voc": 180,
+        "pm25": 3,
+    },
+    "postgres": {
+        "name": "hub.speedtest.client",
+        "value": {
+            "ip": "173.211.12.32",
+            "lat": "37.751",
+            "lon": "-97.822",
+            "isp": "Colocation America Corporation",
+            "isprating": "3.7",
+            "rating": "0",
+            "country": "US",
+            "download": 16568200.018792046,
+            "upload": 5449607.159468643,
+            "servers": [{"id": i, "latency": 12.5 + i} for i in range(10)],
+        },
+    },
+}
+
+
+def main(number: int = 10000) -> None:
+    """
+    Run the benchmark.
+    """
+    print(
+        f"{'payload':<10} {'format':<8} {'size':>6} {'encode/s':>12} {'decode/s':>12}"
+    )
+    for payload_name, value in PAYLOADS.items():
+        for format_ in FORMATS:
+            try:
+                codec = get_codec(format_)
+            except InvalidConfigurationException:
+                print(f"{payload_name:<10} {format_:<8} (not installed)")
+                continue
+
+            payload = codec.encode(value)
+            runs = number // 10 if format_ == "yaml" else number
+            encode = timeit.timeit(partial(codec.encode, value), number=runs)
+            decode = timeit.timeit(partial(codec.decode, payload), number=runs)
+            print(
+                f"{payload_name:<10} {format_:<8} {len(payload):>6} "
+                f"{runs / encode:>12,.0f} {runs / decode:>12,.0f}",
+            )
+
+
+if __name__ == "__main__":
+    main()
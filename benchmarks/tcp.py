@@ -0,0 +1,89 @@
+"""
+Benchmark the TCP source with many concurrent connections.
+
+Opens thousands of connections to the source, each sending GPS reports from
+the Micron Bolt Mini 2 tracker and waiting for the acknowledgements, and
+measures how many reports are turned into events. Run with:
+
+    $ python benchmarks/tcp.py
+
+"""
+
+import asyncio
+import resource
+import time
+from typing import Tuple
+
+from senor_octopus.sources.tcp import tcp
+
+GPS_REPORT = (
+    b"+RESP:GTFRI,423136,352009117419957,,0,0,1,1.0,0.0,62,"
+    b"28.3,-122.990623,38.313342,20230414193420,310,260,38F2,"
+    b"2D01A05,00,77,20230414193424,0297$"
+)
+REPLY = b"+SACK:0297$\r\n"
+
+CONFIGURATIONS = [(100, 100), (1000, 10), (4000, 5)]
+
+
+async def device(port: int, reports: int) -> None:
+    """
+    Send reports over a connection, waiting for each acknowledgement.
+    """
+    reader, writer = await asyncio.open_connection("localhost", port)
+    for _ in range(reports):
+        writer.write(GPS_REPORT)
+        await reader.readexactly(len(REPLY))
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(port: int, connections: int, reports: int) -> Tuple[float, int]:
+    """
+    Run the devices against the source, returning the duration and events.
+    """
+    received = 0
+
+    async def consume() -> None:
+        nonlocal received
+        stream = tcp(
+            "micron_bolt_mini_2",
+            port=port,
+            framing="delimiter",
+            delimiter="$",
+            backlog=connections,
+        )
+        async for _ in stream:
+            received += 1
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.5)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[device(port, reports) for _ in range(connections)])
+    # wait for the queue to be drained
+    while received < connections * reports:
+        await asyncio.sleep(0.01)
+    duration = time.perf_counter() - start
+
+    task.cancel()
+    await task
+    return duration, received
+
+
+def main(port: int = 5050) -> None:
+    """
+    Run the benchmark.
+    """
+    # each connection uses 2 file descriptors, one for each side
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    print(f"{'connections':>12} {'reports':>8} {'reports/s':>12}")
+    for connections, reports in CONFIGURATIONS:
+        duration, received = asyncio.run(run(port, connections, reports))
+        print(f"{connections:>12,} {reports:>8} {received / duration:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
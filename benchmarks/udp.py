@@ -0,0 +1,102 @@
+"""
+Benchmark the UDP source with a local load generator.
+
+Load generator processes send GPS reports from the Micron Bolt Mini 2
+tracker as fast as they can, while the source decodes them, replying to
+each one. Datagrams that are not turned into events, either because the
+kernel buffer or the queue was full, are counted as dropped. Run with:
+
+    $ python benchmarks/udp.py
+
+"""
+
+import asyncio
+import multiprocessing
+import socket
+import time
+from typing import Any, Dict, Tuple
+
+from senor_octopus.sources.udp.main import udp
+
+GPS_REPORT = (
+    b"+RESP:GTFRI,423136,352009117419957,,0,0,1,1.0,0.0,62,"
+    b"28.3,-122.990623,38.313342,20230414193420,310,260,38F2,"
+    b"2D01A05,00,77,20230414193424,0297$"
+)
+
+CONFIGURATIONS: Dict[str, Dict[str, Any]] = {
+    "event loop": {},
+    "2 workers": {"workers": 2},
+    "4 workers": {"workers": 4},
+}
+
+
+def generate(port: int, duration: float, sent: Any) -> None:
+    """
+    Send datagrams for a given duration, counting them.
+    """
+    count = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        # use different source ports, so that datagrams are balanced
+        sock.bind(("localhost", 0))
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            for _ in range(100):
+                sock.sendto(GPS_REPORT, ("localhost", port))
+            count += 100
+    with sent.get_lock():
+        sent.value += count
+
+
+async def run(
+    port: int,
+    generators: int,
+    duration: float,
+    **kwargs: Any,
+) -> Tuple[int, int]:
+    """
+    Run the source while the load generators are running.
+    """
+    received = 0
+
+    async def consume() -> None:
+        nonlocal received
+        async for _ in udp("micron_bolt_mini_2", port=port, **kwargs):
+            received += 1
+
+    task = asyncio.create_task(consume())
+    # wait for the workers to start
+    await asyncio.sleep(2)
+
+    sent = multiprocessing.Value("q", 0)
+    processes = [
+        multiprocessing.Process(target=generate, args=(port, duration, sent))
+        for _ in range(generators)
+    ]
+    for process in processes:
+        process.start()
+    await asyncio.sleep(duration + 1)
+    for process in processes:
+        process.join()
+
+    task.cancel()
+    await task
+    return sent.value, received
+
+
+def main(port: int = 5050, generators: int = 2, duration: float = 5) -> None:
+    """
+    Run the benchmark.
+    """
+    print(f"{'configuration':<16} {'sent/s':>12} {'received/s':>12} {'dropped':>8}")
+    for name, kwargs in CONFIGURATIONS.items():
+        sent, received = asyncio.run(run(port, generators, duration, **kwargs))
+        dropped = 1 - received / sent if sent else 0
+        print(
+            f"{name:<16} {sent / duration:>12,.0f} {received / duration:>12,.0f} "
+            f"{dropped:>8.1%}",
+        )
+
+
+if __name__ == "__main__":
+    main()
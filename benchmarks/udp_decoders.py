@@ -0,0 +1,148 @@
+"""
+Benchmark the declarative UDP decoders.
+
+Compares the compiled layout of the Micron Bolt Mini 2 protocol with parsing
+the same reports by decoding them to strings and splitting them, and
+measures the full protocol, including the replies. Run with:
+
+    $ python benchmarks/udp_decoders.py
+
+"""
+
+import asyncio
+import re
+import timeit
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Tuple
+
+from senor_octopus.sources.udp.protocols.micron_bolt_mini_2 import (
+    LAYOUT,
+    MicronBoltMini2UDPProtocol,
+)
+
+GPS_REPORT = (
+    b"+RESP:GTFRI,423136,352009117419957,,0,0,1,1.0,0.0,62,"
+    b"28.3,-122.990623,38.313342,20230414193420,310,260,38F2,"
+    b"2D01A05,00,77,20230414193424,0297$"
+)
+WIFI_REPORT = (
+    b"+RESP:GTWIF,423136,352009117419957,,4,b0e4d556fbc6,-58"
+    b",,,,a4d79504102d,-73,,,,322f23291e0b,-78,,,,"
+    b"44a56edcdae8,-88,,,,,,,,77,20230414193408,0295$"
+)
+
+NUMBER = 100_000
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """
+    Parse a timestamp with ``strptime``.
+    """
+    return datetime.strptime(timestamp, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+
+
+def parse_strings(data: bytes) -> Dict[str, Any]:
+    """
+    Parse a report by decoding it and splitting the string.
+    """
+    parts = data.decode().strip().split(",")
+    value: Dict[str, Any] = {"count": parts[-1].rstrip("$")}
+    if parts[0] in {"+RESP:GTFRI", "+BUFF:GTFRI"}:
+        value.update(
+            {
+                "id": parts[2],
+                "accuracy": float(parts[7]),
+                "speed": float(parts[8]),
+                "azimuth": float(parts[9]),
+                "altitude": float(parts[10]),
+                "longitude": float(parts[11]),
+                "latitude": float(parts[12]),
+                "fix_time": parse_timestamp(parts[13]),
+                "battery": float(parts[-3]),
+                "send_time": parse_timestamp(parts[-2]),
+            },
+        )
+    elif parts[0] in {"+RESP:GTWIF", "+BUFF:GTWIF"}:
+        tokens = parts[5:-7]
+        access_points = []
+        while tokens:
+            mac_address, signal_strength = tokens[:2]
+            tokens = tokens[5:]
+            access_points.append(
+                {
+                    "macAddress": re.sub(r"(..)", r"\1:", mac_address),
+                    "signalStrength": int(signal_strength),
+                },
+            )
+        value.update(
+            {
+                "id": parts[2],
+                "access_points": access_points,
+                "battery": float(parts[-3]),
+                "send_time": parse_timestamp(parts[-2]),
+            },
+        )
+    return value
+
+
+class NullTransport:  # pylint: disable=too-few-public-methods
+    """
+    A transport that discards replies.
+    """
+
+    def sendto(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """
+        Discard a reply.
+        """
+
+
+class NullQueue:  # pylint: disable=too-few-public-methods
+    """
+    A queue that discards messages.
+    """
+
+    def put_nowait(self, value: Any) -> None:
+        """
+        Discard a message.
+        """
+
+
+def measure(function: Callable[[], Any]) -> float:
+    """
+    Return the number of calls per second.
+    """
+    return NUMBER / min(timeit.repeat(function, number=NUMBER, repeat=3))
+
+
+async def measure_protocol(data: bytes) -> float:
+    """
+    Measure the full protocol, without geolocation.
+    """
+    protocol = MicronBoltMini2UDPProtocol(NullQueue())  # type: ignore
+    protocol.connection_made(NullTransport())  # type: ignore
+    addr = ("localhost", 5000)
+    return measure(lambda: protocol.datagram_received(data, addr))
+
+
+def main() -> None:
+    """
+    Run the benchmark.
+    """
+    print(f"{'parser':<24} {'GPS/s':>12} {'WiFi/s':>12}")
+    parsers: Dict[str, Callable[[bytes], Any]] = {
+        "strings": parse_strings,
+        "layout": LAYOUT.decode,
+        "layout (memoryview)": lambda data: LAYOUT.decode(memoryview(data)),
+    }
+    for name, parse in parsers.items():
+        gps = measure(lambda parse=parse: parse(GPS_REPORT))  # type: ignore
+        wifi = measure(lambda parse=parse: parse(WIFI_REPORT))  # type: ignore
+        print(f"{name:<24} {gps:>12,.0f} {wifi:>12,.0f}")
+
+    gps = asyncio.run(measure_protocol(GPS_REPORT))
+    wifi = asyncio.run(measure_protocol(WIFI_REPORT))
+    print(f"{'protocol':<24} {gps:>12,.0f} {wifi:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ import yaml
 
 from senor_octopus import __version__
 from senor_octopus.graph import build_dag
-from senor_octopus.lib import render_dag
+from senor_octopus.lib import close_state_stores, render_dag, run_shutdown_callbacks
 from senor_octopus.scheduler import Scheduler
 
 __author__ = "Beto Dealmeida"
@@ -104,6 +104,9 @@ async def main(args):
         except asyncio.CancelledError:
             _logger.info("Canceled")
             scheduler.cancel()
+        finally:
+            close_state_stores()
+            await run_shutdown_callbacks()
 
     _logger.info("Done")
 
@@ -13,3 +13,9 @@ class InvalidConfigurationException(SenorOctopusException):
     """
     Raised when the configuration YAML is invalid.
     """
+
+
+class FramingException(SenorOctopusException):
+    """
+    Raised when a stream can't be split into messages.
+    """
@@ -0,0 +1,206 @@
+"""
+A filter that detects anomalous readings.
+"""
+
+import logging
+import math
+from typing import Any, List, Optional, Tuple
+
+from durations import Duration
+from marshmallow import Schema, fields, validate
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import MemoryStateStore, StateStore, configuration_schema
+from senor_octopus.types import Stream
+
+_logger = logging.getLogger(__name__)
+
+
+class Baseline:
+    """
+    An exponentially weighted mean and variance.
+
+    Both are updated in O(1) time and memory for each reading, using the
+    incremental formulas from "Incremental calculation of weighted mean and
+    variance" (Finch, 2009).
+    """
+
+    __slots__ = ("count", "mean", "variance")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def __getstate__(self) -> Tuple[int, float, float]:
+        return self.count, self.mean, self.variance
+
+    def __setstate__(self, state: Tuple[int, float, float]) -> None:
+        self.count, self.mean, self.variance = state
+
+    def score(self, value: float) -> float:
+        """
+        How many standard deviations a value is from the mean.
+        """
+        stddev = math.sqrt(self.variance)
+        return (value - self.mean) / stddev if stddev > 0 else 0.0
+
+    def update(self, value: float, alpha: float) -> None:
+        """
+        Add a reading to the baseline.
+        """
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            return
+
+        delta = value - self.mean
+        increment = alpha * delta
+        self.mean += increment
+        self.variance = (1 - alpha) * (self.variance + delta * increment)
+
+
+class SeasonalBaseline:
+    """
+    A baseline for each slot of a season, eg, for each hour of the day.
+    """
+
+    __slots__ = ("slots",)
+
+    def __init__(self, size: int):
+        self.slots = [Baseline() for _ in range(size)]
+
+    def __getstate__(self) -> List[Baseline]:
+        return self.slots
+
+    def __setstate__(self, state: List[Baseline]) -> None:
+        self.slots = state
+
+    def get(self, timestamp: float, season: Optional[float]) -> Baseline:
+        """
+        Return the baseline for a given time.
+        """
+        if season is None:
+            return self.slots[0]
+        position = (timestamp % season) / season
+        return self.slots[int(position * len(self.slots))]
+
+
+class AnomalyConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A filter that detects anomalous readings.
+
+    An exponentially weighted moving average (EWMA) of the mean and the
+    variance is kept for each event name, and readings that are more than
+    ``threshold`` standard deviations from the mean are emitted as
+    anomalies. For example, to detect unusual CO2 levels, using a separate
+    baseline for each hour of the day:
+
+        threshold: 3
+        alpha: 0.05
+        seasonality: 1 day
+        slots: 24
+
+    The ``alpha`` controls how fast the baseline adapts: higher values give
+    more weight to recent readings. No anomalies are emitted for a baseline
+    until it has seen ``warmup`` readings.
+
+    The emitted events have ``.anomaly`` appended to the original name, and
+    a dictionary value with the reading, its ``score`` (the number of
+    standard deviations from the mean, which can be negative), the ``mean``
+    and the ``stddev``. Non-numeric readings are dropped. The baselines are
+    kept between runs, and can be persisted across restarts by setting
+    ``state`` to the path of an SQLite database.
+    """
+
+    threshold = fields.Float(
+        required=False,
+        default=3.0,
+        validate=validate.Range(min=0, min_inclusive=False),
+        title="Threshold",
+        description="Readings more than this many standard deviations are anomalies.",
+    )
+    alpha = fields.Float(
+        required=False,
+        default=0.1,
+        validate=validate.Range(min=0, max=1, min_inclusive=False),
+        title="Smoothing factor",
+        description="The weight of each new reading in the baseline.",
+    )
+    warmup = fields.Integer(
+        required=False,
+        default=30,
+        validate=validate.Range(min=0),
+        title="Warm-up",
+        description="The number of readings before anomalies are emitted.",
+    )
+    seasonality = fields.String(
+        required=False,
+        default=None,
+        title="Seasonality",
+        description='The period of the seasonal baseline, eg, "1 day".',
+    )
+    slots = fields.Integer(
+        required=False,
+        default=24,
+        validate=validate.Range(min=1),
+        title="Seasonal slots",
+        description="The number of baselines in each season.",
+    )
+
+
+@configuration_schema(AnomalyConfig())
+async def anomaly(  # pylint: disable=too-many-arguments, too-many-locals
+    stream: Stream,
+    threshold: float = 3.0,
+    alpha: float = 0.1,
+    warmup: int = 30,
+    seasonality: Optional[str] = None,
+    slots: int = 24,
+    state: Optional[StateStore] = None,
+) -> Stream:
+    """
+    Detect anomalous readings.
+    """
+    season = Duration(seasonality).to_seconds() if seasonality else None
+    if season is not None and season <= 0:
+        raise InvalidConfigurationException("Invalid `seasonality` for anomaly")
+    size = slots if season is not None else 1
+
+    _logger.debug("Detecting anomalies")
+    baselines = state if state is not None else MemoryStateStore()
+
+    async for event in stream:  # pragma: no cover
+        value: Any = event["value"]
+        if (
+            not isinstance(value, (int, float))
+            or isinstance(value, bool)
+            or not math.isfinite(value)
+        ):
+            _logger.debug("Dropping non-numeric event: %s", event)
+            continue
+
+        name = event["name"]
+        series = baselines.get(name)
+        if series is None:
+            series = SeasonalBaseline(size)
+
+        baseline = series.get(event["timestamp"].timestamp(), season)
+        score = baseline.score(value)
+        stddev = math.sqrt(baseline.variance)
+        mean = baseline.mean
+        warm = baseline.count >= warmup
+        baseline.update(value, alpha)
+        baselines.set(name, series)
+
+        if warm and abs(score) > threshold:
+            yield {
+                "timestamp": event["timestamp"],
+                "name": f"{name}.anomaly",
+                "value": {
+                    "value": value,
+                    "score": score,
+                    "mean": mean,
+                    "stddev": stddev,
+                },
+            }
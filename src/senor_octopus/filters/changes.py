@@ -0,0 +1,136 @@
+"""
+A filter that only emits events when their values change.
+"""
+
+import logging
+import math
+from typing import Any, Optional
+
+from durations import Duration
+from marshmallow import Schema, fields, validate
+
+from senor_octopus.lib import MemoryStateStore, StateStore, configuration_schema
+from senor_octopus.types import Stream
+
+_logger = logging.getLogger(__name__)
+
+
+class ChangesConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A filter that only emits events when their values change.
+
+    The last emitted value is kept for each event name, and new events are
+    emitted only when their value is different. Numeric values can have a
+    deadband, so that small variations are ignored; for example, to emit
+    temperature readings only when they change by more than 0.5 degrees or
+    by more than 2%, and at least once every hour:
+
+        deadband: 0.5
+        relative: 0.02
+        heartbeat: 1 hour
+
+    Values are compared with the last emitted value, so that slow drifts are
+    eventually emitted. For dictionaries each key is compared separately, and
+    the event is emitted when any of them changes.
+
+    The last emitted values are kept between runs, and can be persisted
+    across restarts by setting ``state`` to the path of an SQLite database.
+    """
+
+    deadband = fields.Float(
+        required=False,
+        default=None,
+        validate=validate.Range(min=0),
+        title="Absolute deadband",
+        description=(
+            "Emit numeric values only when they change by more than this amount."
+        ),
+    )
+    relative = fields.Float(
+        required=False,
+        default=None,
+        validate=validate.Range(min=0),
+        title="Relative deadband",
+        description=(
+            "Emit numeric values only when they change by more than this "
+            "fraction of the last emitted value, eg, 0.05 for 5%."
+        ),
+    )
+    heartbeat = fields.String(
+        required=False,
+        default=None,
+        title="Maximum silence",
+        description=(
+            "Emit an event even if it hasn't changed when the last event with "
+            'the same name was emitted more than this period ago, eg, "1 hour".'
+        ),
+    )
+
+
+def is_number(value: Any) -> bool:
+    """
+    Return true if the value is a number that can have a deadband.
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def has_changed(
+    old: Any,
+    new: Any,
+    deadband: Optional[float] = None,
+    relative: Optional[float] = None,
+) -> bool:
+    """
+    Check if a value has changed, taking the deadbands into consideration.
+
+    When both deadbands are set a change larger than either of them counts.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        return old.keys() != new.keys() or any(
+            has_changed(old[key], new[key], deadband, relative) for key in new
+        )
+
+    if not (is_number(old) and is_number(new)):
+        return bool(old != new)
+
+    if math.isnan(old) or math.isnan(new):
+        return math.isnan(old) != math.isnan(new)
+
+    delta = abs(new - old)
+    if deadband is None and relative is None:
+        return delta > 0
+    return (deadband is not None and delta > deadband) or (
+        relative is not None and delta > relative * abs(old)
+    )
+
+
+@configuration_schema(ChangesConfig())
+async def changes(
+    stream: Stream,
+    deadband: Optional[float] = None,
+    relative: Optional[float] = None,
+    heartbeat: Optional[str] = None,
+    state: Optional[StateStore] = None,
+) -> Stream:
+    """
+    Emit events only when their values change.
+    """
+    _logger.debug("Filtering unchanged events")
+    max_silence = Duration(heartbeat).to_seconds() if heartbeat else None
+
+    # name => (last emitted value, timestamp of the last emitted value)
+    last = state if state is not None else MemoryStateStore()
+
+    async for event in stream:  # pragma: no cover
+        name = event["name"]
+        previous = last.get(name)
+        if previous is not None:
+            value, timestamp = previous
+            if not has_changed(value, event["value"], deadband, relative) and (
+                max_silence is None
+                or (event["timestamp"] - timestamp).total_seconds() < max_silence
+            ):
+                continue
+
+        last.set(name, (event["value"], event["timestamp"]))
+        yield event
@@ -4,15 +4,19 @@ A filter that combines events in a stream.
 
 # pylint: disable=too-few-public-methods
 
+import asyncio
 import logging
+import math
+from collections import OrderedDict
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, cast
 
-from marshmallow import Schema, fields
+from durations import Duration
+from marshmallow import Schema, fields, validate
 
-from senor_octopus.lib import configuration_schema
-from senor_octopus.types import Stream
+from senor_octopus.lib import StateStore, configuration_schema, heartbeat
+from senor_octopus.types import Event, Stream
 
 _logger = logging.getLogger(__name__)
 
@@ -29,16 +33,40 @@ class AggregationType(Enum):
     MIN = "min"
     MAX = "max"
     COUNT = "count"
+    P50 = "p50"
+    P95 = "p95"
+    P99 = "p99"
+    VARIANCE = "variance"
+    STDDEV = "stddev"
+    EWMA = "ewma"
 
 
 class Aggregation:
     """
     An aggregation.
+
+    Calling the aggregation with a value updates it and returns the current
+    result. Aggregations can also be merged, so that partial aggregates (eg,
+    from different panes of a time window) can be combined; when merging, the
+    other aggregation is assumed to have seen values after this one.
     """
 
     def __call__(self, value: Any) -> Any:
         raise NotImplementedError
 
+    def merge(self, other: "Aggregation") -> None:
+        """
+        Merge the state of another aggregation of the same type.
+        """
+        raise NotImplementedError
+
+    @property
+    def result(self) -> Any:
+        """
+        The current result of the aggregation.
+        """
+        raise NotImplementedError
+
 
 class AverageAggregation(Aggregation):
     """
@@ -60,6 +88,15 @@ class AverageAggregation(Aggregation):
         self.count += 1
         return self.sum / self.count
 
+    def merge(self, other: Aggregation) -> None:
+        other = cast(AverageAggregation, other)
+        self.sum += other.sum
+        self.count += other.count
+
+    @property
+    def result(self) -> float:
+        return self.sum / self.count if self.count else float("nan")
+
 
 class SumAggregation(Aggregation):
     """
@@ -73,15 +110,35 @@ class SumAggregation(Aggregation):
         self.sum += value
         return self.sum
 
+    def merge(self, other: Aggregation) -> None:
+        self.sum += cast(SumAggregation, other).sum
+
+    @property
+    def result(self) -> float:
+        return self.sum
+
 
 class LastAggregation(Aggregation):
     """
     Returns the last value seen.
     """
 
+    def __init__(self):
+        self.last = None
+
     def __call__(self, value: Any) -> Any:
+        self.last = value
         return value
 
+    def merge(self, other: Aggregation) -> None:
+        other = cast(LastAggregation, other)
+        if other.last is not None:
+            self.last = other.last
+
+    @property
+    def result(self) -> Any:
+        return self.last
+
 
 class FirstAggregation(Aggregation):
     """
@@ -96,6 +153,14 @@ class FirstAggregation(Aggregation):
             self.first = value
         return self.first
 
+    def merge(self, other: Aggregation) -> None:
+        if self.first is None:
+            self.first = cast(FirstAggregation, other).first
+
+    @property
+    def result(self) -> Any:
+        return self.first
+
 
 class MinAggregation(Aggregation):
     """
@@ -112,6 +177,15 @@ class MinAggregation(Aggregation):
             self.min = min(self.min, value)
         return self.min
 
+    def merge(self, other: Aggregation) -> None:
+        other = cast(MinAggregation, other)
+        if other.min is not None:
+            self(other.min)
+
+    @property
+    def result(self) -> Any:
+        return self.min
+
 
 class MaxAggregation(Aggregation):
     """
@@ -128,6 +202,15 @@ class MaxAggregation(Aggregation):
             self.max = max(self.max, value)
         return self.max
 
+    def merge(self, other: Aggregation) -> None:
+        other = cast(MaxAggregation, other)
+        if other.max is not None:
+            self(other.max)
+
+    @property
+    def result(self) -> Any:
+        return self.max
+
 
 class CountAggregation(Aggregation):
     """
@@ -141,6 +224,251 @@ class CountAggregation(Aggregation):
         self.count += 1
         return self.count
 
+    def merge(self, other: Aggregation) -> None:
+        self.count += cast(CountAggregation, other).count
+
+    @property
+    def result(self) -> int:
+        return self.count
+
+
+def to_float(value: Any) -> Optional[float]:
+    """
+    Convert a value to a float, logging a warning if it's not possible.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        _logger.warning("Could not convert %s to float", value)
+        return None
+
+
+class DDSketch:
+    """
+    A mergeable sketch for estimating quantiles.
+
+    Values are counted in logarithmic buckets, so that any quantile can be
+    estimated with a bounded relative error (1% by default) using constant
+    memory. When there are more than ``max_buckets`` buckets the lowest ones
+    are collapsed, reducing the accuracy only for the lowest quantiles.
+
+    See https://arxiv.org/abs/1908.10693.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _value(self, index: int) -> float:
+        return 2 * self.gamma**index / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        """
+        Add a value to the sketch.
+        """
+        if value > 0:
+            index = self._index(value)
+            self.positive[index] = self.positive.get(index, 0) + count
+        elif value < 0:
+            index = self._index(-value)
+            self.negative[index] = self.negative.get(index, 0) + count
+        else:
+            self.zero += count
+        self.count += count
+        self._collapse()
+
+    def merge(self, other: "DDSketch") -> None:
+        """
+        Merge another sketch, with the same accuracy, into this one.
+        """
+        for index, count in other.positive.items():
+            self.positive[index] = self.positive.get(index, 0) + count
+        for index, count in other.negative.items():
+            self.negative[index] = self.negative.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        self._collapse()
+
+    def _collapse(self) -> None:
+        # collapse the lowest positive buckets into one
+        excess = len(self.positive) - self.max_buckets
+        if excess > 0:
+            indexes = sorted(self.positive)[: excess + 1]
+            self.positive[indexes[-1]] += sum(
+                self.positive.pop(index) for index in indexes[:-1]
+            )
+
+    def quantile(self, quantile: float) -> float:
+        """
+        Estimate a given quantile, between 0 and 1.
+        """
+        if self.count == 0:
+            return float("nan")
+
+        rank = quantile * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.positive))  # pragma: no cover
+
+
+class QuantileAggregation(Aggregation):
+    """
+    Estimates a quantile of the values, using a DDSketch.
+    """
+
+    quantile = 0.5
+
+    def __init__(self):
+        self.sketch = DDSketch()
+
+    def __call__(self, value: Any) -> float:
+        number = to_float(value)
+        if number is None:
+            return float("nan")
+        self.sketch.add(number)
+        return self.result
+
+    def merge(self, other: Aggregation) -> None:
+        self.sketch.merge(cast(QuantileAggregation, other).sketch)
+
+    @property
+    def result(self) -> float:
+        return self.sketch.quantile(self.quantile)
+
+
+class P50Aggregation(QuantileAggregation):
+    """
+    Estimates the median.
+    """
+
+    quantile = 0.50
+
+
+class P95Aggregation(QuantileAggregation):
+    """
+    Estimates the 95th percentile.
+    """
+
+    quantile = 0.95
+
+
+class P99Aggregation(QuantileAggregation):
+    """
+    Estimates the 99th percentile.
+    """
+
+    quantile = 0.99
+
+
+class VarianceAggregation(Aggregation):
+    """
+    Computes the sample variance, using Welford's algorithm.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # pylint: disable=invalid-name
+
+    def __call__(self, value: Any) -> float:
+        number = to_float(value)
+        if number is None:
+            return float("nan")
+
+        self.count += 1
+        delta = number - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (number - self.mean)
+        return self.result
+
+    def merge(self, other: Aggregation) -> None:
+        other = cast(VarianceAggregation, other)
+        count = self.count + other.count
+        if count == 0:
+            return
+
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def result(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+
+class StddevAggregation(VarianceAggregation):
+    """
+    Computes the sample standard deviation.
+    """
+
+    @property
+    def result(self) -> float:
+        return math.sqrt(super().result)
+
+
+class EWMAAggregation(Aggregation):
+    """
+    Computes an exponentially weighted moving average.
+
+    Each new value has a weight of ``alpha``; the average is initialized with
+    the first value.
+    """
+
+    alpha = 0.1
+
+    def __init__(self):
+        self.count = 0
+        self.mean = float("nan")
+        self.first = float("nan")
+
+    def __call__(self, value: Any) -> float:
+        number = to_float(value)
+        if number is None:
+            return float("nan")
+
+        if self.count == 0:
+            self.mean = self.first = number
+        else:
+            self.mean += self.alpha * (number - self.mean)
+        self.count += 1
+        return self.mean
+
+    def merge(self, other: Aggregation) -> None:
+        other = cast(EWMAAggregation, other)
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.mean, self.first = other.mean, other.first
+        else:
+            # exact: as if the other values had been seen after ours
+            decay = (1 - self.alpha) ** other.count
+            self.mean = decay * (self.mean - other.first) + other.mean
+        self.count += other.count
+
+    @property
+    def result(self) -> float:
+        return self.mean
+
 
 aggregation_map = {
     AggregationType.AVERAGE: AverageAggregation,
@@ -150,9 +478,51 @@ aggregation_map = {
     AggregationType.MIN: MinAggregation,
     AggregationType.MAX: MaxAggregation,
     AggregationType.COUNT: CountAggregation,
+    AggregationType.P50: P50Aggregation,
+    AggregationType.P95: P95Aggregation,
+    AggregationType.P99: P99Aggregation,
+    AggregationType.VARIANCE: VarianceAggregation,
+    AggregationType.STDDEV: StddevAggregation,
+    AggregationType.EWMA: EWMAAggregation,
 }
 
 
+def update(aggregation: Aggregation, value: Any) -> Any:
+    """
+    Update an aggregation with a value, returning the current result.
+
+    If the value is itself an aggregation (eg, a partial aggregate emitted by
+    another node) it's merged instead.
+    """
+    if isinstance(value, Aggregation):
+        aggregation.merge(value)
+        return aggregation.result
+    return aggregation(value)
+
+
+class Group:
+    """
+    The aggregated state for a given key.
+    """
+
+    def __init__(self, aggregate: Dict[str, AggregationType], now: float):
+        self.aggregators = {
+            column: aggregation_map[aggregation]()
+            for column, aggregation in aggregate.items()
+        }
+        self.value: Dict[str, Any] = {}
+        self.first_seen = now
+        self.last_seen = now
+
+    def update(self, value: Dict[str, Any]) -> None:
+        """
+        Aggregate the columns of a new event value.
+        """
+        for column in value:
+            if column in self.aggregators:
+                self.value[column] = update(self.aggregators[column], value[column])
+
+
 class CombineConfig(Schema):  # pylint: disable=too-few-public-methods
     """
     A filter that combines events in a stream.
@@ -168,17 +538,35 @@ class CombineConfig(Schema):  # pylint: disable=too-few-public-methods
         Before:
 
             {"key": "a", "battery": 100},
+            {"key": "b", "battery": 14},
             {"key": "a", "location": "home"},
             {"key": "a", "battery": 93, "location": "work"},
-            {"key": "b", "battery": 14},
 
         After:
 
             {"key": "a", "battery": 96.5, "location": "work"},
+            {"key": "b", "battery": 14},
 
-    Note that key "b" is not emitted until an event with a different key is received.
-
-    Possible aggregations are: average, sum, last, first, min, max, count.
+    By default a group is emitted every time the key changes. With a higher
+    ``max_keys`` events are grouped by key even when interleaved, and each key
+    has its own aggregators. A group is then emitted when it's evicted because
+    there are more than ``max_keys`` groups (the least recently updated group
+    is evicted), when no events are received for it during ``timeout``, when
+    ``max_age`` has passed since its first event, or when the stream ends.
+    Keys that are updated continuously are only emitted on eviction or after
+    ``max_age``.
+
+    Possible aggregations are: average, sum, last, first, min, max, count, p50,
+    p95, p99 (estimated with a DDSketch), variance, stddev and ewma.
+
+    With ``partial: true`` the filter emits the state of the aggregations
+    instead of their results. When a combine node receives partial aggregates
+    they are merged, so that the aggregation can be split across nodes (eg,
+    one per parent) and combined downstream.
+
+    Groups that haven't been emitted can be persisted across restarts by
+    setting ``state`` to the path of an SQLite database. After a restart a
+    group is restored when its key is seen again.
     """
 
     key = fields.String(
@@ -192,7 +580,7 @@ class CombineConfig(Schema):  # pylint: disable=too-few-public-methods
     )
     aggregate = fields.Dict(
         keys=fields.String(),
-        values=fields.Enum(AggregationType),
+        values=fields.Enum(AggregationType, by_value=True),
         required=True,
         default=None,
         title="Columns and their aggregation",
@@ -201,52 +589,127 @@ class CombineConfig(Schema):  # pylint: disable=too-few-public-methods
             "aggregation that should be used."
         ),
     )
+    prefix = fields.String(
+        required=False,
+        default="hub.combine",
+        title="The prefix for events from this filter",
+        description="The prefix for events from this filter.",
+    )
+    max_keys = fields.Integer(
+        required=False,
+        default=1,
+        validate=validate.Range(min=1),
+        title="Maximum number of keys",
+        description=(
+            "The maximum number of groups kept in memory. When a new key arrives "
+            "and the limit has been reached the least recently updated group is "
+            "emitted."
+        ),
+    )
+    timeout = fields.String(
+        required=False,
+        default=None,
+        title="Idle timeout",
+        description=(
+            "Emit a group when no events are received for its key during this "
+            'period, eg, "5 minutes".'
+        ),
+    )
+    max_age = fields.String(
+        required=False,
+        default=None,
+        title="Maximum age",
+        description=(
+            "Emit a group when this period has passed since its first event, "
+            'even if its key is still active, eg, "1 hour".'
+        ),
+    )
+    partial = fields.Boolean(
+        required=False,
+        default=False,
+        title="Emit partial aggregates",
+        description=(
+            "Emit the state of the aggregations, so they can be merged by a "
+            "downstream combine node."
+        ),
+    )
+
+
+def oldest(groups: "OrderedDict[Any, Group]") -> Any:
+    """
+    Return the key at the start of an ordered dictionary of groups.
+    """
+    return next(iter(groups))
 
 
 @configuration_schema(CombineConfig())
-async def combine(
+async def combine(  # pylint: disable=too-many-arguments, too-many-locals
     stream: Stream,
     key: str,
     aggregate: Dict[str, AggregationType],
     prefix: str = "hub.combine",
+    max_keys: int = 1,
+    timeout: Optional[str] = None,
+    max_age: Optional[str] = None,
+    partial: bool = False,
+    state: Optional[StateStore] = None,
 ) -> Stream:
     """
     Combine events.
     """
-    aggregators = {
-        column: aggregation_map[aggregation]()
-        for column, aggregation in aggregate.items()
-    }
-    current_key: Optional[str] = None
-    value = {}
-    async for event in stream:  # pragma: no cover
-        # first event
-        if current_key is None:
-            current_key = event["value"][key]
-            value = {
-                column: aggregators[column](event["value"][column])
-                for column in event["value"]
-                if column in aggregators
-            }
-            continue
-
-        # new event, same key
-        if event["value"][key] == current_key:
-            for column in event["value"]:
-                if column in aggregators:
-                    value[column] = aggregators[column](event["value"][column])
-            continue
-
-        # new key
-        value[key] = current_key
-        yield {
+    loop = asyncio.get_running_loop()
+    idle = Duration(timeout).to_seconds() if timeout else None
+    age = Duration(max_age).to_seconds() if max_age else None
+    interval = min((value for value in (idle, age) if value), default=None)
+
+    # groups sorted by last update, and by first event
+    groups: "OrderedDict[Any, Group]" = OrderedDict()
+    created: "OrderedDict[Any, Group]" = OrderedDict()
+
+    def emit(group_key: Any) -> Event:
+        group = groups.pop(group_key)
+        del created[group_key]
+        if state is not None:
+            state.delete(group_key)
+        if partial:
+            value = {column: group.aggregators[column] for column in group.value}
+        else:
+            value = group.value
+        value[key] = group_key
+        return {
             "timestamp": datetime.now(timezone.utc),
             "name": f"{prefix}.{key}",
             "value": value,
         }
-        current_key = event["value"][key]
-        value = {
-            column: aggregators[column](event["value"][column])
-            for column in event["value"]
-            if column in aggregators
-        }
+
+    async for event in heartbeat(stream, interval):  # pragma: no cover
+        now = loop.time()
+
+        if event is not None:
+            group_key = event["value"][key]
+            group = groups.get(group_key)
+            if group is None:
+                group = state.get(group_key) if state is not None else None
+                if group is None:
+                    group = Group(aggregate, now)
+                group.first_seen = group.last_seen = now
+                groups[group_key] = created[group_key] = group
+                if len(groups) > max_keys:
+                    yield emit(oldest(groups))
+            else:
+                group.last_seen = now
+                groups.move_to_end(group_key)
+            group.update(event["value"])
+            if state is not None:
+                state.set(group_key, group)
+
+        # idle and old groups are at the start of each ordering
+        if idle is not None:
+            while groups and now - groups[oldest(groups)].last_seen >= idle:
+                yield emit(oldest(groups))
+        if age is not None:
+            while created and now - created[oldest(created)].first_seen >= age:
+                yield emit(oldest(created))
+
+    while groups:
+        yield emit(oldest(groups))
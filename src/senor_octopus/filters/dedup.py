@@ -0,0 +1,348 @@
+"""
+A filter that drops duplicate events.
+"""
+
+# pylint: disable=too-few-public-methods
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, List, Optional
+
+from durations import Duration
+from marshmallow import Schema, fields, validate
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import configuration_schema
+from senor_octopus.types import Event, Stream
+
+_logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 16
+EVENT_FIELDS = {"name", "timestamp", "value"}
+DEFAULT_KEYS = ["name", "timestamp", "value"]
+
+
+class DedupMode(Enum):
+    """
+    Different ways of tracking seen events.
+    """
+
+    EXACT = "exact"
+    BLOOM = "bloom"
+
+
+def encode_field(value: Any) -> bytes:
+    """
+    Encode a field value into bytes, in a stable way.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    if isinstance(value, str):
+        return value.encode()
+    return json.dumps(value, sort_keys=True, default=str).encode()
+
+
+def get_field(event: Event, field: str) -> Any:
+    """
+    Read a field from an event.
+
+    Besides ``name``, ``timestamp`` and ``value``, keys from dictionary values
+    can be read with ``value.<key>``; nested keys are separated by periods.
+    """
+    if field in EVENT_FIELDS:
+        return event[field]  # type: ignore
+
+    value = event["value"]
+    for part in field.split(".")[1:]:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def fingerprint(event: Event, keys: List[str]) -> bytes:
+    """
+    Compute a fixed-size digest identifying an event.
+
+    Only the digest is stored, so that memory usage doesn't depend on the size
+    of the events.
+    """
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for key in keys:
+        data = encode_field(get_field(event, key))
+        # prefix each field with its length, so fields can't run into each other
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.digest()
+
+
+class SeenSet:
+    """
+    A set of recently seen events.
+    """
+
+    def check(self, digest: bytes, now: float) -> bool:
+        """
+        Return true if the digest was seen before, and add it to the set.
+        """
+        raise NotImplementedError
+
+    @property
+    def memory(self) -> int:
+        """
+        An estimate of the memory used, in bytes.
+        """
+        raise NotImplementedError
+
+
+class LRUSet(SeenSet):
+    """
+    An exact set of seen events, bounded in size and age.
+
+    Digests are kept in order of last use together with their expiration
+    time, which is refreshed every time they're seen. Since all entries have
+    the same TTL, the oldest entries are at the start, and expired or least
+    recently used entries can be removed in O(1).
+    """
+
+    # approximate size of an ordered dict entry with its key and float value
+    ENTRY_SIZE = 150
+
+    def __init__(self, max_keys: int, ttl: Optional[float]):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.entries: "OrderedDict[bytes, float]" = OrderedDict()
+
+    def check(self, digest: bytes, now: float) -> bool:
+        if self.ttl is not None:
+            while self.entries:
+                oldest, expiration = next(iter(self.entries.items()))
+                if expiration > now:
+                    break
+                del self.entries[oldest]
+
+        found = digest in self.entries
+        self.entries[digest] = now + self.ttl if self.ttl is not None else math.inf
+        if found:
+            self.entries.move_to_end(digest)
+        elif len(self.entries) > self.max_keys:
+            self.entries.popitem(last=False)
+        return found
+
+    @property
+    def memory(self) -> int:
+        return self.max_keys * self.ENTRY_SIZE
+
+
+class BloomFilter:
+    """
+    A Bloom filter over fixed-size digests.
+
+    Bit positions are derived from two halves of the digest using double
+    hashing, so the digest is computed only once per event.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(
+            8,
+            math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2),
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+
+    def positions(self, digest: bytes) -> List[int]:
+        """
+        Compute the bit positions for a digest.
+        """
+        half = len(digest) // 2
+        first = int.from_bytes(digest[:half], "little")
+        second = int.from_bytes(digest[half:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, positions: List[int]) -> bool:
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7)) for position in positions
+        )
+
+    def add(self, positions: List[int]) -> bool:
+        """
+        Set the bits for a digest, returning true if they were all set already.
+        """
+        bits = self.bits
+        found = True
+        for position in positions:
+            index, mask = position >> 3, 1 << (position & 7)
+            if not bits[index] & mask:
+                bits[index] |= mask
+                found = False
+        return found
+
+
+class RotatingBloomFilter(SeenSet):
+    """
+    A probabilistic set of seen events, rotated periodically.
+
+    Two Bloom filters are kept: new events are added to the current one, and
+    events are looked up in both. Every ``period`` seconds the previous filter
+    is discarded and replaced by the current one, so that an event is
+    remembered for between one and two periods. Memory usage is fixed and
+    depends only on ``capacity`` (the number of distinct events per period)
+    and the false positive rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, period: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.period = period
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = BloomFilter(capacity, error_rate)
+        self.rotate_at: Optional[float] = None
+
+    def check(self, digest: bytes, now: float) -> bool:
+        if self.rotate_at is None:
+            self.rotate_at = now + self.period
+        elif now >= self.rotate_at:
+            if now >= self.rotate_at + self.period:
+                # idle for more than a period, everything has expired
+                self.previous = BloomFilter(self.capacity, self.error_rate)
+            else:
+                self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.rotate_at = now + self.period
+
+        positions = self.current.positions(digest)
+        return self.current.add(positions) or positions in self.previous
+
+    @property
+    def memory(self) -> int:
+        return len(self.current.bits) + len(self.previous.bits)
+
+
+class DedupConfig(Schema):
+    """
+    A filter that drops duplicate events.
+
+    Events are identified by a set of keys, by default their name, timestamp
+    and value, so that only exact copies of an event are dropped; readings
+    that repeat a previous value are kept. Keys can be ``name``,
+    ``timestamp``, ``value``, or a key in the event value, eg, ``value.id``.
+    For example, to drop retransmitted reports from a GPS tracker:
+
+        keys:
+          - name
+          - value.serial
+          - value.timestamp
+        ttl: 10 minutes
+
+    In the ``exact`` mode the most recent ``max_keys`` events are remembered
+    for ``ttl``. The ``bloom`` mode uses a pair of rotating Bloom filters
+    that remember events for one to two times ``ttl``, and can track millions
+    of events in a few megabytes, at the cost of dropping a small fraction of
+    unique events (``error_rate``).
+    """
+
+    keys = fields.List(
+        fields.String(),
+        required=False,
+        default=DEFAULT_KEYS,
+        title="Keys identifying an event",
+        description=(
+            "A list with name, timestamp, value, or keys in the event value "
+            "(eg, value.id)."
+        ),
+    )
+    mode = fields.Enum(
+        DedupMode,
+        by_value=True,
+        required=False,
+        default=DedupMode.EXACT,
+        title="Deduplication mode",
+        description="Either exact or bloom.",
+    )
+    ttl = fields.String(
+        required=False,
+        default=None,
+        title="Time to live",
+        description=(
+            'How long events are remembered, eg, "10 minutes". Required for '
+            "the bloom mode."
+        ),
+    )
+    max_keys = fields.Integer(
+        required=False,
+        default=10000,
+        validate=validate.Range(min=1),
+        title="Maximum number of keys",
+        description="The maximum number of events remembered in the exact mode.",
+    )
+    capacity = fields.Integer(
+        required=False,
+        default=1000000,
+        validate=validate.Range(min=1),
+        title="Capacity",
+        description="The expected number of unique events per ttl, in the bloom mode.",
+    )
+    error_rate = fields.Float(
+        required=False,
+        default=0.001,
+        validate=validate.Range(min=0, max=1, min_inclusive=False, max_inclusive=False),
+        title="False positive rate",
+        description="The fraction of unique events dropped in the bloom mode.",
+    )
+
+
+def build_seen_set(  # pylint: disable=too-many-arguments
+    mode: DedupMode,
+    ttl: Optional[str],
+    max_keys: int,
+    capacity: int,
+    error_rate: float,
+) -> SeenSet:
+    """
+    Build the set used to track seen events.
+    """
+    ttl_seconds = Duration(ttl).to_seconds() if ttl else None
+    if ttl_seconds is not None and ttl_seconds <= 0:
+        raise InvalidConfigurationException("Invalid `ttl` for dedup")
+
+    if mode == DedupMode.EXACT:
+        return LRUSet(max_keys, ttl_seconds)
+
+    if ttl_seconds is None:
+        raise InvalidConfigurationException("The bloom mode requires a `ttl`")
+    return RotatingBloomFilter(capacity, error_rate, ttl_seconds)
+
+
+@configuration_schema(DedupConfig())
+async def dedup(  # pylint: disable=too-many-arguments
+    stream: Stream,
+    keys: Optional[List[str]] = None,
+    mode: DedupMode = DedupMode.EXACT,
+    ttl: Optional[str] = None,
+    max_keys: int = 10000,
+    capacity: int = 1000000,
+    error_rate: float = 0.001,
+) -> Stream:
+    """
+    Drop duplicate events.
+    """
+    keys = keys or DEFAULT_KEYS
+    for key in keys:
+        if key not in EVENT_FIELDS and not key.startswith("value."):
+            raise InvalidConfigurationException(f'Invalid key "{key}" for dedup')
+
+    seen = build_seen_set(mode, ttl, max_keys, capacity, error_rate)
+    _logger.debug("Deduplicating events using up to %d bytes", seen.memory)
+
+    loop = asyncio.get_running_loop()
+    async for event in stream:  # pragma: no cover
+        if seen.check(fingerprint(event, keys), loop.time()):
+            _logger.debug("Dropping duplicate event: %s", event)
+            continue
+        yield event
@@ -4,41 +4,252 @@ A filter that deserializes the event value into different formats.
 
 import json
 import logging
+import re
+from functools import partial
+from typing import Any, Callable, Iterator, Optional
 
-import yaml
+from marshmallow import Schema, fields, validate
 
 from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import configuration_schema
+from senor_octopus.serialization import Decoder, Payload, get_codec, msgpack
 from senor_octopus.types import Stream
 
 _logger = logging.getLogger(__name__)
 
+NON_BLANK_LINE = re.compile(r"[^\n]*?\S[^\n]*")
+NON_BLANK_LINE_BYTES = re.compile(rb"[^\n]*?\S[^\n]*")
+WHITESPACE = re.compile(r"\s*")
+
+Record = Callable[[], Any]
+
+
+class DeserializeConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A filter that deserializes the event value into different formats.
+    """
+
+    format = fields.String(
+        required=True,
+        default=None,
+        title="Format of the payload",
+        description='The format of the payload, eg, "JSON" or "YAML".',
+    )
+    split = fields.String(
+        required=False,
+        default=None,
+        validate=validate.OneOf(["lines", "array"]),
+        title="Split payload into multiple events",
+        description=(
+            'Use "lines" for payloads with one record per line (eg, NDJSON), '
+            'or "array" for payloads with an array of records. Each record '
+            "is emitted as a separate event."
+        ),
+    )
+    suffix = fields.String(
+        required=False,
+        default="",
+        title="Suffix for split events",
+        description=(
+            "A suffix added to the name of split events. The record position "
+            "is available as `{index}`, eg, `.{index}`."
+        ),
+    )
+    max_records = fields.Integer(
+        required=False,
+        default=0,
+        title="Maximum number of records",
+        description=(
+            "The maximum number of records emitted from a single payload when "
+            "splitting it. Additional records are dropped. Use 0 for no limit."
+        ),
+    )
+
+
+def iter_lines(payload: Payload) -> Iterator[Payload]:
+    """
+    Iterate over the non-blank lines of a payload.
+
+    Lines from binary payloads are returned as ``memoryview`` slices, so that
+    the payload is not copied.
+    """
+    if isinstance(payload, str):
+        for match in NON_BLANK_LINE.finditer(payload):
+            yield match.group()
+        return
+
+    view = memoryview(payload)
+    for line in NON_BLANK_LINE_BYTES.finditer(view):
+        yield view[line.start() : line.end()]
+
+
+def iter_json_array(payload: Payload) -> Iterator[Record]:
+    """
+    Incrementally parse the elements of a JSON array.
+
+    Binary payloads are decoded into a string directly from the buffer, and
+    each element is parsed only when its record is called, so that the full
+    list is never built in memory.
+    """
+    text = payload if isinstance(payload, str) else str(payload, "utf-8")
+
+    decoder = json.JSONDecoder()
+    index = WHITESPACE.match(text, 0).end()  # type: ignore
+    if text[index : index + 1] != "[":
+        raise ValueError("Payload is not a JSON array")
+    index = WHITESPACE.match(text, index + 1).end()  # type: ignore
+    if text[index : index + 1] == "]":
+        return
+
+    def parse() -> Any:
+        nonlocal index
+        value, index = decoder.raw_decode(text, index)
+        return value
+
+    while True:
+        yield parse
+        index = WHITESPACE.match(text, index).end()  # type: ignore
+        delimiter = text[index : index + 1]
+        if delimiter == "]":
+            return
+        if delimiter != ",":
+            raise ValueError(f"Expecting ',' delimiter at position {index}")
+        index = WHITESPACE.match(text, index + 1).end()  # type: ignore
+
+
+def iter_decoded_array(payload: Payload, decode: Decoder) -> Iterator[Record]:
+    """
+    Decode an array at once with the codec, and iterate over its elements.
+
+    Used with ``orjson``, which reads the buffer directly and is much faster
+    than parsing the elements one at a time, at the cost of decoding all of
+    them upfront.
+    """
+    values = decode(payload)
+    if not isinstance(values, list):
+        raise ValueError("Payload is not a JSON array")
+    for value in values:
+        yield partial(identity, value)
+
+
+def identity(value: Any) -> Any:
+    """
+    Return a value unchanged.
+    """
+    return value
+
+
+def iter_msgpack_array(payload: Payload) -> Iterator[Record]:
+    """
+    Incrementally unpack the elements of a msgpack array.
+    """
+    unpacker = msgpack.Unpacker(timestamp=3)
+    unpacker.feed(payload)
+    for _ in range(unpacker.read_array_header()):
+        yield unpacker.unpack
+
+
+def iter_records(
+    payload: Payload,
+    split: str,
+    format: str,  # pylint: disable=redefined-builtin
+    decode: Decoder,
+) -> Iterator[Record]:
+    """
+    Iterate over the records in a payload.
+
+    Records are functions that return the decoded value, so that a record is
+    only parsed when needed. Each record must be called before the next one
+    is requested.
+    """
+    if split == "lines":
+        for line in iter_lines(payload):
+            yield partial(decode, line)
+    elif format.lower() == "msgpack":
+        yield from iter_msgpack_array(payload)
+    elif format.lower() == "orjson":
+        yield from iter_decoded_array(payload, decode)
+    else:
+        yield from iter_json_array(payload)
+
 
 # pylint: disable=redefined-builtin
-async def deserialize(stream: Stream, format: str) -> Stream:
+@configuration_schema(DeserializeConfig())
+async def deserialize(
+    stream: Stream,
+    format: str,
+    split: Optional[str] = None,
+    suffix: str = "",
+    max_records: int = 0,
+) -> Stream:
     """
     Parse an event value.
 
+    Binary values (``bytes`` or ``memoryview``) are passed directly to the
+    decoder, without being decoded into a string first.
+
+    The filter can also split a payload with multiple records into one event
+    per record, either with one record per line (``split: lines``) or with
+    an array of records (``split: array``, for JSON or msgpack). Records are
+    parsed incrementally, as they are emitted, except for ``orjson``, which
+    decodes arrays at once directly from the buffer.
+
     Parameters
     ----------
     format
-        The format of the payload ("JSON" or "YAML")
+        The format of the payload ("JSON", "YAML", "orjson", "msgpack" or
+        "CBOR")
+    split
+        Split the payload into multiple events ("lines" or "array")
+    suffix
+        Suffix added to the name of split events; the position of the
+        record is available as ``{index}``
+    max_records
+        Maximum number of records emitted per payload, 0 for no limit
 
     Yields
     ------
     Event
         Events deserialized by the filter
     """
-    _logger.debug("Applying template to events")
+    _logger.debug("Deserializing events")
+    decode = get_codec(format).decode
+
+    if split not in {None, "lines", "array"}:
+        raise InvalidConfigurationException(f'Invalid split mode "{split}"')
+    if split == "array" and format.lower() not in {"json", "orjson", "msgpack"}:
+        raise InvalidConfigurationException(
+            f'Format "{format}" does not support splitting arrays',
+        )
+    format_suffix = "{" in suffix
+
     async for event in stream:  # pragma: no cover
-        if format.lower() == "json":
-            value = json.loads(event["value"])
-        elif format.lower() == "yaml":
-            value = yaml.safe_load(event["value"])
-        else:
-            raise InvalidConfigurationException(f'Invalid format "{format}"')
-
-        yield {
-            "timestamp": event["timestamp"],
-            "name": event["name"],
-            "value": value,
-        }
+        if split is None:
+            yield {
+                "timestamp": event["timestamp"],
+                "name": event["name"],
+                "value": decode(event["value"]),
+            }
+            continue
+
+        name = event["name"] + ("" if format_suffix else suffix)
+        records = iter_records(event["value"], split, format, decode)
+        for index, record in enumerate(records):
+            # check the limit before decoding the next record
+            if max_records and index == max_records:
+                _logger.warning(
+                    "Payload from %s has more than %d records, dropping the rest",
+                    event["name"],
+                    max_records,
+                )
+                break
+
+            yield {
+                "timestamp": event["timestamp"],
+                "name": (
+                    event["name"] + suffix.format(index=index)
+                    if format_suffix
+                    else name
+                ),
+                "value": record(),
+            }
@@ -0,0 +1,323 @@
+"""
+A filter that downsamples high-rate streams.
+"""
+
+# pylint: disable=too-few-public-methods, invalid-name
+
+import logging
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from marshmallow import Schema, fields, validate
+
+from senor_octopus.lib import configuration_schema
+from senor_octopus.types import Event, Stream
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_logger = logging.getLogger(__name__)
+
+# buckets smaller than this are processed in pure Python, since converting
+# them to arrays costs more than it saves
+NUMPY_THRESHOLD = 64
+
+Point = Tuple[float, float]
+
+
+class DownsampleMethod(Enum):
+    """
+    Different downsampling methods.
+    """
+
+    LTTB = "lttb"
+    MINMAX = "minmax"
+    NTH = "nth"
+
+
+class Bucket:
+    """
+    A bucket of events, with their coordinates stored in columns.
+    """
+
+    def __init__(self) -> None:
+        self.xs: List[float] = []
+        self.ys: List[float] = []
+        self.events: List[Event] = []
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def append(self, x: float, y: float, event: Event) -> None:
+        """
+        Add an event to the bucket.
+        """
+        self.xs.append(x)
+        self.ys.append(y)
+        self.events.append(event)
+
+    def pop(self) -> Tuple[float, float, Event]:
+        """
+        Remove the last event from the bucket.
+        """
+        return self.xs.pop(), self.ys.pop(), self.events.pop()
+
+    def average(self) -> Point:
+        """
+        The average point of the bucket.
+        """
+        return sum(self.xs) / len(self), sum(self.ys) / len(self)
+
+    def extremes(self) -> List[int]:
+        """
+        The sorted indexes of the minimum and maximum values.
+        """
+        if np is not None and len(self) >= NUMPY_THRESHOLD:
+            ys = np.asarray(self.ys, dtype=float)
+            indexes = {int(ys.argmin()), int(ys.argmax())}
+        else:
+            indexes = {
+                min(range(len(self)), key=self.ys.__getitem__),
+                max(range(len(self)), key=self.ys.__getitem__),
+            }
+        return sorted(indexes)
+
+    def largest_triangle(self, previous: Point, following: Point) -> int:
+        """
+        The index of the point forming the largest triangle with two others.
+        """
+        (ax, ay), (cx, cy) = previous, following
+        if np is not None and len(self) >= NUMPY_THRESHOLD:
+            xs = np.asarray(self.xs, dtype=float)
+            ys = np.asarray(self.ys, dtype=float)
+            areas = np.abs((ax - cx) * (ys - ay) - (ax - xs) * (cy - ay))
+            return int(areas.argmax())
+
+        return max(
+            range(len(self)),
+            key=lambda i: abs(
+                (ax - cx) * (self.ys[i] - ay) - (ax - self.xs[i]) * (cy - ay)
+            ),
+        )
+
+
+class Downsampler:
+    """
+    Downsample the events of a single series.
+    """
+
+    def __init__(self, bucket: int):
+        self.bucket = bucket
+
+    def add(self, x: float, y: float, event: Event) -> List[Event]:
+        """
+        Add an event, returning the events that should be emitted.
+        """
+        raise NotImplementedError
+
+    def flush(self) -> List[Event]:
+        """
+        Return the pending events that should be emitted when the stream ends.
+        """
+        raise NotImplementedError
+
+
+class NthDownsampler(Downsampler):
+    """
+    Keep the first of every N events.
+    """
+
+    def __init__(self, bucket: int):
+        super().__init__(bucket)
+        self.count = 0
+
+    def add(self, x: float, y: float, event: Event) -> List[Event]:
+        self.count += 1
+        return [event] if (self.count - 1) % self.bucket == 0 else []
+
+    def flush(self) -> List[Event]:
+        return []
+
+
+class MinMaxDownsampler(Downsampler):
+    """
+    Keep the events with the minimum and maximum values of every N events.
+    """
+
+    def __init__(self, bucket: int):
+        super().__init__(bucket)
+        self.current = Bucket()
+
+    def add(self, x: float, y: float, event: Event) -> List[Event]:
+        self.current.append(x, y, event)
+        if len(self.current) < self.bucket:
+            return []
+        return self.flush()
+
+    def flush(self) -> List[Event]:
+        if not self.current:
+            return []
+        bucket, self.current = self.current, Bucket()
+        return [bucket.events[i] for i in bucket.extremes()]
+
+
+class LTTBDownsampler(Downsampler):
+    """
+    Largest-Triangle-Three-Buckets downsampling, computed incrementally.
+
+    The first event is always kept. After that, one event is selected from
+    each bucket of N events: the one that forms the largest triangle with the
+    previously selected event and the average of the following bucket. Only
+    two buckets are kept in memory, and an event is emitted as soon as the
+    bucket after it is complete. The last event is kept when the stream ends.
+    """
+
+    def __init__(self, bucket: int):
+        super().__init__(bucket)
+        self.previous: Optional[Point] = None
+        self.current = Bucket()
+        self.following = Bucket()
+
+    def add(self, x: float, y: float, event: Event) -> List[Event]:
+        if self.previous is None:
+            self.previous = (x, y)
+            return [event]
+
+        if len(self.current) < self.bucket:
+            self.current.append(x, y, event)
+            return []
+
+        self.following.append(x, y, event)
+        if len(self.following) < self.bucket:
+            return []
+
+        selected = self.select(self.current, self.following.average())
+        self.current, self.following = self.following, Bucket()
+        return [selected]
+
+    def select(self, bucket: Bucket, following: Point) -> Event:
+        """
+        Select an event from a bucket.
+        """
+        index = bucket.largest_triangle(self.previous, following)  # type: ignore
+        self.previous = (bucket.xs[index], bucket.ys[index])
+        return bucket.events[index]
+
+    def flush(self) -> List[Event]:
+        if not self.current:
+            return []
+
+        # the last event is always kept
+        x, y, event = (self.following or self.current).pop()
+
+        events = []
+        if self.current:
+            following = self.following.average() if self.following else (x, y)
+            events.append(self.select(self.current, following))
+        if self.following:
+            events.append(self.select(self.following, (x, y)))
+        events.append(event)
+
+        self.current, self.following = Bucket(), Bucket()
+        return events
+
+
+downsamplers: Dict[DownsampleMethod, Callable[[int], Downsampler]] = {
+    DownsampleMethod.LTTB: LTTBDownsampler,
+    DownsampleMethod.MINMAX: MinMaxDownsampler,
+    DownsampleMethod.NTH: NthDownsampler,
+}
+
+
+class DownsampleConfig(Schema):
+    """
+    A filter that downsamples high-rate streams.
+
+    Events are downsampled separately for each name, using buckets of
+    ``bucket`` consecutive events:
+
+        - ``nth`` keeps the first event of every bucket;
+        - ``minmax`` keeps the events with the minimum and maximum values of
+          every bucket;
+        - ``lttb`` (Largest-Triangle-Three-Buckets) keeps one event per bucket,
+          chosen to preserve the visual shape of the series.
+
+    For example, to keep one of every 10 speed readings from a GPS tracker:
+
+        method: lttb
+        bucket: 10
+        field: speed
+
+    The value of the events (or the ``field`` of dictionary values) is
+    used for ``minmax`` and ``lttb``, and the timestamp is used as the x
+    coordinate; events without a numeric value are dropped. Emitted events
+    are unmodified. When NumPy is installed large buckets are processed as
+    arrays.
+    """
+
+    method = fields.Enum(
+        DownsampleMethod,
+        by_value=True,
+        required=True,
+        default=None,
+        title="Method",
+        description="One of lttb, minmax or nth.",
+    )
+    bucket = fields.Integer(
+        required=False,
+        default=10,
+        validate=validate.Range(min=1),
+        title="Bucket size",
+        description="The number of consecutive events in each bucket.",
+    )
+    field = fields.String(
+        required=False,
+        default=None,
+        title="Field",
+        description="A key with the numeric value, when event values are dictionaries.",
+    )
+
+
+def get_value(value: Any, field: Optional[str]) -> Optional[float]:
+    """
+    Extract the numeric value of an event.
+    """
+    if field is not None:
+        value = value.get(field) if isinstance(value, dict) else None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+@configuration_schema(DownsampleConfig())
+async def downsample(
+    stream: Stream,
+    method: DownsampleMethod,
+    bucket: int = 10,
+    field: Optional[str] = None,
+) -> Stream:
+    """
+    Downsample events.
+    """
+    _logger.debug("Downsampling events")
+    factory = downsamplers[method]
+    series: Dict[str, Downsampler] = {}
+
+    async for event in stream:  # pragma: no cover
+        y = get_value(event["value"], field)
+        if y is None and method != DownsampleMethod.NTH:
+            _logger.debug("Dropping non-numeric event: %s", event)
+            continue
+
+        name = event["name"]
+        if name not in series:
+            series[name] = factory(bucket)
+        x = event["timestamp"].timestamp()
+        for selected in series[name].add(x, y, event):  # type: ignore
+            yield selected
+
+    for downsampler in series.values():
+        for selected in downsampler.flush():
+            yield selected
@@ -0,0 +1,373 @@
+"""
+A filter that evaluates Python expressions on events.
+"""
+
+import ast
+import logging
+from functools import reduce
+from typing import Any, Callable, Dict, List, Optional
+
+from marshmallow import Schema, fields
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import configuration_schema
+from senor_octopus.types import Event, Stream
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_logger = logging.getLogger(__name__)
+
+Expression = Callable[..., Any]
+
+VARIABLES = ["name", "value", "timestamp"]
+
+FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "abs": abs,
+    "bool": bool,
+    "float": float,
+    "int": int,
+    "len": len,
+    "max": max,
+    "min": min,
+    "round": round,
+    "str": str,
+}
+
+ATTRIBUTES = {
+    # strings
+    "endswith",
+    "lower",
+    "split",
+    "startswith",
+    "strip",
+    "upper",
+    # dictionaries
+    "get",
+    # timestamps
+    "day",
+    "hour",
+    "isoformat",
+    "minute",
+    "month",
+    "second",
+    "weekday",
+    "year",
+}
+
+NODES = (
+    ast.Expression,
+    ast.Constant,
+    ast.Name,
+    ast.Load,
+    ast.Attribute,
+    ast.Call,
+    ast.Subscript,
+    ast.Slice,
+    ast.Tuple,
+    ast.List,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.UAdd,
+    ast.USub,
+    ast.BinOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.Compare,
+    ast.Eq,
+    ast.NotEq,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.In,
+    ast.NotIn,
+    ast.Is,
+    ast.IsNot,
+    ast.IfExp,
+)
+
+# subscripts are wrapped in ``ast.Index`` in Python 3.8
+if hasattr(ast, "Index"):  # pragma: no cover
+    NODES += (ast.Index,)
+
+
+def validate_expression(tree: ast.Expression) -> None:
+    """
+    Check that an expression only uses allowed syntax, names and attributes.
+    """
+    for node in ast.walk(tree):
+        if not isinstance(node, NODES):
+            raise ValueError(f"`{type(node).__name__}` is not allowed")
+        if isinstance(node, ast.Name) and node.id not in VARIABLES + list(FUNCTIONS):
+            raise ValueError(f"Name `{node.id}` is not allowed")
+        if isinstance(node, ast.Attribute) and node.attr not in ATTRIBUTES:
+            raise ValueError(f"Attribute `{node.attr}` is not allowed")
+        if isinstance(node, ast.Call) and node.keywords:
+            raise ValueError("Keyword arguments are not allowed")
+
+
+class Vectorize(ast.NodeTransformer):
+    """
+    Rewrite an expression so that it can be evaluated on NumPy arrays.
+
+    Boolean operators, chained comparisons and conditional expressions
+    don't work on arrays, so they're replaced by element-wise functions.
+    """
+
+    # pylint: disable=invalid-name
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.AST:
+        """
+        Replace ``and`` and ``or``.
+        """
+        self.generic_visit(node)
+        function = "_and" if isinstance(node.op, ast.And) else "_or"
+        return ast.Call(
+            func=ast.Name(id=function, ctx=ast.Load()),
+            args=node.values,
+            keywords=[],
+        )
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        """
+        Replace ``not``.
+        """
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.Not):
+            return node
+        return ast.Call(
+            func=ast.Name(id="_not", ctx=ast.Load()),
+            args=[node.operand],
+            keywords=[],
+        )
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        """
+        Replace chained comparisons, eg, ``0 < value < 10``.
+        """
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left] + node.comparators
+        comparisons = [
+            ast.Compare(left=left, ops=[op], comparators=[right])
+            for left, op, right in zip(operands, node.ops, operands[1:])
+        ]
+        return ast.Call(
+            func=ast.Name(id="_and", ctx=ast.Load()),
+            args=comparisons,
+            keywords=[],
+        )
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.AST:
+        """
+        Replace conditional expressions.
+        """
+        self.generic_visit(node)
+        return ast.Call(
+            func=ast.Name(id="_where", ctx=ast.Load()),
+            args=[node.test, node.body, node.orelse],
+            keywords=[],
+        )
+
+
+def build_function(tree: ast.Expression, namespace: Dict[str, Any]) -> Expression:
+    """
+    Compile an expression into a function of the event attributes.
+    """
+    function = ast.Expression(
+        body=ast.Lambda(
+            args=ast.arguments(
+                posonlyargs=[],
+                args=[ast.arg(arg=variable) for variable in VARIABLES],
+                vararg=None,
+                kwonlyargs=[],
+                kw_defaults=[],
+                kwarg=None,
+                defaults=[],
+            ),
+            body=tree.body,
+        ),
+    )
+    ast.fix_missing_locations(function)
+    code = compile(function, "<expression>", "eval")
+    return eval(code, {"__builtins__": {}, **namespace})  # pylint: disable=eval-used
+
+
+def vector_namespace() -> Dict[str, Any]:
+    """
+    Functions used to evaluate vectorized expressions.
+    """
+    return {
+        **FUNCTIONS,
+        "abs": np.abs,
+        "round": np.round,
+        "min": np.minimum,
+        "max": np.maximum,
+        "_and": lambda *args: reduce(np.logical_and, args),
+        "_or": lambda *args: reduce(np.logical_or, args),
+        "_not": np.logical_not,
+        "_where": np.where,
+    }
+
+
+class CompiledExpression:
+    """
+    An expression compiled once and evaluated per event.
+
+    When NumPy is installed a vectorized version is also compiled, used to
+    evaluate the expression on lists of numbers in a single call.
+    """
+
+    def __init__(self, expression: str):
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+            validate_expression(tree)
+        except (SyntaxError, ValueError) as ex:
+            raise InvalidConfigurationException(
+                f'Invalid expression "{expression}": {ex}',
+            ) from ex
+
+        self.function = build_function(tree, FUNCTIONS)
+        self.vectorized: Optional[Expression] = None
+        if np is not None:
+            vectorized = Vectorize().visit(ast.parse(expression.strip(), mode="eval"))
+            self.vectorized = build_function(vectorized, vector_namespace())
+
+    def evaluate(self, event: Event) -> Any:
+        """
+        Evaluate the expression on an event.
+        """
+        return self.function(event["name"], event["value"], event["timestamp"])
+
+    def map(self, event: Event, values: List[Any]) -> List[Any]:
+        """
+        Evaluate the expression on each element of a list of values.
+        """
+        if self.vectorized is not None:
+            try:
+                array = np.asarray(values)
+                # NumPy integers wrap around silently on overflow, so integers
+                # are kept as Python objects, preserving their semantics
+                if array.dtype.kind != "f":
+                    array = np.asarray(values, dtype=object)
+                # raise on division by zero and overflows, like Python does
+                with np.errstate(all="raise"):
+                    result = self.vectorized(event["name"], array, event["timestamp"])
+                return np.broadcast_to(result, array.shape).tolist()
+            except (ArithmeticError, AttributeError, TypeError, ValueError):
+                _logger.debug("Unable to vectorize expression, evaluating per element")
+
+        return [
+            self.function(event["name"], value, event["timestamp"]) for value in values
+        ]
+
+
+def is_batch(value: Any) -> bool:
+    """
+    Check if a value is a list of numbers.
+    """
+    return (
+        isinstance(value, list)
+        and bool(value)
+        and all(
+            isinstance(element, (int, float)) and not isinstance(element, bool)
+            for element in value
+        )
+    )
+
+
+class ExprConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A filter that evaluates Python expressions on events.
+
+    Expressions can use the ``name``, ``value`` and ``timestamp`` of each
+    event, arithmetic, comparisons, boolean operators, conditional
+    expressions, a few functions (``abs``, ``min``, ``max``, ``round``,
+    ``int``, ``float``, ``str``, ``bool``, ``len``) and some string, dictionary
+    and datetime methods. For example, to convert high temperatures to
+    Fahrenheit:
+
+        filter: name.startswith("hub.awair") and value > 30
+        value: value * 1.8 + 32
+
+    Expressions are validated and compiled once. When the value of an event
+    is a list of numbers the expressions are applied to each element, using
+    NumPy when it's installed: the filter removes elements from the list,
+    and the event is dropped only if no elements are left.
+    """
+
+    filter = fields.String(
+        required=False,
+        default=None,
+        title="Filter expression",
+        description="Events where this expression is false are dropped.",
+    )
+    name = fields.String(
+        required=False,
+        default=None,
+        title="Name expression",
+        description="An expression that replaces the event name.",
+    )
+    value = fields.String(
+        required=False,
+        default=None,
+        title="Value expression",
+        description="An expression that replaces the event value.",
+    )
+
+
+# pylint: disable=redefined-builtin
+@configuration_schema(ExprConfig())
+async def expr(
+    stream: Stream,
+    filter: Optional[str] = None,
+    name: Optional[str] = None,
+    value: Optional[str] = None,
+) -> Stream:
+    """
+    Filter and transform events with expressions.
+    """
+    _logger.debug("Evaluating expressions")
+    filter_expression = CompiledExpression(filter) if filter else None
+    name_expression = CompiledExpression(name) if name else None
+    value_expression = CompiledExpression(value) if value else None
+
+    async for event in stream:  # pragma: no cover
+        try:
+            new_value = event["value"]
+            if is_batch(new_value):
+                if filter_expression:
+                    mask = filter_expression.map(event, new_value)
+                    new_value = [
+                        element for element, keep in zip(new_value, mask) if keep
+                    ]
+                    if not new_value:
+                        continue
+                if value_expression:
+                    new_value = value_expression.map(event, new_value)
+            else:
+                if filter_expression and not filter_expression.evaluate(event):
+                    continue
+                if value_expression:
+                    new_value = value_expression.evaluate(event)
+
+            new_name = (
+                name_expression.evaluate(event) if name_expression else event["name"]
+            )
+        except Exception as ex:  # pylint: disable=broad-except
+            _logger.warning("Unable to evaluate expression for %s: %s", event, ex)
+            continue
+
+        yield {"timestamp": event["timestamp"], "name": new_name, "value": new_value}
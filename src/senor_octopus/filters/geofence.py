@@ -0,0 +1,320 @@
+"""
+A filter that emits events when devices enter or exit geofences.
+"""
+
+# pylint: disable=too-few-public-methods, invalid-name
+
+import logging
+import math
+import statistics
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import geohash
+from marshmallow import Schema, fields
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import MemoryStateStore, StateStore, configuration_schema
+from senor_octopus.types import Event, Stream
+
+_logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8
+
+# meters per degree of latitude
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+# the smallest grid cell, in degrees (about 10 meters)
+MIN_CELL_SIZE = 1e-4
+
+# fences that overlap more cells are checked for every point instead
+MAX_CELLS_PER_FENCE = 64
+
+Point = Tuple[float, float]
+
+# (south, west, north, east)
+BoundingBox = Tuple[float, float, float, float]
+
+
+def haversine(origin: Point, destination: Point) -> float:
+    """
+    The distance in meters between two points.
+    """
+    lat1, lon1 = map(math.radians, origin)
+    lat2, lon2 = map(math.radians, destination)
+    chord = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(chord))
+
+
+class Fence:
+    """
+    A named area.
+    """
+
+    def __init__(self, name: str, bbox: BoundingBox):
+        self.name = name
+        self.bbox = bbox
+
+    def __contains__(self, point: Point) -> bool:
+        south, west, north, east = self.bbox
+        return south <= point[0] <= north and west <= point[1] <= east
+
+
+class Circle(Fence):
+    """
+    A circular fence, with a radius in meters.
+    """
+
+    def __init__(self, name: str, center: Point, radius: float):
+        lat, lon = center
+        dlat = radius / METERS_PER_DEGREE
+        dlon = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        super().__init__(name, (lat - dlat, lon - dlon, lat + dlat, lon + dlon))
+        self.center = center
+        self.radius = radius
+
+    def __contains__(self, point: Point) -> bool:
+        return super().__contains__(point) and (
+            haversine(self.center, point) <= self.radius
+        )
+
+
+class Polygon(Fence):
+    """
+    A polygon fence, with vertices as latitude/longitude pairs.
+    """
+
+    def __init__(self, name: str, vertices: List[Point]):
+        lats = [lat for lat, _ in vertices]
+        lons = [lon for _, lon in vertices]
+        super().__init__(name, (min(lats), min(lons), max(lats), max(lons)))
+        self.vertices = vertices
+
+    def __contains__(self, point: Point) -> bool:
+        """
+        Test if the point is inside the polygon, using ray casting.
+        """
+        if not super().__contains__(point):
+            return False
+
+        y, x = point
+        inside = False
+        previous = self.vertices[-1]
+        for vertex in self.vertices:
+            (y1, x1), (y2, x2) = previous, vertex
+            if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+            previous = vertex
+        return inside
+
+
+class GridIndex:
+    """
+    A spatial index of fences, based on a regular latitude/longitude grid.
+
+    Each fence is added to the cells overlapped by its bounding box, so that
+    a point only needs to be tested against the fences in its cell. The cell
+    size is the median size of the fences, so that most fences are in only a
+    few cells. Fences much bigger than the median, which would overlap more
+    than ``MAX_CELLS_PER_FENCE`` cells, are kept in a separate list and
+    tested against every point instead.
+    """
+
+    def __init__(self, fences: List[Fence]):
+        sizes = [
+            max(north - south, east - west)
+            for south, west, north, east in (fence.bbox for fence in fences)
+        ]
+        self.cell_size = max(statistics.median(sizes) if sizes else 0, MIN_CELL_SIZE)
+        self.cells: Dict[Tuple[int, int], List[Fence]] = defaultdict(list)
+        self.large: List[Fence] = []
+        for fence in fences:
+            if self.count(fence.bbox) > MAX_CELLS_PER_FENCE:
+                self.large.append(fence)
+                continue
+            for cell in self.covering(fence.bbox):
+                self.cells[cell].append(fence)
+
+    def cell(self, point: Point) -> Tuple[int, int]:
+        """
+        The cell containing a point.
+        """
+        return (
+            math.floor(point[0] / self.cell_size),
+            math.floor(point[1] / self.cell_size),
+        )
+
+    def count(self, bbox: BoundingBox) -> int:
+        """
+        The number of cells overlapped by a bounding box.
+        """
+        south, west, north, east = bbox
+        min_row, min_column = self.cell((south, west))
+        max_row, max_column = self.cell((north, east))
+        return (max_row - min_row + 1) * (max_column - min_column + 1)
+
+    def covering(self, bbox: BoundingBox) -> Iterator[Tuple[int, int]]:
+        """
+        The cells overlapped by a bounding box.
+        """
+        south, west, north, east = bbox
+        min_row, min_column = self.cell((south, west))
+        max_row, max_column = self.cell((north, east))
+        for row in range(min_row, max_row + 1):
+            for column in range(min_column, max_column + 1):
+                yield row, column
+
+    def query(self, point: Point) -> Set[str]:
+        """
+        Return the names of the fences containing a point.
+        """
+        return {
+            fence.name
+            for fences in (self.cells.get(self.cell(point), []), self.large)
+            for fence in fences
+            if point in fence
+        }
+
+
+def build_fence(config: Dict[str, Any]) -> Fence:
+    """
+    Build a fence from its configuration.
+    """
+    name = config.get("name")
+    if not name:
+        raise InvalidConfigurationException("Geofences must have a `name`")
+
+    try:
+        if "polygon" in config:
+            vertices = [(float(lat), float(lon)) for lat, lon in config["polygon"]]
+            if len(vertices) < 3:
+                raise ValueError()
+            return Polygon(name, vertices)
+
+        lat, lon = config["center"]
+        radius = float(config["radius"])
+        if radius <= 0:
+            raise ValueError()
+        return Circle(name, (float(lat), float(lon)), radius)
+    except (KeyError, TypeError, ValueError) as ex:
+        raise InvalidConfigurationException(f'Invalid geofence "{name}"') from ex
+
+
+def get_point(value: Any) -> Optional[Point]:
+    """
+    Extract a point from an event value.
+
+    Points can be latitude/longitude pairs, geohashes, or dictionaries with
+    ``latitude`` and ``longitude`` keys (or ``lat`` and ``lon``).
+    """
+    try:
+        if isinstance(value, str):
+            return geohash.decode(value) if value else None
+        if isinstance(value, dict):
+            if "latitude" in value:
+                return float(value["latitude"]), float(value["longitude"])
+            return float(value["lat"]), float(value["lon"])
+        lat, lon = value
+        return float(lat), float(lon)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def build_event(event: Event, device: str, fence: str, transition: str) -> Event:
+    """
+    Build a geofence transition event.
+    """
+    return {
+        "timestamp": event["timestamp"],
+        "name": f"{event['name']}.geofence",
+        "value": {"device": device, "fence": fence, "transition": transition},
+    }
+
+
+class GeofenceConfig(Schema):
+    """
+    A filter that emits events when devices enter or exit geofences.
+
+    Fences are either polygons, with a list of latitude/longitude vertices,
+    or circles, with a center and a radius in meters:
+
+        fences:
+          - name: home
+            center: [37.7749, -122.4194]
+            radius: 100
+          - name: park
+            polygon: [[37.76, -122.46], [37.77, -122.46], [37.77, -122.51]]
+
+    Events can have latitude/longitude pairs, geohashes, or dictionaries with
+    ``latitude`` and ``longitude`` as their values; other events are dropped.
+    Each device is identified by the event name, and by the ``key`` in the
+    value, if present, so that multiple trackers can share the same name.
+
+    Fences are stored in a grid index, so that each point is only tested
+    against the fences near it. For each device the filter keeps the set of
+    fences it's inside, and emits an event when it enters or exits one. The
+    event has the original name with ``.geofence`` appended, and a dictionary
+    value with the ``device``, the ``fence``, and the ``transition`` (either
+    ``enter`` or ``exit``).
+    """
+
+    fences = fields.List(
+        fields.Dict(),
+        required=True,
+        default=None,
+        title="Fences",
+        description=(
+            "A list of fences, each with a name and either a polygon or a "
+            "center and a radius in meters."
+        ),
+    )
+    key = fields.String(
+        required=False,
+        default="id",
+        title="Device key",
+        description="A key in the event values identifying the device.",
+    )
+
+
+@configuration_schema(GeofenceConfig())
+async def geofence(
+    stream: Stream,
+    fences: List[Dict[str, Any]],
+    key: str = "id",
+    state: Optional[StateStore] = None,
+) -> Stream:
+    """
+    Emit events when devices enter or exit geofences.
+    """
+    index = GridIndex([build_fence(config) for config in fences])
+    _logger.debug("Checking %d geofences", len(fences))
+
+    # device => names of the fences the device is inside
+    inside = state if state is not None else MemoryStateStore()
+
+    async for event in stream:  # pragma: no cover
+        value = event["value"]
+        point = get_point(value)
+        if point is None:
+            _logger.debug("Dropping event without a location: %s", event)
+            continue
+
+        device = event["name"]
+        if isinstance(value, dict) and key in value:
+            device = f"{device}.{value[key]}"
+
+        previous = inside.get(device) or set()
+        current = index.query(point)
+        if current == previous:
+            continue
+        inside.set(device, current)
+
+        for transition, names in (
+            ("exit", previous - current),
+            ("enter", current - previous),
+        ):
+            for name in sorted(names):
+                yield build_event(event, device, name, transition)
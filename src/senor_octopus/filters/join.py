@@ -0,0 +1,356 @@
+"""
+A filter that joins events from different streams by key and time.
+"""
+
+import bisect
+import heapq
+import logging
+import math
+from enum import Enum
+from fnmatch import fnmatchcase
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+from durations import Duration
+from marshmallow import Schema, fields
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import StateStore, configuration_schema
+from senor_octopus.types import Event, Stream
+
+_logger = logging.getLogger(__name__)
+
+# marks a side without a matching event
+MISSING = object()
+
+
+class JoinType(Enum):
+    """
+    Different types of joins.
+    """
+
+    INNER = "inner"
+    LEFT = "left"
+    ASOF = "asof"
+
+
+class Buffer:
+    """
+    Events from one side of the join for a given key, sorted by time.
+
+    Timestamps and values are kept in separate lists, so that matches can be
+    found with a binary search.
+    """
+
+    def __init__(self) -> None:
+        self.timestamps: List[float] = []
+        self.values: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def add(self, timestamp: float, value: Any) -> None:
+        """
+        Add a value, keeping the buffer sorted.
+        """
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+        else:
+            index = bisect.bisect_right(self.timestamps, timestamp)
+            self.timestamps.insert(index, timestamp)
+            self.values.insert(index, value)
+
+    def evict(self, before: float) -> None:
+        """
+        Remove values older than a given time.
+        """
+        index = bisect.bisect_left(self.timestamps, before)
+        if index:
+            del self.timestamps[:index]
+            del self.values[:index]
+
+    def latest(self, timestamp: float, tolerance: float) -> Any:
+        """
+        Return the latest value at or before a given time, within tolerance.
+        """
+        index = bisect.bisect_right(self.timestamps, timestamp) - 1
+        if index < 0 or timestamp - self.timestamps[index] > tolerance:
+            return MISSING
+        return self.values[index]
+
+    def nearest(self, timestamp: float, tolerance: float) -> Any:
+        """
+        Return the value closest to a given time, within tolerance.
+        """
+        index = bisect.bisect_left(self.timestamps, timestamp)
+        candidates = [i for i in (index - 1, index) if 0 <= i < len(self.timestamps)]
+        if not candidates:
+            return MISSING
+
+        best = min(candidates, key=lambda i: abs(self.timestamps[i] - timestamp))
+        if abs(self.timestamps[best] - timestamp) > tolerance:
+            return MISSING
+        return self.values[best]
+
+
+class Join:  # pylint: disable=too-many-instance-attributes
+    """
+    The state of a join.
+
+    The state is shared between all the parents of the join node, since each
+    parent sends its events in a separate run of the filter.
+    """
+
+    def __init__(
+        self,
+        left: str,
+        right: List[str],
+        how: JoinType,
+        tolerance: float,
+    ):
+        self.left = left
+        self.right = right
+        self.how = how
+        self.tolerance = tolerance
+
+        self.buffers: Dict[Any, Dict[str, Buffer]] = {}
+        # (deadline, sequence, key, timestamp, event) for unmatched left events
+        self.pending: List[Tuple[float, int, Any, float, Event]] = []
+        self.sequence = 0
+        self.watermark = -math.inf
+        self.last_sweep = -math.inf
+        self.runs = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # runs don't survive restarts
+        return {**self.__dict__, "runs": 0}
+
+    def add(self, side: str, key: Any, timestamp: float, event: Event) -> List[Event]:
+        """
+        Add an event, returning the joined events that are ready.
+        """
+        if side != self.left:
+            buffers = self.buffers.setdefault(key, {})
+            buffers.setdefault(side, Buffer()).add(timestamp, event["value"])
+            return self.advance(timestamp)
+
+        if self.how == JoinType.ASOF:
+            # as-of joins always have a result, with nulls for missing sides
+            joined = cast(Event, self.join(key, timestamp, event))
+            return [joined] + self.advance(timestamp)
+
+        heapq.heappush(
+            self.pending,
+            (timestamp + self.tolerance, self.sequence, key, timestamp, event),
+        )
+        self.sequence += 1
+        return self.advance(timestamp)
+
+    def advance(self, timestamp: float) -> List[Event]:
+        """
+        Advance the watermark, emitting left events whose window has passed.
+        """
+        self.watermark = max(self.watermark, timestamp)
+        events = self.emit(self.watermark)
+        if self.watermark - self.last_sweep >= self.tolerance:
+            self.sweep()
+        return events
+
+    def emit(self, until: float) -> List[Event]:
+        """
+        Join the pending left events with a deadline up to a given time.
+        """
+        events = []
+        while self.pending and self.pending[0][0] <= until:
+            _, _, key, timestamp, event = heapq.heappop(self.pending)
+            joined = self.join(key, timestamp, event)
+            if joined is not None:
+                events.append(joined)
+        return events
+
+    def sweep(self) -> None:
+        """
+        Evict values that can no longer be matched.
+
+        Pending left events are at most ``tolerance`` older than the
+        watermark, and can match values ``tolerance`` older than themselves.
+        """
+        self.last_sweep = self.watermark
+        before = self.watermark - 2 * self.tolerance
+        for key in list(self.buffers):
+            buffers = self.buffers[key]
+            for side in list(buffers):
+                buffers[side].evict(before)
+                if not buffers[side]:
+                    del buffers[side]
+            if not buffers:
+                del self.buffers[key]
+
+    def join(self, key: Any, timestamp: float, event: Event) -> Optional[Event]:
+        """
+        Join a left event with the values from the other sides.
+        """
+        buffers = self.buffers.get(key, {})
+        value = {self.left: event["value"]}
+        for side in self.right:
+            if side not in buffers:
+                match = MISSING
+            elif self.how == JoinType.ASOF:
+                match = buffers[side].latest(timestamp, self.tolerance)
+            else:
+                match = buffers[side].nearest(timestamp, self.tolerance)
+
+            if match is MISSING:
+                if self.how == JoinType.INNER:
+                    return None
+                match = None
+            value[side] = match
+
+        return {"timestamp": event["timestamp"], "name": event["name"], "value": value}
+
+    def flush(self) -> List[Event]:
+        """
+        Emit all pending left events.
+        """
+        return self.emit(math.inf)
+
+
+class JoinConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A filter that joins events from different streams by key and time.
+
+    Each stream is identified by a pattern matching the event names. Events
+    from the ``left`` stream are joined with events from the other streams
+    that have the same ``key`` (if any) and are within ``tolerance`` of each
+    other. For example, to enrich GPS fixes with the latest air quality
+    score:
+
+        flow: gps, awair -> db
+        streams:
+          gps: hub.micron
+          awair: hub.awair.score
+        left: gps
+        how: asof
+        tolerance: 15 minutes
+
+    The join types are:
+
+        - ``asof``: each left event is emitted immediately, joined with the
+          latest event from each stream at or before it (or ``null``);
+        - ``inner``: each left event is joined with the closest event from
+          each stream, and emitted only if all streams have a match;
+        - ``left``: like ``inner``, but left events are always emitted, with
+          ``null`` for streams without a match.
+
+    For ``inner`` and ``left`` joins, left events are emitted once events
+    ``tolerance`` after them have been seen, or when all parents finish.
+    Joined events have the name and timestamp of the left event, and a
+    dictionary value with the values from each stream. Events are kept only
+    while they can be matched, so memory is bounded by the tolerance.
+    """
+
+    streams = fields.Dict(
+        keys=fields.String(),
+        values=fields.String(),
+        required=True,
+        default=None,
+        title="Streams",
+        description=(
+            "A dictionary mapping stream names to patterns matching the "
+            'names of their events, eg, "hub.awair.*".'
+        ),
+    )
+    left = fields.String(
+        required=True,
+        default=None,
+        title="Left stream",
+        description="The stream whose events are enriched with the others.",
+    )
+    how = fields.Enum(
+        JoinType,
+        by_value=True,
+        required=False,
+        default=JoinType.ASOF,
+        title="Type of join",
+        description="One of asof, inner or left.",
+    )
+    tolerance = fields.String(
+        required=True,
+        default=None,
+        title="Tolerance",
+        description='The maximum time between joined events, eg, "5 minutes".',
+    )
+    key = fields.String(
+        required=False,
+        default=None,
+        title="Key",
+        description=(
+            "A key in the event values that must be equal for events to be "
+            "joined. If not set events are joined only by time."
+        ),
+    )
+
+
+def get_side(name: str, streams: Dict[str, str]) -> Optional[str]:
+    """
+    Return the stream an event belongs to.
+    """
+    for side, pattern in streams.items():
+        if fnmatchcase(name, pattern):
+            return side
+    return None
+
+
+@configuration_schema(JoinConfig())
+async def join(  # pylint: disable=too-many-arguments
+    stream: Stream,
+    streams: Dict[str, str],
+    left: str,
+    tolerance: str,
+    how: JoinType = JoinType.ASOF,
+    key: Optional[str] = None,
+    state: Optional[StateStore] = None,
+) -> Stream:
+    """
+    Join events from different streams.
+    """
+    if left not in streams:
+        raise InvalidConfigurationException(f'Left stream "{left}" not in streams')
+    tolerance_seconds = Duration(tolerance).to_seconds()
+    if tolerance_seconds <= 0:
+        raise InvalidConfigurationException("Invalid `tolerance` for join")
+
+    current = state.get("join") if state is not None else None
+    if current is None:
+        current = Join(
+            left,
+            [side for side in streams if side != left],
+            how,
+            tolerance_seconds,
+        )
+        if state is not None:
+            state.set("join", current)
+
+    _logger.debug("Joining events")
+    current.runs += 1
+    try:
+        async for event in stream:  # pragma: no cover
+            side = get_side(event["name"], streams)
+            if side is None:
+                _logger.debug("Dropping event from unknown stream: %s", event)
+                continue
+
+            value = event["value"]
+            group = value.get(key) if key and isinstance(value, dict) else None
+            timestamp = event["timestamp"].timestamp()
+            for joined in current.add(side, group, timestamp, event):
+                yield joined
+            if state is not None:
+                state.set("join", current)
+    finally:
+        current.runs -= 1
+
+    # the last parent to finish emits the pending events
+    if current.runs == 0:
+        for joined in current.flush():
+            yield joined
@@ -0,0 +1,207 @@
+"""
+A filter that computes rates and deltas of counters and gauges.
+"""
+
+import logging
+import math
+from enum import Enum
+from typing import Any, List, Optional
+
+from durations import Duration
+from marshmallow import Schema, fields, validate
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import MemoryStateStore, StateStore, configuration_schema
+from senor_octopus.types import Stream
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_logger = logging.getLogger(__name__)
+
+# batches smaller than this are processed in pure Python, since converting
+# them to arrays costs more than it saves
+NUMPY_THRESHOLD = 64
+
+
+class RateMode(Enum):
+    """
+    Different ways of comparing consecutive values.
+    """
+
+    RATE = "rate"
+    DELTA = "delta"
+    DERIVATIVE = "derivative"
+
+
+def is_number(value: Any) -> bool:
+    """
+    Return true if the value is a finite number.
+    """
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def deltas(
+    values: List[float],
+    counter: bool,
+    wrap: Optional[float] = None,
+    scale: float = 1,
+) -> List[float]:
+    """
+    Compute the differences between consecutive values, multiplied by ``scale``.
+
+    For counters a decrease means the counter was reset, so the new value is
+    the increase since the reset; if the counter wraps around at a given
+    value the increase is computed from that instead.
+    """
+    if np is not None and len(values) >= NUMPY_THRESHOLD:
+        array = np.asarray(values, dtype=float)
+        differences = np.diff(array)
+        if counter:
+            resets = differences < 0
+            differences[resets] = (
+                differences[resets] + wrap if wrap else array[1:][resets]
+            )
+        return (differences * scale).tolist()
+
+    result: List[float] = []
+    for previous, current in zip(values, values[1:]):
+        delta = current - previous
+        if counter and delta < 0:
+            delta = delta + wrap if wrap else current
+        result.append(delta * scale)
+    return result
+
+
+class RateConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A filter that computes rates and deltas of counters and gauges.
+
+    The last value and timestamp are kept for each event name, and each new
+    event is compared with them:
+
+        - ``rate``: the increase of a counter per ``unit`` of time;
+        - ``delta``: the increase of a counter;
+        - ``derivative``: the change of a gauge per ``unit`` of time, which
+          can be negative.
+
+    Counters only increase, so in ``rate`` and ``delta`` modes a decrease
+    means the counter was reset, and the new value is used as the increase.
+    Counters that wrap around at a maximum value, eg, 32-bit counters, can
+    set ``wrap`` instead. For example, to compute the download speed in bytes
+    per second from a counter:
+
+        mode: rate
+        unit: 1 second
+
+    The emitted events have the name of the mode appended to the original
+    name, eg, ``hub.meter.energy.rate``. The first event of each series only
+    initializes it, and non-numeric events are dropped.
+
+    Events can also have a list of evenly spaced readings, ending at the
+    event timestamp; they're compared in a single vectorized operation when
+    NumPy is installed, and emitted as a list. The time between readings is
+    inferred from the previous event, or can be set with ``spacing``. The
+    first list of a series is compared from its second reading on, emitting
+    one value less, as long as the time between readings is known (it's not
+    needed in ``delta`` mode).
+    """
+
+    mode = fields.Enum(
+        RateMode,
+        by_value=True,
+        required=False,
+        default=RateMode.RATE,
+        title="Mode",
+        description="One of rate, delta or derivative.",
+    )
+    unit = fields.String(
+        required=False,
+        default="1 second",
+        title="Unit of time",
+        description='The unit of time for rates and derivatives, eg, "1 hour".',
+    )
+    wrap = fields.Float(
+        required=False,
+        default=None,
+        validate=validate.Range(min=0, min_inclusive=False),
+        title="Counter maximum",
+        description="The value at which counters wrap around, eg, 4294967296.",
+    )
+    spacing = fields.String(
+        required=False,
+        default=None,
+        title="Time between readings",
+        description=(
+            'The time between readings in lists, eg, "1 second". By default '
+            "it's inferred from the previous event."
+        ),
+    )
+
+
+@configuration_schema(RateConfig())
+async def rate(  # pylint: disable=too-many-arguments, too-many-locals
+    stream: Stream,
+    mode: RateMode = RateMode.RATE,
+    unit: str = "1 second",
+    wrap: Optional[float] = None,
+    spacing: Optional[str] = None,
+    state: Optional[StateStore] = None,
+) -> Stream:
+    """
+    Compute rates and deltas of counters and gauges.
+    """
+    unit_seconds = Duration(unit).to_seconds()
+    if unit_seconds <= 0:
+        raise InvalidConfigurationException("Invalid `unit` for rate")
+    spacing_seconds = Duration(spacing).to_seconds() if spacing else None
+    if spacing_seconds is not None and spacing_seconds <= 0:
+        raise InvalidConfigurationException("Invalid `spacing` for rate")
+
+    _logger.debug("Computing %s", mode.value)
+    counter = mode != RateMode.DERIVATIVE
+
+    # name => (last value, timestamp of the last value)
+    last = state if state is not None else MemoryStateStore()
+
+    async for event in stream:  # pragma: no cover
+        value = event["value"]
+        batch = isinstance(value, list)
+        values = value if batch else [value]
+        if not values or not all(is_number(element) for element in values):
+            _logger.debug("Dropping non-numeric event: %s", event)
+            continue
+
+        name = event["name"]
+        timestamp = event["timestamp"].timestamp()
+        previous = last.get(name)
+        if previous is not None and timestamp <= previous[1]:
+            _logger.debug("Dropping out-of-order event: %s", event)
+            continue
+        last.set(name, (values[-1], timestamp))
+
+        if previous is not None:
+            series = [previous[0]] + values
+            # readings in a batch are evenly spaced
+            interval = spacing_seconds or (timestamp - previous[1]) / len(values)
+        elif batch and len(values) > 1 and (spacing_seconds or mode == RateMode.DELTA):
+            # the first batch of a series is compared from its second reading
+            series = values
+            interval = spacing_seconds or 1.0
+        else:
+            continue
+
+        scale = 1.0 if mode == RateMode.DELTA else unit_seconds / interval
+        result = deltas(series, counter, wrap, scale)
+
+        yield {
+            "timestamp": event["timestamp"],
+            "name": f"{name}.{mode.value}",
+            "value": result if batch else result[0],
+        }
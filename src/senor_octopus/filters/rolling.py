@@ -0,0 +1,257 @@
+"""
+A filter that computes rolling statistics over the last values of each series.
+"""
+
+import logging
+import math
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Optional, Tuple
+
+import numpy as np
+from durations import Duration
+from marshmallow import Schema, fields, validate
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import MemoryStateStore, StateStore, configuration_schema
+from senor_octopus.types import Stream
+
+_logger = logging.getLogger(__name__)
+
+
+class RollingOperation(Enum):
+    """
+    Different rolling operations.
+    """
+
+    MEAN = "mean"
+    MEDIAN = "median"
+    MIN = "min"
+    MAX = "max"
+    ZSCORE = "zscore"
+
+
+class RollingSeries:  # pylint: disable=too-many-instance-attributes
+    """
+    The last values of a series, stored in a preallocated ring buffer.
+
+    Values are addressed by a sequence number, so that the window is the
+    range ``[start, end)`` and each value lives at ``sequence % size``. The
+    sum and the sum of squares are updated in O(1) when values enter or
+    leave the window, and recomputed every ``size`` evictions to avoid
+    accumulating floating point errors. The minimum and maximum use a
+    monotonic deque of sequence numbers, and the median is computed over the
+    buffer only when requested.
+    """
+
+    def __init__(self, operation: RollingOperation, size: int, timed: bool = False):
+        self.operation = operation
+        self.size = size
+        self.timed = timed
+        self.values = np.zeros(size)
+        # timestamps are only stored when the window has a period
+        self.timestamps = np.zeros(size if timed else 0)
+        self.start = 0
+        self.end = 0
+        self.total = 0.0
+        self.squares = 0.0
+
+        # candidates for the minimum (or maximum), in increasing sequence order
+        self.extremes: Deque[int] = deque()
+        # used to compute the median without allocating arrays
+        self.scratch = np.zeros(size if operation == RollingOperation.MEDIAN else 0)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def segments(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return views of the values in the window, without copying them.
+        """
+        first, last = self.start % self.size, self.end % self.size
+        if len(self) == 0:
+            return self.values[:0], self.values[:0]
+        if first < last:
+            return self.values[first:last], self.values[:0]
+        return self.values[first:], self.values[:last]
+
+    def add(self, value: float, timestamp: float = 0) -> None:
+        """
+        Add a value, evicting the oldest one if the buffer is full.
+        """
+        if len(self) == self.size:
+            self.evict()
+
+        position = self.end % self.size
+        self.values[position] = value
+        if self.timed:
+            self.timestamps[position] = timestamp
+        self.total += value
+        self.squares += value * value
+
+        if self.operation in {RollingOperation.MIN, RollingOperation.MAX}:
+            sign = 1 if self.operation == RollingOperation.MIN else -1
+            while (
+                self.extremes
+                and sign * self.values[self.extremes[-1] % self.size] >= sign * value
+            ):
+                self.extremes.pop()
+            self.extremes.append(self.end)
+
+        self.end += 1
+
+    def evict(self) -> None:
+        """
+        Remove the oldest value from the window.
+        """
+        value = float(self.values[self.start % self.size])
+        self.total -= value
+        self.squares -= value * value
+        if self.extremes and self.extremes[0] == self.start:
+            self.extremes.popleft()
+        self.start += 1
+
+        if self.start % self.size == 0:
+            first, second = self.segments()
+            self.total = float(first.sum() + second.sum())
+            self.squares = float(np.dot(first, first) + np.dot(second, second))
+
+    def expire(self, before: float) -> None:
+        """
+        Remove values older than a given time.
+        """
+        if not self.timed:
+            return
+        while len(self) and self.timestamps[self.start % self.size] < before:
+            self.evict()
+
+    def mean(self) -> float:
+        """
+        The mean of the values in the window.
+        """
+        return self.total / len(self)
+
+    def stddev(self) -> float:
+        """
+        The population standard deviation of the values in the window.
+        """
+        mean = self.mean()
+        return math.sqrt(max(self.squares / len(self) - mean * mean, 0))
+
+    def median(self) -> float:
+        """
+        The median of the values in the window.
+
+        The values are copied into the scratch buffer, which is then
+        partitioned in place.
+        """
+        first, second = self.segments()
+        scratch = self.scratch[: len(self)]
+        scratch[: len(first)] = first
+        scratch[len(first) :] = second
+        return float(np.median(scratch, overwrite_input=True))
+
+    def result(self, value: float) -> float:
+        """
+        Compute the operation, given the value that was just added.
+        """
+        if self.operation == RollingOperation.MEAN:
+            return self.mean()
+        if self.operation == RollingOperation.MEDIAN:
+            return self.median()
+        if self.operation == RollingOperation.ZSCORE:
+            stddev = self.stddev()
+            return (value - self.mean()) / stddev if stddev > 0 else 0.0
+        return float(self.values[self.extremes[0] % self.size])
+
+
+class RollingConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A filter that computes rolling statistics over the last values of each series.
+
+    For each event the operation is computed over the last ``size`` values
+    with the same name, optionally limited to values received in the last
+    ``period``. For example, to smooth temperature readings with the median
+    of the last 5 values:
+
+        operation: median
+        size: 5
+
+    Each series is kept in a preallocated ring buffer, so memory is fixed per
+    series. The emitted events have the name of the operation appended to the
+    original name, eg, ``hub.awair.temp.median``. Non-numeric values are
+    dropped.
+
+    The ``zscore`` operation returns how many standard deviations the value
+    is from the mean of the window, including the value itself.
+    """
+
+    operation = fields.Enum(
+        RollingOperation,
+        by_value=True,
+        required=True,
+        default=None,
+        title="Operation",
+        description="One of mean, median, min, max or zscore.",
+    )
+    size = fields.Integer(
+        required=False,
+        default=10,
+        validate=validate.Range(min=1),
+        title="Window size",
+        description="The maximum number of values in the window.",
+    )
+    period = fields.String(
+        required=False,
+        default=None,
+        title="Window period",
+        description=(
+            'If set, only values received in this period are used, eg, "5 minutes".'
+        ),
+    )
+
+
+@configuration_schema(RollingConfig())
+async def rolling(
+    stream: Stream,
+    operation: RollingOperation,
+    size: int = 10,
+    period: Optional[str] = None,
+    state: Optional[StateStore] = None,
+) -> Stream:
+    """
+    Compute rolling statistics over the last values of each series.
+    """
+    period_seconds = Duration(period).to_seconds() if period else None
+    if period_seconds is not None and period_seconds <= 0:
+        raise InvalidConfigurationException("Invalid `period` for rolling")
+
+    _logger.debug("Computing rolling %s", operation.value)
+    series = state if state is not None else MemoryStateStore()
+
+    async for event in stream:  # pragma: no cover
+        value: Any = event["value"]
+        if (
+            not isinstance(value, (int, float))
+            or isinstance(value, bool)
+            or math.isnan(value)
+        ):
+            _logger.debug("Dropping non-numeric event: %s", event)
+            continue
+
+        name = event["name"]
+        current = series.get(name)
+        if current is None:
+            current = RollingSeries(operation, size, period_seconds is not None)
+
+        timestamp = event["timestamp"].timestamp()
+        if period_seconds is not None:
+            current.expire(timestamp - period_seconds)
+        current.add(value, timestamp)
+        series.set(name, current)
+
+        yield {
+            "timestamp": event["timestamp"],
+            "name": f"{name}.{operation.value}",
+            "value": current.result(value),
+        }
@@ -2,12 +2,9 @@
 A filter that serializes the event value into different formats.
 """
 
-import json
 import logging
 
-import yaml
-
-from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.serialization import get_codec
 from senor_octopus.types import Stream
 
 _logger = logging.getLogger(__name__)
@@ -16,29 +13,24 @@ _logger = logging.getLogger(__name__)
 # pylint: disable=redefined-builtin
 async def serialize(stream: Stream, format: str) -> Stream:
     """
-    Parse an event value.
+    Serialize an event value.
 
     Parameters
     ----------
     format
-        The format of the payload ("JSON" or "YAML")
+        The format of the payload ("JSON", "YAML", "orjson", "msgpack" or
+        "CBOR"). Binary formats produce ``bytes``.
 
     Yields
     ------
     Event
         Events serialized by the filter
     """
-    _logger.debug("Applying template to events")
+    _logger.debug("Serializing events")
+    encode = get_codec(format).encode
     async for event in stream:  # pragma: no cover
-        if format.lower() == "json":
-            value = json.dumps(event["value"])
-        elif format.lower() == "yaml":
-            value = yaml.dump(event["value"])
-        else:
-            raise InvalidConfigurationException(f'Invalid format "{format}"')
-
         yield {
             "timestamp": event["timestamp"],
             "name": event["name"],
-            "value": value,
+            "value": encode(event["value"]),
         }
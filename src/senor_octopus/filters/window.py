@@ -0,0 +1,456 @@
+"""
+A filter that aggregates events over time windows.
+"""
+
+# pylint: disable=too-few-public-methods
+
+import heapq
+import logging
+import math
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from durations import Duration
+from marshmallow import Schema, fields
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.combine import (
+    Aggregation,
+    AggregationType,
+    aggregation_map,
+    update,
+)
+from senor_octopus.lib import configuration_schema
+from senor_octopus.types import Stream
+
+_logger = logging.getLogger(__name__)
+
+AggregationFactory = Callable[[], Aggregation]
+
+# a closed window: (end, result)
+Window = Tuple[float, Any]
+
+
+class WindowType(Enum):
+    """
+    Different types of windows.
+    """
+
+    TUMBLING = "tumbling"
+    HOPPING = "hopping"
+    SLIDING = "sliding"
+    SESSION = "session"
+
+
+class SlidingAggregation:
+    """
+    Aggregate over a FIFO queue of panes.
+
+    This uses the two-stacks algorithm: new panes are pushed into the back
+    stack, which keeps a running aggregate, and when the oldest pane needs to
+    be evicted the back stack is flipped into the front stack, storing suffix
+    aggregates. Pushing, evicting and querying all take amortized O(1) merges,
+    and work for any aggregation, including min and max.
+    """
+
+    def __init__(self, factory: AggregationFactory):
+        self.factory = factory
+        self.front: List[Tuple[float, Aggregation]] = []
+        self.back: List[Tuple[float, Aggregation]] = []
+        self.back_aggregate = factory()
+
+    def __len__(self) -> int:
+        return len(self.front) + len(self.back)
+
+    def push(self, start: float, pane: Aggregation) -> None:
+        """
+        Add the newest pane.
+        """
+        self.back.append((start, pane))
+        self.back_aggregate.merge(pane)
+
+    def evict(self, before: float) -> None:
+        """
+        Remove all panes that start before a given time.
+        """
+        while True:
+            if not self.front:
+                if not self.back:
+                    return
+                self._flip()
+            if self.front[-1][0] >= before:
+                return
+            self.front.pop()
+
+    def _flip(self) -> None:
+        suffix = self.factory()
+        for start, pane in reversed(self.back):
+            aggregate = self.factory()
+            aggregate.merge(pane)
+            aggregate.merge(suffix)
+            self.front.append((start, aggregate))
+            suffix = aggregate
+        self.back = []
+        self.back_aggregate = self.factory()
+
+    def query(self) -> Aggregation:
+        """
+        Aggregate all the panes in the queue.
+        """
+        aggregate = self.factory()
+        if self.front:
+            aggregate.merge(self.front[-1][1])
+        aggregate.merge(self.back_aggregate)
+        return aggregate
+
+
+class Series:
+    """
+    The window state for a single series of events.
+    """
+
+    def add(self, timestamp: float, value: Any, watermark: float) -> bool:
+        """
+        Add a value to the series, returning false if it arrived too late.
+        """
+        raise NotImplementedError
+
+    def advance(self, watermark: float) -> Iterator[Window]:
+        """
+        Close all windows that are complete given the watermark.
+        """
+        raise NotImplementedError
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """
+        The watermark needed to close the next window, if any.
+        """
+        raise NotImplementedError
+
+
+class HoppingSeries(Series):  # pylint: disable=too-many-instance-attributes
+    """
+    Hopping (and tumbling) windows for a series.
+
+    Values are aggregated into panes of size ``slide``. Once a pane can no
+    longer receive late values it's pushed into a sliding aggregation, and
+    each window is computed incrementally from the panes it covers.
+    """
+
+    def __init__(
+        self,
+        factory: AggregationFactory,
+        size: float,
+        slide: float,
+        lateness: float,
+    ):
+        self.factory = factory
+        self.size = size
+        self.slide = slide
+        self.lateness = lateness
+
+        self.panes: Dict[float, Aggregation] = {}
+        self.sliding = SlidingAggregation(factory)
+        self.next_end: Optional[float] = None
+        self.closed_until = -math.inf
+
+    def add(self, timestamp: float, value: Any, watermark: float) -> bool:
+        start = math.floor(timestamp / self.slide) * self.slide
+        if start < self.closed_until:
+            return False
+
+        if start not in self.panes:
+            self.panes[start] = self.factory()
+        update(self.panes[start], value)
+
+        if self.next_end is None:
+            self.next_end = start + self.slide
+        return True
+
+    def advance(self, watermark: float) -> Iterator[Window]:
+        while self.next_end is not None and self.next_end + self.lateness <= watermark:
+            end = self.next_end
+            for start in sorted(start for start in self.panes if start < end):
+                self.sliding.push(start, self.panes.pop(start))
+            self.sliding.evict(end - self.size)
+            if self.sliding:
+                yield end, self.sliding.query().result
+
+            self.closed_until = end
+            if self.sliding:
+                self.next_end = end + self.slide
+            elif self.panes:
+                # skip empty windows
+                self.next_end = min(self.panes) + self.slide
+            else:
+                self.next_end = None
+
+    @property
+    def deadline(self) -> Optional[float]:
+        if self.next_end is None:
+            return None
+        return self.next_end + self.lateness
+
+
+class Session:
+    """
+    A session window.
+    """
+
+    def __init__(self, start: float, aggregation: Aggregation):
+        self.start = start
+        self.end = start
+        self.aggregation = aggregation
+
+
+class SessionSeries(Series):
+    """
+    Session windows for a series.
+
+    A session is closed when no values are received for ``gap`` seconds.
+    Sessions are kept sorted by start time, and are merged when a late value
+    bridges them.
+    """
+
+    def __init__(self, factory: AggregationFactory, gap: float, lateness: float):
+        self.factory = factory
+        self.gap = gap
+        self.lateness = lateness
+        self.sessions: List[Session] = []
+
+    def add(self, timestamp: float, value: Any, watermark: float) -> bool:
+        overlapping = [
+            session
+            for session in self.sessions
+            if session.start - self.gap <= timestamp <= session.end + self.gap
+        ]
+
+        # fast path: the value extends an existing session
+        if len(overlapping) == 1 and overlapping[0].start <= timestamp:
+            session = overlapping[0]
+            update(session.aggregation, value)
+            session.end = max(session.end, timestamp)
+            return True
+
+        if not overlapping and timestamp + self.gap + self.lateness <= watermark:
+            return False
+
+        session = Session(timestamp, self.factory())
+        update(session.aggregation, value)
+        if overlapping:
+            parts = sorted(overlapping + [session], key=lambda part: part.start)
+            session = Session(parts[0].start, self.factory())
+            for part in parts:
+                session.aggregation.merge(part.aggregation)
+                session.end = max(session.end, part.end)
+            self.sessions = [
+                other for other in self.sessions if other not in overlapping
+            ]
+
+        self.sessions.append(session)
+        self.sessions.sort(key=lambda session: session.start)
+        return True
+
+    def advance(self, watermark: float) -> Iterator[Window]:
+        while (
+            self.sessions
+            and self.sessions[0].end + self.gap + self.lateness <= watermark
+        ):
+            session = self.sessions.pop(0)
+            yield session.end, session.aggregation.result
+
+    @property
+    def deadline(self) -> Optional[float]:
+        if not self.sessions:
+            return None
+        return min(session.end for session in self.sessions) + self.gap + self.lateness
+
+
+class WindowConfig(Schema):
+    """
+    A filter that aggregates events over time windows.
+
+    Events are grouped by name, and their values are aggregated over windows
+    based on the event timestamp:
+
+        - ``tumbling`` windows have a fixed ``size`` and don't overlap;
+        - ``hopping`` (or ``sliding``) windows have a fixed ``size`` and start
+          every ``slide``, so they can overlap;
+        - ``session`` windows group events until there is a ``gap`` with no
+          events.
+
+    For example, to compute the 5-minute average of CO2 every minute:
+
+        window: hopping
+        size: 5 minutes
+        slide: 1 minute
+        aggregation: average
+
+    A window is emitted once the watermark (the most recent timestamp seen)
+    passes its end plus the allowed ``lateness``. Events that arrive after
+    their window was emitted are dropped. All open windows are emitted when
+    the stream ends.
+
+    The emitted events have the timestamp of the end of the window, and the
+    name of the aggregation appended to the original name, eg,
+    ``hub.awair.co2.average``.
+    """
+
+    window = fields.Enum(
+        WindowType,
+        by_value=True,
+        required=True,
+        default=None,
+        title="Type of window",
+        description="One of tumbling, hopping, sliding or session.",
+    )
+    aggregation = fields.Enum(
+        AggregationType,
+        by_value=True,
+        required=True,
+        default=None,
+        title="Aggregation",
+        description="The aggregation computed over the values of each window.",
+    )
+    size = fields.String(
+        required=False,
+        default=None,
+        title="Window size",
+        description='The size of tumbling and hopping windows, eg, "5 minutes".',
+    )
+    slide = fields.String(
+        required=False,
+        default=None,
+        title="Window slide",
+        description=(
+            "How often hopping windows start. The window size must be a "
+            "multiple of the slide."
+        ),
+    )
+    gap = fields.String(
+        required=False,
+        default=None,
+        title="Session gap",
+        description="The period without events that closes a session window.",
+    )
+    lateness = fields.String(
+        required=False,
+        default=None,
+        title="Allowed lateness",
+        description="How long to wait for out-of-order events before emitting.",
+    )
+
+
+def to_seconds(duration: Optional[str], name: str) -> float:
+    """
+    Convert a required duration to seconds.
+    """
+    if not duration:
+        raise InvalidConfigurationException(f"Missing `{name}` for window")
+    seconds = Duration(duration).to_seconds()
+    if seconds <= 0:
+        raise InvalidConfigurationException(f"Invalid `{name}` for window")
+    return seconds
+
+
+def build_series_factory(  # pylint: disable=too-many-arguments
+    window_type: WindowType,
+    factory: AggregationFactory,
+    size: Optional[str],
+    slide: Optional[str],
+    gap: Optional[str],
+    lateness: float,
+) -> Callable[[], Series]:
+    """
+    Build a function that creates the window state for new series.
+    """
+    if window_type == WindowType.SESSION:
+        gap_seconds = to_seconds(gap, "gap")
+        return lambda: SessionSeries(factory, gap_seconds, lateness)
+
+    size_seconds = to_seconds(size, "size")
+    if window_type == WindowType.TUMBLING:
+        slide_seconds = size_seconds
+    else:
+        slide_seconds = to_seconds(slide, "slide")
+        panes = size_seconds / slide_seconds
+        if not math.isclose(panes, round(panes)) or panes < 1:
+            raise InvalidConfigurationException(
+                "Window size must be a multiple of the slide",
+            )
+
+    return lambda: HoppingSeries(factory, size_seconds, slide_seconds, lateness)
+
+
+@configuration_schema(WindowConfig())
+async def window(  # pylint: disable=too-many-arguments, too-many-locals
+    stream: Stream,
+    window: WindowType,  # pylint: disable=redefined-outer-name
+    aggregation: AggregationType,
+    size: Optional[str] = None,
+    slide: Optional[str] = None,
+    gap: Optional[str] = None,
+    lateness: Optional[str] = None,
+) -> Stream:
+    """
+    Aggregate events over time windows.
+    """
+    _logger.debug("Aggregating events over windows")
+    factory = aggregation_map[aggregation]
+    lateness_seconds = Duration(lateness).to_seconds() if lateness else 0
+    build_series = build_series_factory(
+        window,
+        factory,
+        size,
+        slide,
+        gap,
+        lateness_seconds,
+    )
+
+    series: Dict[str, Series] = {}
+    scheduled: Dict[str, float] = {}
+    deadlines: List[Tuple[float, str]] = []
+    watermark = -math.inf
+
+    def schedule(name: str) -> None:
+        deadline = series[name].deadline
+        if deadline is None:
+            # nothing left to emit, free the state
+            del series[name]
+            scheduled.pop(name, None)
+        elif name not in scheduled or deadline < scheduled[name]:
+            scheduled[name] = deadline
+            heapq.heappush(deadlines, (deadline, name))
+
+    def emit(name: str, end: float, result: Any) -> Dict[str, Any]:
+        return {
+            "timestamp": datetime.fromtimestamp(end, timezone.utc),
+            "name": f"{name}.{aggregation.value}",
+            "value": result,
+        }
+
+    async for event in stream:  # pragma: no cover
+        name = event["name"]
+        timestamp = event["timestamp"].timestamp()
+
+        if name not in series:
+            series[name] = build_series()
+        if not series[name].add(timestamp, event["value"], watermark):
+            _logger.debug("Dropping late event: %s", event)
+        schedule(name)
+
+        watermark = max(watermark, timestamp)
+        while deadlines and deadlines[0][0] <= watermark:
+            deadline, name = heapq.heappop(deadlines)
+            if scheduled.get(name) != deadline:
+                continue
+            del scheduled[name]
+            for end, result in series[name].advance(watermark):
+                yield emit(name, end, result)
+            schedule(name)
+
+    for name in sorted(series, key=lambda name: scheduled[name]):
+        for end, result in series[name].advance(math.inf):
+            yield emit(name, end, result)
@@ -3,6 +3,7 @@ Functions for building a DAG.
 """
 
 import asyncio
+import inspect
 import logging
 from typing import Any, Dict, List, Optional, Set, Tuple, Union, cast
 
@@ -13,7 +14,7 @@ from durations import Duration
 from pkg_resources import iter_entry_points
 
 from senor_octopus.exceptions import InvalidConfigurationException
-from senor_octopus.lib import build_marshmallow_schema
+from senor_octopus.lib import StateStore, build_marshmallow_schema, open_state_store
 from senor_octopus.types import (
     Event,
     FilterCallable,
@@ -87,12 +88,32 @@ class Node:  # pylint: disable=too-few-public-methods
         return Filter(node_name, plugin, **kwargs)
 
 
+def get_state(
+    node_name: str,
+    plugin: Union[SourceCallable, FilterCallable],
+    state: Optional[str],
+) -> Dict[str, StateStore]:
+    """
+    Return the state store argument for a plugin, if it's stateful.
+    """
+    if "state" in inspect.signature(plugin).parameters:
+        return {"state": open_state_store(state, node_name)}
+    if state is not None:
+        raise InvalidConfigurationException(
+            f'Node "{node_name}" has a `state`, but its plugin is not stateful',
+        )
+    return {}
+
+
 class Source(Node):
     """
     A source node.
 
     A source node has no parents, and can optionally have a schedule for it to
     run periodically, cascading the events down the graph.
+
+    Like filters, stateful sources receive a store that keeps their state
+    between runs, persisted when ``state`` has the path to a database.
     """
 
     def __init__(
@@ -100,6 +121,7 @@ class Source(Node):
         node_name: str,
         plugin: SourceCallable,
         schedule: Optional[str] = None,
+        state: Optional[str] = None,
         **kwargs: Any,
     ):
         super().__init__(node_name)
@@ -107,6 +129,7 @@ class Source(Node):
         self.plugin = plugin
         self.schedule = CronTab(schedule) if schedule else None
         self.kwargs = plugin.configuration_schema.load(kwargs)
+        self.kwargs.update(get_state(node_name, plugin, state))
 
     async def run(self) -> None:
         """
@@ -133,13 +156,25 @@ class Filter(Node):
 
     Filters will receive events from their parents, and can return them down
     to their children, modified or filtered.
+
+    Stateful filters (plugins with a ``state`` argument) receive a store that
+    keeps their state between runs. The store is in memory, unless ``state``
+    has the path to an SQLite database, where the state is persisted so that
+    it survives restarts.
     """
 
-    def __init__(self, node_name: str, plugin: FilterCallable, **kwargs: Any):
+    def __init__(
+        self,
+        node_name: str,
+        plugin: FilterCallable,
+        state: Optional[str] = None,
+        **kwargs: Any,
+    ):
         super().__init__(node_name)
 
         self.plugin = plugin
         self.kwargs = plugin.configuration_schema.load(kwargs)
+        self.kwargs.update(get_state(node_name, plugin, state))
 
     async def run(self, stream: Stream) -> None:
         """
@@ -6,11 +6,19 @@ from __future__ import annotations
 
 import asyncio
 import inspect
+import logging
+import pickle
+import sqlite3
+import threading
+import time
 from asyncio.futures import Future
+from concurrent import futures
 from io import StringIO
 from typing import (
     TYPE_CHECKING,
     Any,
+    AsyncGenerator,
+    Awaitable,
     Callable,
     Dict,
     List,
@@ -31,6 +39,8 @@ from senor_octopus.types import Event, Stream
 if TYPE_CHECKING:  # pragma: no cover
     from senor_octopus.graph import Node, Source
 
+_logger = logging.getLogger(__name__)
+
 
 def flatten(
     obj: Dict[str, Any],
@@ -124,6 +134,323 @@ async def merge_streams(*streams: Stream) -> Stream:
             yield event
 
 
+async def heartbeat(
+    stream: Stream,
+    interval: Optional[float],
+) -> AsyncGenerator[Optional[Event], None]:
+    """
+    Yield events from a stream, and ``None`` when no events arrive in time.
+
+    Every time ``interval`` seconds pass without a new event a ``None`` is
+    yielded, so that stateful filters can do periodic work (eg, flushing idle
+    state) while the stream is quiet. The pending read is not canceled.
+    """
+    if interval is None:
+        async for event in stream:
+            yield event
+        return
+
+    future: Optional[Future[Event]] = None
+    try:
+        while True:
+            if future is None:
+                future = asyncio.ensure_future(anext_(stream))
+
+            done, _ = await asyncio.wait({future}, timeout=interval)
+            if not done:
+                yield None
+                continue
+
+            try:
+                event = future.result()
+            except StopAsyncIteration:
+                return
+            future = None
+            yield event
+    finally:
+        if future is not None and not future.done():
+            future.cancel()
+
+
+class StateStore:
+    """
+    A key-value store for the state of filters.
+
+    Filters that accept a ``state`` argument receive a store namespaced by the
+    node name, so that their state survives between runs and, with a
+    persistent backend, between restarts.
+    """
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """
+        Return the value for a key.
+        """
+        raise NotImplementedError
+
+    def set(self, key: Any, value: Any) -> None:
+        """
+        Set the value for a key.
+
+        Values are stored by reference, so mutating a value after setting it
+        also updates the stored state.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: Any) -> None:
+        """
+        Remove a key, if present.
+        """
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """
+        Persist pending changes.
+        """
+
+    def close(self) -> None:
+        """
+        Persist pending changes and release resources.
+        """
+        self.flush()
+
+
+class MemoryStateStore(StateStore):
+    """
+    A state store that keeps everything in memory.
+    """
+
+    def __init__(self) -> None:
+        self.data: Dict[Any, Any] = {}
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def set(self, key: Any, value: Any) -> None:
+        self.data[key] = value
+
+    def delete(self, key: Any) -> None:
+        self.data.pop(key, None)
+
+
+# marks keys that are known to be missing from the database
+MISSING = object()
+
+
+class SQLiteStateStore(StateStore):  # pylint: disable=too-many-instance-attributes
+    """
+    A state store backed by SQLite.
+
+    Reads and writes only touch an in-memory cache. Keys are loaded lazily
+    from the database the first time they are read, and changes are written
+    behind: modified keys are tracked, and written in a single transaction
+    ``interval`` seconds after the first change, when the store is flushed,
+    or when it's closed. Values are pickled when written, so they can be any
+    picklable object, like aggregations.
+
+    When an event loop is running a timer flushes the changes, even if the
+    store is not modified again, and transactions are committed in a
+    background thread so they don't block the loop.
+    """
+
+    def __init__(self, path: str, namespace: str, interval: float = 5.0):
+        self.namespace = namespace
+        self.interval = interval
+
+        # a single thread commits the changes, so they're written in order
+        self.executor = futures.ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """,
+        )
+        self.connection.commit()
+
+        self.cache: Dict[Any, Any] = {}
+        self.dirty: Set[Any] = set()
+        self.last_flush = time.monotonic()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if key not in self.cache:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ?",
+                    (self.namespace, repr(key)),
+                ).fetchone()
+            self.cache[key] = pickle.loads(row[0]) if row else MISSING
+
+        value = self.cache[key]
+        return default if value is MISSING else value
+
+    def set(self, key: Any, value: Any) -> None:
+        self.cache[key] = value
+        self.dirty.add(key)
+        self.maybe_flush()
+
+    def delete(self, key: Any) -> None:
+        self.cache[key] = MISSING
+        self.dirty.add(key)
+        self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        """
+        Schedule a flush of the changes.
+
+        Without a running event loop changes are flushed synchronously, if the
+        interval has passed since the last flush.
+        """
+        if self.timer is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if time.monotonic() - self.last_flush >= self.interval:
+                self.flush()
+            return
+
+        delay = max(0, self.last_flush + self.interval - time.monotonic())
+        self.timer = loop.call_later(delay, self.flush_in_background)
+
+    def flush_in_background(self) -> None:
+        """
+        Commit the changes in the background thread.
+        """
+        self.timer = None
+        self.last_flush = time.monotonic()
+        future = self.executor.submit(self.write, *self.collect_changes())
+        future.add_done_callback(log_write_errors)
+
+    def collect_changes(
+        self,
+    ) -> Tuple[List[Tuple[str, str, bytes]], List[Tuple[str, str]]]:
+        """
+        Serialize the modified keys, returning the rows to upsert and delete.
+
+        Values are pickled in the calling thread, so that they're not
+        modified while they're serialized.
+        """
+        upserts = []
+        deletes = []
+        for key in self.dirty:
+            value = self.cache[key]
+            if value is MISSING:
+                deletes.append((self.namespace, repr(key)))
+            else:
+                upserts.append(
+                    (self.namespace, repr(key), pickle.dumps(value, protocol=-1)),
+                )
+        self.dirty = set()
+        return upserts, deletes
+
+    def write(
+        self,
+        upserts: List[Tuple[str, str, bytes]],
+        deletes: List[Tuple[str, str]],
+    ) -> None:
+        """
+        Write changes to the database in a single transaction.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+                upserts,
+            )
+            self.connection.executemany(
+                "DELETE FROM state WHERE namespace = ? AND key = ?",
+                deletes,
+            )
+        _logger.debug(
+            "Flushed %d keys from %s",
+            len(upserts) + len(deletes),
+            self.namespace,
+        )
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.last_flush = time.monotonic()
+        if not self.dirty:
+            return
+
+        # wait for pending background writes, so that changes are not reordered
+        self.executor.submit(self.write, *self.collect_changes()).result()
+
+    def close(self) -> None:
+        self.flush()
+        self.executor.shutdown()
+        self.connection.close()
+
+
+def log_write_errors(future: futures.Future[None]) -> None:
+    """
+    Log errors from background writes, which are otherwise lost.
+    """
+    exception = future.exception()
+    if exception is not None:
+        _logger.error("Unable to persist state: %s", exception)
+
+
+state_stores: Dict[Tuple[Optional[str], str], StateStore] = {}
+
+
+def open_state_store(path: Optional[str], namespace: str) -> StateStore:
+    """
+    Return the state store for a given namespace.
+
+    Stores are kept in memory unless a path to an SQLite database is given.
+    The same store is returned for a given path and namespace, so that the
+    state is shared between runs of a filter.
+    """
+    if (path, namespace) not in state_stores:
+        state_stores[(path, namespace)] = (
+            SQLiteStateStore(path, namespace) if path else MemoryStateStore()
+        )
+    return state_stores[(path, namespace)]
+
+
+def close_state_stores() -> None:
+    """
+    Close all the state stores, persisting pending changes.
+    """
+    while state_stores:
+        _, store = state_stores.popitem()
+        store.close()
+
+
+# callbacks that release resources shared between runs, eg, connection pools
+shutdown_callbacks: List[Callable[[], Awaitable[None]]] = []
+
+
+def on_shutdown(callback: Callable[[], Awaitable[None]]) -> None:
+    """
+    Register a coroutine function to be called when the scheduler stops.
+    """
+    if callback not in shutdown_callbacks:
+        shutdown_callbacks.append(callback)
+
+
+async def run_shutdown_callbacks() -> None:
+    """
+    Call the shutdown callbacks, in reverse order of registration.
+    """
+    while shutdown_callbacks:
+        callback = shutdown_callbacks.pop()
+        try:
+            await callback()
+        except Exception:  # pylint: disable=broad-except
+            _logger.exception("Error running shutdown callback")
+
+
 Plugin = TypeVar("Plugin", bound=Callable[..., Optional[Stream]])
 
 
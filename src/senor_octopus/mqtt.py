@@ -0,0 +1,322 @@
+"""
+Shared connections to MQTT brokers.
+
+All the MQTT sources and sinks connecting to the same broker with the same
+credentials and client ID share a single connection. Messages are received in a single loop
+per connection, and routed to the subscribers through a topic trie.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from asyncio_mqtt import Client, MqttError
+from paho.mqtt.client import MQTTMessage
+
+from senor_octopus.lib import on_shutdown
+
+_logger = logging.getLogger(__name__)
+
+
+class TopicTrie:
+    """
+    A trie of topic filters, supporting the ``+`` and ``#`` wildcards.
+
+    Each level of a topic is a node in the trie, so that finding the
+    subscribers for a topic takes time proportional to the number of levels,
+    instead of testing every filter.
+    """
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "TopicTrie"] = {}
+        self.subscribers: List[Any] = []
+
+    def insert(self, topic_filter: str, subscriber: Any) -> None:
+        """
+        Add a subscriber to a topic filter.
+        """
+        node = self
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, TopicTrie())
+        node.subscribers.append(subscriber)
+
+    def remove(self, topic_filter: str, subscriber: Any) -> None:
+        """
+        Remove a subscriber from a topic filter, pruning empty nodes.
+        """
+        levels = topic_filter.split("/")
+        path = [self]
+        for level in levels:
+            if level not in path[-1].children:
+                return
+            path.append(path[-1].children[level])
+
+        if subscriber in path[-1].subscribers:
+            path[-1].subscribers.remove(subscriber)
+        for parent, node, level in zip(path[-2::-1], path[:0:-1], levels[::-1]):
+            if node.subscribers or node.children:
+                break
+            del parent.children[level]
+
+    def __contains__(self, topic_filter: str) -> bool:
+        """
+        Check if a topic filter has subscribers.
+        """
+        node = self
+        for level in topic_filter.split("/"):
+            if level not in node.children:
+                return False
+            node = node.children[level]
+        return bool(node.subscribers)
+
+    def filters(self, prefix: str = "") -> List[str]:
+        """
+        Return all the topic filters with subscribers.
+        """
+        result = []
+        for level, node in self.children.items():
+            topic_filter = f"{prefix}/{level}" if prefix else level
+            if node.subscribers:
+                result.append(topic_filter)
+            result.extend(node.filters(topic_filter))
+        return result
+
+    def match(self, topic: str) -> Set[Any]:
+        """
+        Return the subscribers of all the filters matching a topic.
+        """
+        matches: Set[Any] = set()
+        nodes = [self]
+        levels = topic.split("/")
+        for i, level in enumerate(levels):
+            next_nodes = []
+            for node in nodes:
+                # ``#`` matches the remaining levels, but wildcards don't match
+                # topics starting with ``$``, like ``$SYS``
+                wildcards = not (i == 0 and level.startswith("$"))
+                if wildcards and "#" in node.children:
+                    matches.update(node.children["#"].subscribers)
+                if level in node.children:
+                    next_nodes.append(node.children[level])
+                if wildcards and "+" in node.children:
+                    next_nodes.append(node.children["+"])
+            nodes = next_nodes
+
+        for node in nodes:
+            matches.update(node.subscribers)
+            # ``a/#`` also matches ``a``
+            if "#" in node.children:
+                matches.update(node.children["#"].subscribers)
+        return matches
+
+
+class Connection:  # pylint: disable=too-many-instance-attributes
+    """
+    A connection to an MQTT broker, shared between sources and sinks.
+
+    The connection is opened when first used, and reopened after errors. A
+    single loop receives all the messages and puts them in the queues of the
+    subscribers whose filters match the topic.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        host: str,
+        port: int = 1883,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        client_id: Optional[str] = None,
+        reconnect_interval: float = 3,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.client_id = client_id
+        self.reconnect_interval = reconnect_interval
+
+        self.trie = TopicTrie()
+        self.client: Optional[Client] = None
+        self.connected = asyncio.Event()
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        """
+        Start the receive loop, if it's not running.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        """
+        Connect to the broker and dispatch messages, reconnecting on errors.
+        """
+        while True:
+            _logger.info("Connecting to MQTT server %s:%s", self.host, self.port)
+            try:
+                async with Client(
+                    self.host,
+                    self.port,
+                    username=self.username,
+                    password=self.password,
+                    client_id=self.client_id,
+                    # persistent sessions require a client ID
+                    clean_session=self.client_id is None,
+                ) as client:
+                    async with client.unfiltered_messages() as messages:
+                        for topic_filter in self.trie.filters():
+                            await client.subscribe(topic_filter, qos=1)
+                        self.client = client
+                        self.connected.set()
+                        async for message in messages:
+                            self.dispatch(message)
+            except MqttError as error:
+                _logger.warning(
+                    'Error "%s". Reconnecting in %s seconds.',
+                    error,
+                    self.reconnect_interval,
+                )
+            except Exception:  # pylint: disable=broad-except
+                # keep the connection alive for the other subscribers
+                _logger.exception(
+                    "Unexpected error. Reconnecting in %s seconds.",
+                    self.reconnect_interval,
+                )
+            finally:
+                self.client = None
+                self.connected.clear()
+            await asyncio.sleep(self.reconnect_interval)
+
+    def dispatch(self, message: MQTTMessage) -> None:
+        """
+        Send a message to the subscribers of its topic.
+        """
+        for queue in self.trie.match(message.topic):
+            queue.put_nowait(message)
+
+    @asynccontextmanager
+    async def subscribe(
+        self, topics: List[str]
+    ) -> AsyncIterator["asyncio.Queue[MQTTMessage]"]:
+        """
+        Subscribe to topic filters, returning a queue with the messages.
+        """
+        queue: "asyncio.Queue[MQTTMessage]" = asyncio.Queue()
+        new = [topic for topic in topics if topic not in self.trie]
+        for topic in topics:
+            self.trie.insert(topic, queue)
+        self.start()
+
+        # if not connected the filters are subscribed when the connection opens
+        if self.client is not None:
+            for topic in new:
+                _logger.debug("Subscribing to topic: %s", topic)
+                await self.client.subscribe(topic, qos=1)
+
+        try:
+            yield queue
+        finally:
+            for topic in topics:
+                self.trie.remove(topic, queue)
+            unused = [topic for topic in topics if topic not in self.trie]
+            if self.client is not None and unused:
+                _logger.debug("Unsubscribing from topics: %s", unused)
+                try:
+                    await self.client.unsubscribe(unused)
+                except MqttError as error:
+                    _logger.warning('Error "%s" unsubscribing', error)
+
+    async def publish(
+        self,
+        topic: str,
+        payload: Any,
+        qos: int = 1,
+        retries: int = 3,
+    ) -> None:
+        """
+        Publish a message, waiting for the connection if needed.
+
+        If publishing fails, eg, because the connection was lost, the message
+        is published again once the connection is reopened, up to ``retries``
+        times.
+        """
+        self.start()
+        attempts = 0
+        while True:
+            await self.connected.wait()
+            try:
+                await self.client.publish(topic, payload, qos=qos)  # type: ignore
+                return
+            except MqttError as error:
+                if attempts == retries:
+                    raise
+                attempts += 1
+                _logger.warning(
+                    'Error "%s" publishing to %s. Retrying in %s seconds.',
+                    error,
+                    topic,
+                    self.reconnect_interval,
+                )
+                await asyncio.sleep(self.reconnect_interval)
+
+    async def close(self) -> None:
+        """
+        Stop the receive loop and disconnect.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+ConnectionKey = Tuple[str, int, Optional[str], Optional[str], Optional[str]]
+connections: Dict[ConnectionKey, Connection] = {}
+
+
+def get_connection(  # pylint: disable=too-many-arguments
+    host: str,
+    port: int = 1883,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    client_id: Optional[str] = None,
+    reconnect_interval: float = 3,
+) -> Connection:
+    """
+    Return the shared connection to a broker.
+
+    Connections are shared between nodes with the same broker, credentials
+    and client ID, since a client ID identifies a persistent session. Nodes
+    without a client ID, like sinks, share any existing connection to the
+    broker. The reconnect interval is taken from the node that first opens
+    the connection.
+    """
+    key = (host, port, username, password, client_id)
+    if client_id is None:
+        for other_key, connection in connections.items():
+            if other_key[:4] == key[:4]:
+                return connection
+
+    if key not in connections:
+        connections[key] = Connection(
+            host,
+            port,
+            username,
+            password,
+            client_id,
+            reconnect_interval,
+        )
+        on_shutdown(close_connections)
+    return connections[key]
+
+
+async def close_connections() -> None:
+    """
+    Close all the shared connections.
+    """
+    closing = list(connections.values())
+    connections.clear()
+    await asyncio.gather(*(connection.close() for connection in closing))
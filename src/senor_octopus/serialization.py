@@ -0,0 +1,123 @@
+"""
+Codecs for serializing and deserializing event values.
+
+Codecs are resolved once per node, so that the per-event work is a single
+function call. Binary formats (``orjson``, ``msgpack`` and ``cbor``) depend
+on optional packages, and are only available when those are installed.
+"""
+
+# pylint: disable=redefined-builtin
+
+import json
+from functools import partial
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+import yaml
+
+from senor_octopus.exceptions import InvalidConfigurationException
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+# use the libyaml bindings when available
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+Payload = Union[str, bytes, bytearray, memoryview]
+Encoder = Callable[[Any], Union[str, bytes]]
+Decoder = Callable[[Payload], Any]
+
+
+class Codec(NamedTuple):
+    """
+    A pair of functions for encoding and decoding values.
+    """
+
+    encode: Encoder
+    decode: Decoder
+
+
+def to_bytes(payload: Payload) -> Union[str, bytes, bytearray]:
+    """
+    Convert a ``memoryview`` to bytes, for decoders that don't support it.
+    """
+    if isinstance(payload, memoryview):
+        return payload.tobytes()
+    return payload
+
+
+def json_loads(payload: Payload) -> Any:
+    """
+    Decode a JSON payload using the standard library.
+    """
+    return json.loads(to_bytes(payload))
+
+
+def yaml_dump(value: Any) -> str:
+    """
+    Encode a value as YAML.
+    """
+    return yaml.dump(value, Dumper=SafeDumper)
+
+
+def yaml_load(payload: Payload) -> Any:
+    """
+    Decode a YAML payload.
+    """
+    return yaml.load(to_bytes(payload), Loader=SafeLoader)
+
+
+def require(module: Optional[Any], package: str, format: str) -> Any:
+    """
+    Ensure that the package needed by a given format is installed.
+    """
+    if module is None:
+        raise InvalidConfigurationException(
+            f'Format "{format}" requires the `{package}` package',
+        )
+    return module
+
+
+def get_codec(format: str) -> Codec:
+    """
+    Return the codec for a given format.
+
+    Supported formats are "JSON", "YAML", "orjson", "msgpack" and "CBOR".
+    The names are case insensitive.
+    """
+    name = format.lower()
+
+    if name == "json":
+        return Codec(json.dumps, json_loads)
+
+    if name == "yaml":
+        return Codec(yaml_dump, yaml_load)
+
+    if name == "orjson":
+        module = require(orjson, "orjson", format)
+        return Codec(module.dumps, module.loads)  # pylint: disable=no-member
+
+    if name == "msgpack":
+        module = require(msgpack, "msgpack", format)
+        return Codec(
+            partial(module.packb, datetime=True),
+            partial(module.unpackb, timestamp=3),
+        )
+
+    if name == "cbor":
+        module = require(cbor2, "cbor2", format)
+        return Codec(module.dumps, module.loads)
+
+    raise InvalidConfigurationException(f'Invalid format "{format}"')
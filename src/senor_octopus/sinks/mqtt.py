@@ -2,17 +2,126 @@
 A sink that sends events to an MQTT topic.
 """
 
+import asyncio
 import logging
-from typing import Optional
+from string import Formatter
+from typing import Any, Optional, Set
 
-from asyncio_mqtt import Client
+from asyncio_mqtt import MqttError
+from marshmallow import Schema, fields, validate
 
-from senor_octopus.types import Stream
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import configuration_schema
+from senor_octopus.mqtt import Connection, get_connection
+from senor_octopus.types import Event, Stream
 
 _logger = logging.getLogger(__name__)
 
+TEMPLATE_FIELDS = {"name", "timestamp", "value"}
 
-async def mqtt(  # pylint: disable=too-many-arguments
+
+class MqttConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A sink that sends events to an MQTT topic.
+    """
+
+    topic = fields.String(
+        required=True,
+        default=None,
+        title="Topic",
+        description=(
+            "The MQTT topic where messages are sent to. It can be a template, "
+            'eg, "sensors/{name}".'
+        ),
+    )
+    host = fields.String(
+        required=False,
+        default="localhost",
+        title="Host",
+        description="Host where the MQTT server is running.",
+    )
+    port = fields.Integer(
+        required=False,
+        default=1883,
+        title="Port",
+        description="Port which the MQTT server is listening to.",
+    )
+    username = fields.String(
+        required=False,
+        default=None,
+        title="Username",
+        description="Optional username to use when connecting to the MQTT server.",
+    )
+    password = fields.String(
+        required=False,
+        default=None,
+        title="Password",
+        description="Optional password to use when connecting to the MQTT server.",
+    )
+    qos = fields.Integer(
+        required=False,
+        default=1,
+        validate=validate.OneOf([0, 1, 2]),
+        title="QoS",
+        description="Quality of Service (QoS) level.",
+    )
+    max_in_flight = fields.Integer(
+        required=False,
+        default=100,
+        validate=validate.Range(min=1),
+        title="Maximum in-flight messages",
+        description="Number of messages published without waiting for confirmation.",
+    )
+
+
+def check_template(topic: str) -> bool:
+    """
+    Validate a topic template, returning true if it has fields.
+    """
+    names = {
+        field_name.split(".")[0].split("[")[0]
+        for _, field_name, _, _ in Formatter().parse(topic)
+        if field_name is not None
+    }
+    invalid = names - TEMPLATE_FIELDS
+    if invalid:
+        raise InvalidConfigurationException(
+            f"Invalid fields in topic template: {', '.join(sorted(invalid))}",
+        )
+    return bool(names)
+
+
+def get_topic(topic: str, event: Event) -> Optional[str]:
+    """
+    Render the topic template for an event.
+    """
+    try:
+        return topic.format_map(event)
+    except (LookupError, TypeError) as ex:
+        _logger.warning('Unable to build topic "%s" for event %s: %s', topic, event, ex)
+        return None
+
+
+async def publish(
+    connection: Connection,
+    window: asyncio.Semaphore,
+    topic: str,
+    value: Any,
+    qos: int,
+) -> None:
+    """
+    Publish a message, releasing its slot in the window when done.
+    """
+    try:
+        await connection.publish(topic, value, qos=qos)
+    except MqttError as error:
+        _logger.warning('Error "%s" publishing to %s, dropping message', error, topic)
+    finally:
+        window.release()
+
+
+@configuration_schema(MqttConfig())
+async def mqtt(  # pylint: disable=too-many-arguments, too-many-locals
     stream: Stream,
     topic: str,
     host: str = "localhost",
@@ -20,20 +129,29 @@ async def mqtt(  # pylint: disable=too-many-arguments
     username: Optional[str] = None,
     password: Optional[str] = None,
     qos: int = 1,
+    max_in_flight: int = 100,
 ) -> None:
     """
     Send events as messages to an MQTT topic.
 
     This sink can be used to send events to an MQTT topic.
     The value of the event is sent as the message; its name
-    is ignored.
+    is ignored, unless used in the topic.
+
+    The topic can be a template with the fields of the event, so that a
+    single sink can send messages to many topics, eg, ``sensors/{name}``.
+
+    The connection to the server is kept open between runs, and shared with
+    other MQTT sources and sinks using the same server and credentials. Up to
+    ``max_in_flight`` messages are published concurrently, instead of waiting
+    for each one to be acknowledged before sending the next.
 
     Parameters
     ----------
     stream
         The incoming stream of events
     topic
-        The MQTT topic where messages are sent to
+        The MQTT topic where messages are sent to, optionally a template
     host
         Host where the MQTT server is running
     port
@@ -44,13 +162,30 @@ async def mqtt(  # pylint: disable=too-many-arguments
         Optional password to use when connecting to the MQTT server
     qos
         Quality of Service (QoS) level
+    max_in_flight
+        Number of messages published without waiting for confirmation
     """
-    async with Client(host, port, username=username, password=password) as client:
-        async for event in stream:  # pragma: no cover
-            value = event["value"]
-            if (
-                not isinstance(value, (str, bytearray, int, float))
-                and value is not None
-            ):
-                value = str(value)
-            await client.publish(topic, value, qos=qos)
+    is_template = check_template(topic)
+    connection = get_connection(host, port, username, password)
+    window = asyncio.Semaphore(max_in_flight)
+    pending: Set["asyncio.Task[None]"] = set()
+
+    async for event in stream:
+        target = get_topic(topic, event) if is_template else topic
+        if target is None:
+            continue
+
+        value = event["value"]
+        if (
+            not isinstance(value, (str, bytes, bytearray, int, float))
+            and value is not None
+        ):
+            value = str(value)
+
+        await window.acquire()
+        task = asyncio.create_task(publish(connection, window, target, value, qos))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    # wait for the messages still in flight
+    await asyncio.gather(*pending)
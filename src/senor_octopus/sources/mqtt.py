@@ -2,24 +2,135 @@
 A source that subscribes to one or more MQTT topics.
 """
 
-import asyncio
 import json
 import logging
 from datetime import datetime, timezone
-from typing import AsyncGenerator, List, Optional
+from typing import Any, Callable, List, Optional
 
-from asyncio_mqtt import Client, MqttError
-from paho.mqtt.client import MQTTMessage
+from marshmallow import Schema, fields, validate
 
-from senor_octopus.lib import merge_streams
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import configuration_schema
+from senor_octopus.mqtt import get_connection
 from senor_octopus.types import Stream
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 _logger = logging.getLogger(__name__)
 
-MessageStream = AsyncGenerator[MQTTMessage, None]
+# ``orjson`` parses bytes directly, and is much faster than ``json``
+json_loads: Callable[[bytes], Any]
+if orjson:
+    json_loads = orjson.loads  # pylint: disable=no-member
+else:  # pragma: no cover
+    json_loads = json.loads
+
+
+class MqttConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A source that subscribes to one or more MQTT topics.
+    """
+
+    topics = fields.List(
+        fields.String(),
+        required=True,
+        default=None,
+        title="Topics",
+        description="List of topics (or topic wildcards) to subscribe to.",
+    )
+    host = fields.String(
+        required=False,
+        default="localhost",
+        title="Host",
+        description="Host where the MQTT server is running.",
+    )
+    port = fields.Integer(
+        required=False,
+        default=1883,
+        title="Port",
+        description="Port which the MQTT server is listening to.",
+    )
+    username = fields.String(
+        required=False,
+        default=None,
+        title="Username",
+        description="Optional username to use when connecting to the MQTT server.",
+    )
+    password = fields.String(
+        required=False,
+        default=None,
+        title="Password",
+        description="Optional password to use when connecting to the MQTT server.",
+    )
+    client_id = fields.String(
+        required=False,
+        default=None,
+        title="Client ID",
+        description="Optional client ID to use when connecting to the MQTT server.",
+    )
+    message_is_json = fields.Boolean(
+        required=False,
+        default=False,
+        title="Message is JSON",
+        description="The MQTT message is encoded as JSON and should be parsed.",
+    )
+    raw = fields.Boolean(
+        required=False,
+        default=False,
+        title="Raw payloads",
+        description="Send the payloads as bytes, without decoding them.",
+    )
+    batch_size = fields.Integer(
+        required=False,
+        default=1,
+        validate=validate.Range(min=1),
+        title="Batch size",
+        description="Maximum number of queued messages processed at a time.",
+    )
+    reconnect_interval = fields.Integer(
+        required=False,
+        default=3,
+        title="Reconnect interval",
+        description="Number of seconds to wait before reconnecting to the server.",
+    )
+    prefix = fields.String(
+        required=False,
+        default="hub.mqtt",
+        title="The prefix for events from this source",
+        description="The prefix for events from this source.",
+    )
+
+
+def get_decoder(message_is_json: bool, raw: bool) -> Callable[[bytes], Any]:
+    """
+    Return a function that decodes the payload of a message.
+    """
+    if raw:
+        if message_is_json:
+            raise InvalidConfigurationException(
+                "`raw` and `message_is_json` are mutually exclusive",
+            )
+        return bytes
+
+    if not message_is_json:
+        return bytes.decode
+
+    def decode(payload: bytes) -> Any:
+        try:
+            return json_loads(payload)
+        except ValueError:
+            value = payload.decode()
+            _logger.warning('Invalid JSON found: "%s"', value)
+            return value
+
+    return decode
 
 
-async def mqtt(  # pylint: disable=too-many-arguments
+@configuration_schema(MqttConfig())
+async def mqtt(  # pylint: disable=too-many-arguments, too-many-locals
     topics: List[str],
     host: str = "localhost",
     port: int = 1883,
@@ -27,6 +138,8 @@ async def mqtt(  # pylint: disable=too-many-arguments
     password: Optional[str] = None,
     client_id: Optional[str] = None,
     message_is_json: bool = False,
+    raw: bool = False,
+    batch_size: int = 1,
     reconnect_interval: int = 3,
     prefix: str = "hub.mqtt",
 ) -> Stream:
@@ -36,6 +149,15 @@ async def mqtt(  # pylint: disable=too-many-arguments
     This source will subscribe to one or more MQTT topics (or topic
     wildcards), sending an event every time a message is received.
 
+    Nodes connecting to the same server with the same credentials share a
+    single connection, and messages are routed to each node according to its
+    topics.
+
+    For high message rates, set ``batch_size`` to process up to that many
+    queued messages at a time; all the events in a batch share the same
+    timestamp. JSON payloads are parsed with ``orjson`` when it's installed,
+    and ``raw`` skips decoding altogether, sending the payloads as bytes.
+
     Parameters
     ----------
     topics
@@ -52,6 +174,10 @@ async def mqtt(  # pylint: disable=too-many-arguments
         Optional client ID to use when connecting to the MQTT server
     message_is_json
         The MQTT message is encoded as JSON and should be parsed
+    raw
+        Send the payloads as bytes, without decoding them
+    batch_size
+        Maximum number of queued messages processed at a time
     reconnect_interval
         Number of seconds to wait before reconnecting to the MQTT server
     prefix
@@ -62,57 +188,25 @@ async def mqtt(  # pylint: disable=too-many-arguments
     Event
         Events with data from MQTT messages
     """
-    _logger.info("Connecting to MQTT server")
-
-    while True:
-        try:
-            async with Client(  # pragma: no cover
-                host,
-                port,
-                username=username,
-                password=password,
-                client_id=client_id or prefix,
-                clean_session=False,
-            ) as client:
-                streams = [
-                    read_from_topic(client, topic, prefix, message_is_json)
-                    for topic in topics
-                ]
-                async for event in merge_streams(*streams):  # pragma: no cover
-                    yield event
-        except MqttError as error:
-            _logger.warning(
-                'Error "%s". Reconnecting in %s seconds.',
-                error,
-                reconnect_interval,
-            )
-            await asyncio.sleep(reconnect_interval)
-        except asyncio.CancelledError:
-            break
-
+    decode = get_decoder(message_is_json, raw)
+    connection = get_connection(
+        host,
+        port,
+        username,
+        password,
+        client_id or prefix,
+        reconnect_interval,
+    )
+    async with connection.subscribe(topics) as queue:
+        while True:
+            messages = [await queue.get()]
+            while len(messages) < batch_size and not queue.empty():
+                messages.append(queue.get_nowait())
 
-async def read_from_topic(
-    client: Client,
-    topic: str,
-    prefix: str,
-    message_is_json: bool,
-) -> Stream:
-    """
-    Read from a given topic.
-    """
-    async with client.filtered_messages(topic) as messages:
-        _logger.debug("Subscribing to topic: %s", topic)
-        await client.subscribe(topic, qos=1)
-        async for message in messages:  # pragma: no cover
-            value = message.payload.decode()
-            if message_is_json:
-                try:
-                    value = json.loads(value)
-                except json.decoder.JSONDecodeError:
-                    _logger.warning('Invalid JSON found: "%s"', value)
-
-            yield {
-                "timestamp": datetime.now(timezone.utc),
-                "name": f"{prefix}.{message.topic}",
-                "value": value,
-            }
+            now = datetime.now(timezone.utc)
+            for message in messages:
+                yield {
+                    "timestamp": now,
+                    "name": f"{prefix}.{message.topic}",
+                    "value": decode(message.payload),
+                }
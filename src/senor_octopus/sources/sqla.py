@@ -2,24 +2,192 @@
 A generic source for reading data from a database via SQLAlchemy.
 """
 
+import inspect
 import logging
 from datetime import datetime, timezone
-from typing import Generator
+from typing import Any, Dict, Generator, List, Optional, Sequence, Tuple, Union
 
+from marshmallow import Schema, fields, validate
 from sqlalchemy import text
-from sqlalchemy.engine import create_engine
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.engine import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import (
+    MemoryStateStore,
+    StateStore,
+    configuration_schema,
+    on_shutdown,
+)
 from senor_octopus.types import Event, Stream
 
 _logger = logging.getLogger(__name__)
 
+# engines are shared between runs, so that connections in the pool are reused
+EngineKey = Tuple[str, bool, Tuple[Tuple[str, Any], ...]]
+engines: Dict[EngineKey, Union[Engine, AsyncEngine]] = {}
 
-async def sqla(
+
+def get_engine(uri: str, sync: bool, **options: Any) -> Union[Engine, AsyncEngine]:
+    """
+    Return an engine for a given URI and options, creating it if needed.
+    """
+    key = (uri, sync, tuple(sorted(options.items())))
+    if key not in engines:
+        _logger.debug("Creating engine for %s", uri)
+        factory = create_engine if sync else create_async_engine
+        engines[key] = factory(uri, **options)
+        on_shutdown(dispose_engines)
+    return engines[key]
+
+
+async def dispose_engines() -> None:
+    """
+    Close all the connections in the engine pools.
+    """
+    while engines:
+        _, engine = engines.popitem()
+        result = engine.dispose()
+        if inspect.isawaitable(result):
+            await result
+
+
+class SqlaConfig(Schema):  # pylint: disable=too-few-public-methods
+    """
+    A source that reads data from a database via SQLAlchemy.
+    """
+
+    uri = fields.String(
+        required=True,
+        default=None,
+        title="SQLAlchemy URI",
+        description=(
+            "The database URI, see "
+            "https://docs.sqlalchemy.org/en/14/core/engines.html."
+        ),
+    )
+    sql = fields.String(
+        required=True,
+        default=None,
+        title="SQL query",
+        description=(
+            "A query returning the `name` and `value` columns, and optionally "
+            "a `timestamp` column."
+        ),
+    )
+    sync = fields.Boolean(
+        required=False,
+        default=False,
+        title="Synchronous mode",
+        description="Use a synchronous driver instead of an asynchronous one.",
+    )
+    prefix = fields.String(
+        required=False,
+        default="hub.sqla",
+        title="The prefix for events from this source",
+        description="The prefix for events from this source.",
+    )
+    pool_size = fields.Integer(
+        required=False,
+        default=None,
+        validate=validate.Range(min=0),
+        title="Pool size",
+        description="Number of connections kept open in the pool.",
+    )
+    max_overflow = fields.Integer(
+        required=False,
+        default=None,
+        title="Maximum overflow",
+        description="Number of connections that can be opened beyond the pool size.",
+    )
+    pool_pre_ping = fields.Boolean(
+        required=False,
+        default=False,
+        title="Pre-ping",
+        description="Test connections before using them, replacing stale ones.",
+    )
+    pool_recycle = fields.Integer(
+        required=False,
+        default=None,
+        title="Connection recycle time",
+        description="Replace connections older than this number of seconds.",
+    )
+    chunk_size = fields.Integer(
+        required=False,
+        default=1000,
+        validate=validate.Range(min=1),
+        title="Chunk size",
+        description="Number of rows fetched from the database at a time.",
+    )
+    watermark = fields.String(
+        required=False,
+        default=None,
+        title="Watermark column",
+        description=(
+            "A column, eg, a timestamp or an ID, whose highest value is passed "
+            "to the next run as the `:watermark` parameter."
+        ),
+    )
+    initial_watermark = fields.Raw(
+        required=False,
+        default=None,
+        title="Initial watermark",
+        description="The value of `:watermark` in the first run.",
+    )
+
+
+class Watermark:
+    """
+    The highest value of a column seen so far, kept in a state store.
+    """
+
+    def __init__(self, column: str, state: StateStore, initial: Any = None):
+        self.column = column
+        self.state = state
+        self.value = state.get("watermark", initial)
+        self.index = -1
+
+    def bind(self, keys: List[str]) -> None:
+        """
+        Find the position of the column in the results.
+        """
+        if self.column not in keys:
+            raise InvalidConfigurationException(
+                f'The query must return the watermark column "{self.column}"',
+            )
+        self.index = keys.index(self.column)
+
+    def update(self, rows: Sequence[Sequence[Any]]) -> None:
+        """
+        Update the watermark with a chunk of rows.
+        """
+        values = [row[self.index] for row in rows if row[self.index] is not None]
+        if values:
+            highest = max(values)
+            if self.value is None or highest > self.value:
+                self.value = highest
+
+    def save(self) -> None:
+        """
+        Store the watermark, once all the rows have been read.
+        """
+        self.state.set("watermark", self.value)
+
+
+@configuration_schema(SqlaConfig())
+async def sqla(  # pylint: disable=too-many-arguments, too-many-locals
     uri: str,
     sql: str,
     sync: bool = False,
     prefix: str = "hub.sqla",
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    pool_pre_ping: bool = False,
+    pool_recycle: Optional[int] = None,
+    chunk_size: int = 1000,
+    watermark: Optional[str] = None,
+    initial_watermark: Any = None,
+    state: Optional[StateStore] = None,
 ) -> Stream:
     """
     Read data from database.
@@ -30,6 +198,18 @@ async def sqla(
     be used as the timestamp of the generated event. Otherwise, the current
     timestamp will be used.
 
+    To read only new rows, set ``watermark`` to a column that increases, like
+    a timestamp or an ID, and use the ``:watermark`` parameter in the query,
+    eg, ``WHERE ts > :watermark``. The highest value of the column is passed
+    to the next run, and persisted if the node has a ``state`` database, so
+    that restarts resume from where they left off. In the first run the
+    parameter is ``initial_watermark``, which defaults to ``NULL``.
+
+    The engine is created on the first run and reused in the next ones, so
+    that connections are kept open in the pool between runs. Results are
+    streamed from the database in chunks, so that large queries don't need
+    to fit in memory.
+
     Parameters
     ----------
     uri
@@ -38,6 +218,20 @@ async def sqla(
         SQL query to run
     prefix
         Prefix for events from this source
+    pool_size
+        Number of connections kept open in the pool
+    max_overflow
+        Number of connections that can be opened beyond the pool size
+    pool_pre_ping
+        Test connections before using them, replacing stale ones
+    pool_recycle
+        Replace connections older than this number of seconds
+    chunk_size
+        Number of rows fetched from the database at a time
+    watermark
+        Column whose highest value is passed to the next run as ``:watermark``
+    initial_watermark
+        Value of ``:watermark`` in the first run
 
     Yields
     ------
@@ -47,43 +241,125 @@ async def sqla(
     _logger.info("Running SQL query")
     _logger.debug(sql)
 
+    options: Dict[str, Any] = {
+        key: value
+        for key, value in {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_recycle": pool_recycle,
+        }.items()
+        if value is not None
+    }
+    if pool_pre_ping:
+        options["pool_pre_ping"] = True
+
+    tracker = (
+        Watermark(watermark, state or MemoryStateStore(), initial_watermark)
+        if watermark
+        else None
+    )
+
     if sync:
-        for event in read_sync(uri, sql, prefix):
+        engine = get_engine(uri, True, **options)
+        for event in read_sync(engine, sql, prefix, chunk_size, tracker):
             yield event
     else:
-        async for event in read_async(uri, sql, prefix):  # pragma: no cover
+        engine = get_engine(uri, False, **options)
+        async for event in read_async(  # pragma: no cover
+            engine,
+            sql,
+            prefix,
+            chunk_size,
+            tracker,
+        ):
             yield event
 
+    if tracker:
+        tracker.save()
+
 
-def read_sync(uri: str, sql: str, prefix: str) -> Generator[Event, None, None]:
+def get_indexes(keys: List[str]) -> Tuple[int, int, Optional[int]]:
     """
-    Read data from database synchronously.
+    Return the positions of the ``name``, ``value`` and ``timestamp`` columns.
+    """
+    try:
+        name, value = keys.index("name"), keys.index("value")
+    except ValueError as ex:
+        raise InvalidConfigurationException(
+            "The query must return the `name` and `value` columns",
+        ) from ex
+    timestamp = keys.index("timestamp") if "timestamp" in keys else None
+    return name, value, timestamp
+
+
+def build_events(
+    rows: Sequence[Sequence[Any]],
+    indexes: Tuple[int, int, Optional[int]],
+    prefix: str,
+) -> Generator[Event, None, None]:
+    """
+    Build events from rows, reading the columns by position.
     """
-    engine = create_engine(uri)
+    _logger.debug("Read %d rows", len(rows))
+    name, value, timestamp = indexes
+    now = datetime.now(timezone.utc)
+    for row in rows:
+        yield {
+            "timestamp": now if timestamp is None else row[timestamp],
+            "name": f"{prefix}.{row[name]}",
+            "value": row[value],
+        }
+
 
+def read_sync(
+    engine: Engine,
+    sql: str,
+    prefix: str,
+    chunk_size: int,
+    watermark: Optional[Watermark] = None,
+) -> Generator[Event, None, None]:
+    """
+    Read data from database synchronously.
+    """
+    parameters = {"watermark": watermark.value} if watermark else {}
     with engine.connect() as conn:
-        for row in conn.execute(text(sql)):
-            _logger.debug(row)
-            event = dict(row)
-            yield {
-                "timestamp": event.get("timestamp", datetime.now(timezone.utc)),
-                "name": f"{prefix}.{event['name']}",
-                "value": event["value"],
-            }
+        result = conn.execution_options(
+            stream_results=True,
+            max_row_buffer=chunk_size,
+        ).execute(text(sql), parameters)
+        keys = list(result.keys())
+        indexes = get_indexes(keys)
+        if watermark:
+            watermark.bind(keys)
+        for rows in result.partitions(chunk_size):
+            if watermark:
+                watermark.update(rows)
+            yield from build_events(rows, indexes, prefix)
 
 
-async def read_async(uri: str, sql: str, prefix: str) -> Stream:
+async def read_async(
+    engine: AsyncEngine,
+    sql: str,
+    prefix: str,
+    chunk_size: int,
+    watermark: Optional[Watermark] = None,
+) -> Stream:
     """
     Read data from database asynchronously.
     """
-    engine = create_async_engine(uri)
-
+    parameters = {"watermark": watermark.value} if watermark else {}
     async with engine.connect() as conn:
-        for row in await conn.execute(text(sql)):
-            _logger.debug(row)
-            event = dict(row)
-            yield {
-                "timestamp": event.get("timestamp", datetime.now(timezone.utc)),
-                "name": f"{prefix}.{event['name']}",
-                "value": event["value"],
-            }
+        result = await conn.stream(
+            text(sql),
+            parameters,
+            execution_options={"max_row_buffer": chunk_size},
+        )
+        keys = list(result.keys())
+        indexes = get_indexes(keys)
+        if watermark:
+            watermark.bind(keys)
+        async for rows in result.partitions(chunk_size):
+            if watermark:
+                watermark.update(rows)
+            for event in build_events(rows, indexes, prefix):
+                yield event
@@ -0,0 +1,376 @@
+"""
+TCP source.
+
+Devices keep long-lived connections to a server, sending messages that are
+split by a framing strategy and decoded by the protocols registered for the
+UDP source, in ``senor_octopus.source.udp.protocols``.
+"""
+
+import asyncio
+import logging
+import struct
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple, Union
+
+from senor_octopus.exceptions import FramingException, InvalidConfigurationException
+from senor_octopus.sources.udp.workers import BoundedQueue, load_protocol
+from senor_octopus.types import Stream
+
+_logger = logging.getLogger(__name__)
+
+
+class DelimiterFramer:  # pylint: disable=too-few-public-methods
+    """
+    Split a stream into messages ending with a delimiter.
+
+    The delimiter is not included in the messages.
+    """
+
+    def __init__(self, delimiter: bytes, max_frame_size: int):
+        if not delimiter:
+            raise InvalidConfigurationException("The delimiter can't be empty")
+        self.delimiter = delimiter
+        self.max_frame_size = max_frame_size
+
+    def split(self, buffer: bytearray) -> Tuple[List[bytes], int]:
+        """
+        Return the complete messages in a buffer, and how many bytes they used.
+
+        A message that is too big raises an exception once it's the first one
+        in the buffer, so that the messages before it are still processed.
+        """
+        frames = []
+        start = 0
+        with memoryview(buffer) as view:
+            while True:
+                end = buffer.find(self.delimiter, start)
+                if end == -1:
+                    break
+                frames.append(bytes(view[start:end]))
+                start = end + len(self.delimiter)
+
+        if not frames and len(buffer) > self.max_frame_size:
+            raise FramingException(
+                f"Message exceeds the maximum size of {self.max_frame_size} bytes",
+            )
+        return frames, start
+
+
+class LengthPrefixFramer:  # pylint: disable=too-few-public-methods
+    """
+    Split a stream into messages prefixed by their length.
+
+    The length is an unsigned integer described by a ``struct`` format, eg,
+    ``!H`` for 2 bytes in network order, and doesn't include the prefix.
+    """
+
+    def __init__(self, length_format: str, max_frame_size: int):
+        try:
+            self.header = struct.Struct(length_format)
+        except struct.error as ex:
+            raise InvalidConfigurationException(
+                f'Invalid length format "{length_format}"',
+            ) from ex
+        self.max_frame_size = max_frame_size
+
+    def split(self, buffer: bytearray) -> Tuple[List[bytes], int]:
+        """
+        Return the complete messages in a buffer, and how many bytes they used.
+
+        A message that is too big raises an exception once it's the first one
+        in the buffer, so that the messages before it are still processed.
+        """
+        frames = []
+        start = 0
+        size = len(buffer)
+        with memoryview(buffer) as view:
+            while size - start >= self.header.size:
+                (length,) = self.header.unpack_from(view, start)
+                if length > self.max_frame_size and frames:
+                    break
+                if length > self.max_frame_size:
+                    raise FramingException(
+                        f"Message of {length} bytes exceeds the maximum size of "
+                        f"{self.max_frame_size} bytes",
+                    )
+                end = start + self.header.size + length
+                if end > size:
+                    break
+                frames.append(bytes(view[start + self.header.size : end]))
+                start = end
+
+        return frames, start
+
+
+Framer = Union[DelimiterFramer, LengthPrefixFramer]
+
+
+def get_framer(
+    framing: str,
+    delimiter: str,
+    length_format: str,
+    max_frame_size: int,
+) -> Framer:
+    """
+    Build a framer from its name.
+    """
+    if framing == "newline":
+        return DelimiterFramer(b"\n", max_frame_size)
+    if framing == "delimiter":
+        return DelimiterFramer(delimiter.encode(), max_frame_size)
+    if framing == "length":
+        return LengthPrefixFramer(length_format, max_frame_size)
+    raise InvalidConfigurationException(
+        f'Invalid framing "{framing}", must be one of: newline, delimiter, length',
+    )
+
+
+class StreamTransport:
+    """
+    A transport that sends the replies of a protocol to the right connection.
+
+    A single protocol handles all connections, as if they were datagrams from
+    different addresses, so that state like caches is shared between devices.
+    """
+
+    def __init__(self) -> None:
+        self.writers: Dict[Any, asyncio.StreamWriter] = {}
+
+    def sendto(self, data: bytes, addr: Any) -> None:
+        """
+        Send a reply to a connection, if it's still open.
+        """
+        writer = self.writers.get(addr)
+        if writer is None or writer.is_closing():
+            _logger.warning("Connection from %s is closed, dropping reply", addr)
+            return
+        writer.write(data)
+
+    def get_extra_info(  # pylint: disable=unused-argument
+        self,
+        name: str,
+        default: Any = None,
+    ) -> Any:
+        """
+        Return information about the transport.
+        """
+        return default
+
+    def close(self) -> None:
+        """
+        Close all connections.
+        """
+        for writer in list(self.writers.values()):
+            writer.close()
+
+
+class Server:
+    """
+    Accept connections, splitting and decoding their messages.
+    """
+
+    def __init__(
+        self,
+        protocol: asyncio.DatagramProtocol,
+        framer: Framer,
+        read_size: int,
+        idle_timeout: float,
+    ):
+        self.protocol = protocol
+        self.framer = framer
+        self.read_size = read_size
+        self.idle_timeout = idle_timeout
+
+        self.transport = StreamTransport()
+        self.protocol.connection_made(self.transport)  # type: ignore
+        self.last_seen: Dict[asyncio.StreamWriter, float] = {}
+        self.tasks: Set["asyncio.Task[None]"] = set()
+
+    async def handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Read messages from a connection until it's closed.
+        """
+        addr = writer.get_extra_info("peername")
+        _logger.debug("Connection from %s", addr)
+        self.transport.writers[addr] = writer
+        self.last_seen[writer] = time.monotonic()
+        task = asyncio.current_task()
+        self.tasks.add(task)  # type: ignore
+
+        # the buffer is reused for all reads, keeping only incomplete messages
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(self.read_size)
+                if not data:
+                    break
+                self.last_seen[writer] = time.monotonic()
+
+                buffer += data
+                frames, consumed = self.framer.split(buffer)
+                while frames:
+                    del buffer[:consumed]
+                    for frame in frames:
+                        self.protocol.datagram_received(frame, addr)
+                    frames, consumed = self.framer.split(buffer)
+        except (ConnectionError, FramingException) as ex:
+            _logger.warning("Closing connection from %s: %s", addr, ex)
+        finally:
+            _logger.debug("Connection from %s closed", addr)
+            del self.transport.writers[addr]
+            del self.last_seen[writer]
+            self.tasks.discard(task)  # type: ignore
+            writer.close()
+
+    async def close_idle_connections(self) -> None:
+        """
+        Periodically close connections that haven't sent data recently.
+
+        A single task checks all connections, instead of having a timeout on
+        every read, so that idle connections are closed within 1.5 times the
+        idle timeout.
+        """
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            deadline = time.monotonic() - self.idle_timeout
+            for writer, last_seen in list(self.last_seen.items()):
+                if last_seen < deadline:
+                    _logger.info(
+                        "Closing idle connection from %s",
+                        writer.get_extra_info("peername"),
+                    )
+                    writer.close()
+
+
+async def tcp(  # pylint: disable=too-many-arguments, too-many-locals
+    protocol: str,
+    host: str = "localhost",
+    port: int = 5000,
+    prefix: str = "hub.tcp",
+    framing: str = "newline",
+    delimiter: str = "\n",
+    length_format: str = "!H",
+    max_frame_size: int = 65536,
+    idle_timeout: float = 600,
+    read_size: int = 65536,
+    backlog: int = 1024,
+    batch_size: int = 64,
+    queue_size: int = 10000,
+    **kwargs: Any,
+) -> Stream:
+    """
+    Listen to messages from TCP connections on a given port.
+
+    Messages are split according to ``framing``:
+
+        - ``newline``: messages end with a newline;
+        - ``delimiter``: messages end with ``delimiter``;
+        - ``length``: messages are prefixed by their length, encoded with the
+          ``struct`` format in ``length_format``.
+
+    Each message is then decoded by a protocol from the UDP source. A single
+    instance of the protocol handles all the connections, and its replies are
+    sent to the connection the message came from.
+
+    Parameters
+    ----------
+    protocol
+        Protocol to use for decoding the messages
+    host
+        Hostname or IP address to listen to
+    port
+        Port to listen to
+    prefix
+        Prefix to use for the stream
+    framing
+        How to split messages: ``newline``, ``delimiter``, or ``length``
+    delimiter
+        Delimiter at the end of each message, when ``framing`` is ``delimiter``
+    length_format
+        Format of the length prefix, when ``framing`` is ``length``
+    max_frame_size
+        Maximum size of a message, in bytes; larger messages close the connection
+    idle_timeout
+        Seconds without data before a connection is closed, or 0 to keep it open
+    read_size
+        Maximum number of bytes read from a connection at a time
+    backlog
+        Maximum number of connections waiting to be accepted
+    batch_size
+        Maximum number of messages processed at a time
+    queue_size
+        Maximum number of messages waiting to be processed
+    kwargs
+        Additional keyword arguments to pass to the protocol
+
+    Yields
+    ------
+    Event
+        Events with messages processed by the protocol
+    """
+    queue = BoundedQueue(queue_size)
+    protocol_class = load_protocol(protocol)
+    framer = get_framer(framing, delimiter, length_format, max_frame_size)
+    server = Server(
+        protocol_class(queue, **kwargs),  # type: ignore
+        framer,
+        read_size,
+        idle_timeout,
+    )
+
+    async with serve(server, host, port, backlog):
+        try:
+            while True:
+                values = [await queue.get()]
+                while len(values) < batch_size and not queue.empty():
+                    values.append(queue.get_nowait())
+
+                now = datetime.now(timezone.utc)
+                for value in values:
+                    yield {
+                        "timestamp": now,
+                        "name": f"{prefix}.message",
+                        "value": value,
+                    }
+        except asyncio.CancelledError:
+            pass
+
+
+@asynccontextmanager
+async def serve(
+    server: Server,
+    host: str,
+    port: int,
+    backlog: int,
+) -> AsyncIterator[None]:
+    """
+    Accept connections until the context exits.
+    """
+    tcp_server = await asyncio.start_server(
+        server.handle,
+        host,
+        port,
+        backlog=backlog,
+    )
+    tasks = []
+    if server.idle_timeout:
+        tasks.append(asyncio.create_task(server.close_idle_connections()))
+    try:
+        yield
+    finally:
+        tcp_server.close()
+        server.transport.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(
+            tcp_server.wait_closed(),
+            *server.tasks,
+            *tasks,
+            return_exceptions=True,
+        )
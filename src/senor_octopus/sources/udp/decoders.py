@@ -0,0 +1,233 @@
+"""
+Declarative decoders for UDP protocols.
+
+Protocols describe their messages as a layout of fields, either delimited
+text or binary ``struct`` formats, and the layout is compiled once into a
+decoder. Decoding works directly on the bytes of the datagram, without
+converting them to strings first; numeric fields are parsed by ``int`` and
+``float``, which accept bytes.
+
+A layout can be registered in the ``senor_octopus.source.udp.protocols``
+entry point, in which case the decoded messages are sent as the values of
+the events. Protocols that need to reply to devices subclass
+``DecoderProtocol`` instead.
+"""
+
+import asyncio
+import logging
+import struct
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
+
+_logger = logging.getLogger(__name__)
+
+Buffer = Union[bytes, bytearray, memoryview]
+Message = Dict[str, Any]
+Index = Union[int, slice]
+
+
+class Field(NamedTuple):
+    """
+    A field in a message.
+
+    The ``index`` is the position of the field in the delimited text or in
+    the values unpacked from the ``struct`` format, and can be a slice for a
+    group of fields. The optional ``convert`` function receives the raw
+    value, eg, ``bytes``.
+    """
+
+    name: str
+    index: Index
+    convert: Optional[Callable[[Any], Any]] = None
+
+
+def text(value: bytes) -> str:
+    """
+    Convert a field to a string.
+    """
+    return value.decode()
+
+
+def timestamp(value: bytes) -> datetime:
+    """
+    Convert a ``YYYYMMDDHHMMSS`` field to a datetime in UTC.
+    """
+    return datetime(
+        int(value[0:4]),
+        int(value[4:6]),
+        int(value[6:8]),
+        int(value[8:10]),
+        int(value[10:12]),
+        int(value[12:14]),
+        tzinfo=timezone.utc,
+    )
+
+
+def compile_fields(fields: Sequence[Field]) -> Callable[[Sequence[Any]], Message]:
+    """
+    Build a function that extracts and converts fields from a sequence.
+    """
+    if not fields:
+        return lambda values: {}
+
+    # ``itemgetter`` with a single item returns it instead of a tuple
+    getter = itemgetter(*[field.index for field in fields])
+    get = getter if len(fields) > 1 else lambda values: (getter(values),)
+
+    names = [field.name for field in fields]
+    if all(field.convert is None for field in fields):
+        return lambda values: dict(zip(names, get(values)))
+
+    converters = [
+        field.convert if field.convert is not None else (lambda value: value)
+        for field in fields
+    ]
+    fields_ = list(zip(names, converters))
+
+    def extract(values: Sequence[Any]) -> Message:
+        return {
+            name: convert(value) for (name, convert), value in zip(fields_, get(values))
+        }
+
+    return extract
+
+
+class Layout:  # pylint: disable=too-few-public-methods
+    """
+    The layout of a message.
+    """
+
+    def decode(self, data: Buffer) -> Message:
+        """
+        Decode a datagram into a dictionary.
+        """
+        raise NotImplementedError("Subclasses must implement `decode`")
+
+
+class Text(Layout):
+    """
+    A message with delimited text fields, eg, ``+RESP:GTFRI,423136,...$``.
+
+    Messages can have different fields depending on the value of the field at
+    position ``tag``; ``variants`` maps the raw values of the tag to the
+    additional fields of each kind of message. The ``fields`` are decoded for
+    every message.
+    """
+
+    def __init__(
+        self,
+        *fields: Field,
+        delimiter: bytes = b",",
+        terminator: bytes = b"",
+        tag: int = 0,
+        variants: Optional[Dict[bytes, Sequence[Field]]] = None,
+    ):
+        self.delimiter = delimiter
+        self.terminator = terminator
+        self.tag = tag
+        self.common = compile_fields(fields)
+        self.variants = {
+            key: compile_fields(variant_fields)
+            for key, variant_fields in (variants or {}).items()
+        }
+
+    def split(self, data: Buffer) -> List[bytes]:
+        """
+        Split a message into its fields.
+        """
+        # ``bytes`` is a no-op for ``bytes``, and a single copy for memoryviews
+        message = bytes(data).strip()
+        if self.terminator and message.endswith(self.terminator):
+            message = message[: -len(self.terminator)]
+        return message.split(self.delimiter)
+
+    def decode(self, data: Buffer) -> Message:
+        parts = self.split(data)
+        message = self.common(parts)
+        if self.variants:
+            variant = self.variants.get(parts[self.tag])
+            if variant is not None:
+                message.update(variant(parts))
+        return message
+
+
+class Struct(Layout):  # pylint: disable=too-few-public-methods
+    """
+    A binary message with a fixed layout, described by a ``struct`` format.
+    """
+
+    def __init__(self, format_: str, *fields: Field, offset: int = 0):
+        self.struct = struct.Struct(format_)
+        self.offset = offset
+        self.extract = compile_fields(fields)
+
+    def decode(self, data: Buffer) -> Message:
+        return self.extract(self.struct.unpack_from(data, self.offset))
+
+
+class DecoderProtocol(asyncio.DatagramProtocol):
+    """
+    A protocol that decodes datagrams with a layout.
+
+    By default the decoded messages are sent to the queue; subclasses can
+    override ``handle`` to reply to the devices or to process the messages.
+    """
+
+    layout: Layout
+
+    def __init__(self, queue: asyncio.Queue) -> None:
+        self.queue = queue
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = cast(asyncio.DatagramTransport, transport)
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """
+        Decode and handle a datagram.
+        """
+        if self.transport is None:
+            return
+
+        _logger.debug("Received %r from %s", data, addr)
+        try:
+            message = self.layout.decode(data)
+        except (ValueError, IndexError, struct.error) as ex:
+            _logger.warning("Unable to decode %r from %s: %s", data, addr, ex)
+            return
+
+        self.handle(message, addr)
+
+    def handle(  # pylint: disable=unused-argument
+        self,
+        message: Message,
+        addr: Tuple[str, int],
+    ) -> None:
+        """
+        Process a decoded message.
+        """
+        self.queue.put_nowait(message)
+
+
+def get_protocol_class(layout: Layout) -> Type[DecoderProtocol]:
+    """
+    Build a protocol that decodes datagrams with a layout.
+    """
+    return type(
+        f"{type(layout).__name__}Protocol",
+        (DecoderProtocol,),
+        {"layout": layout},
+    )
@@ -0,0 +1,174 @@
+"""
+Geolocation of devices from the WiFi access points they can see.
+
+Lookups use the Google Geolocation API through a shared HTTP client, and the
+results are cached, so that stationary devices don't trigger repeated
+requests.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Iterable, List, Optional, Tuple, TypedDict
+
+import httpx
+
+from senor_octopus.lib import on_shutdown
+
+_logger = logging.getLogger(__name__)
+
+GEOLOCATION_URL = "https://www.googleapis.com/geolocation/v1/geolocate"
+
+
+class WifiAccessPointType(TypedDict):
+    """
+    A WiFi access point.
+    """
+
+    macAddress: str
+    signalStrength: int
+
+
+class LocationType(TypedDict):
+    """
+    The estimated location of a device, with the accuracy in meters.
+    """
+
+    latitude: float
+    longitude: float
+    accuracy: float
+
+
+CacheKey = FrozenSet[str]
+
+
+def normalize_mac_address(mac_address: str) -> str:
+    """
+    Normalize a MAC address to lowercase with colons, eg, ``b0:e4:d5:56:fb:c6``.
+    """
+    digits = mac_address.replace(":", "").replace("-", "").lower()
+    return ":".join(digits[i : i + 2] for i in range(0, len(digits), 2))
+
+
+def get_cache_key(access_points: Iterable[WifiAccessPointType]) -> CacheKey:
+    """
+    Build a cache key from the set of access points, ignoring signal strengths.
+    """
+    return frozenset(
+        normalize_mac_address(access_point["macAddress"])
+        for access_point in access_points
+    )
+
+
+class LocationCache:
+    """
+    A LRU cache of locations, with entries expiring after ``ttl`` seconds.
+    """
+
+    def __init__(self, size: int = 1024, ttl: float = 3600):
+        self.size = size
+        self.ttl = ttl
+        self.entries: "OrderedDict[CacheKey, Tuple[float, LocationType]]" = (
+            OrderedDict()
+        )
+
+    def get(self, key: CacheKey) -> Optional[LocationType]:
+        """
+        Return a cached location, if it hasn't expired.
+        """
+        if key not in self.entries:
+            return None
+
+        expiration, location = self.entries[key]
+        if expiration < time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return location
+
+    def set(self, key: CacheKey, location: LocationType) -> None:
+        """
+        Add a location to the cache, evicting the least recently used one.
+        """
+        self.entries[key] = (time.monotonic() + self.ttl, location)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+clients: List[httpx.AsyncClient] = []
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the HTTP client shared by all lookups.
+    """
+    if not clients:
+        clients.append(httpx.AsyncClient(timeout=60))
+        on_shutdown(close_client)
+    return clients[0]
+
+
+async def close_client() -> None:
+    """
+    Close the shared HTTP client.
+    """
+    while clients:
+        await clients.pop().aclose()
+
+
+class Geolocator:  # pylint: disable=too-few-public-methods
+    """
+    Look up locations, with a cache and a bound on concurrent requests.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int = 4,
+        cache_size: int = 1024,
+        cache_ttl: float = 3600,
+    ):
+        self.api_key = api_key
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.cache = LocationCache(cache_size, cache_ttl)
+
+    async def locate(
+        self,
+        access_points: List[WifiAccessPointType],
+    ) -> Optional[LocationType]:
+        """
+        Return the location of a device, or ``None`` if it can't be found.
+        """
+        key = get_cache_key(access_points)
+        location = self.cache.get(key)
+        if location is not None:
+            _logger.debug("Using cached location for %s", sorted(key))
+            return location
+
+        payload = {"considerIp": False, "wifiAccessPoints": access_points}
+        async with self.semaphore:
+            try:
+                response = await get_client().post(
+                    GEOLOCATION_URL,
+                    params={"key": self.api_key},
+                    json=payload,
+                )
+            except httpx.HTTPError as ex:
+                _logger.warning("Error calling the geolocation API: %s", ex)
+                return None
+
+        if response.is_error:
+            _logger.warning("Geolocation failed: %s", response.text)
+            return None
+
+        result = response.json()
+        location = {
+            "latitude": result["location"]["lat"],
+            "longitude": result["location"]["lng"],
+            "accuracy": result["accuracy"],
+        }
+        self.cache.set(key, location)
+        return location
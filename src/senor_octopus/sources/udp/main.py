@@ -4,27 +4,39 @@ UDP source.
 
 import asyncio
 import logging
+import multiprocessing
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import Any
+from multiprocessing.connection import Connection
+from typing import Any, AsyncIterator, List
 
-from pkg_resources import iter_entry_points
-
-from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.sources.udp.workers import BoundedQueue, load_protocol, worker
 from senor_octopus.types import Stream
 
 _logger = logging.getLogger(__name__)
 
 
-async def udp(
+async def udp(  # pylint: disable=too-many-arguments
     protocol: str,
     host: str = "localhost",
     port: int = 5000,
     prefix: str = "hub.udp",
+    workers: int = 0,
+    batch_size: int = 64,
+    queue_size: int = 10000,
     **kwargs: Any,
 ) -> Stream:
     """
     Listen to UDP datagrams in a given port.
 
+    For high volumes of datagrams, set ``workers`` to receive and decode them
+    in that many processes. Each worker binds the port with ``SO_REUSEPORT``,
+    so that the kernel balances datagrams between them, and reads up to
+    ``batch_size`` datagrams at a time.
+
+    Decoded messages wait in a queue of up to ``queue_size`` messages; when
+    the queue is full new messages are dropped, and a warning is logged.
+
     Parameters
     ----------
     protocol
@@ -35,6 +47,12 @@ async def udp(
         Port to listen to
     prefix
         Prefix to use for the stream
+    workers
+        Number of worker processes, or 0 to receive datagrams in the event loop
+    batch_size
+        Maximum number of datagrams or messages processed at a time
+    queue_size
+        Maximum number of messages waiting to be processed
     kwargs
         Additional keyword arguments to pass to the protocol
 
@@ -43,30 +61,108 @@ async def udp(
     Event
         Events with messages processed by the protocol
     """
-    queue: asyncio.Queue = asyncio.Queue()
+    queue = BoundedQueue(queue_size)
+    protocol_class = load_protocol(protocol)
 
-    try:
-        protocol_class = next(
-            iter_entry_points("senor_octopus.source.udp.protocols", protocol),
-        ).load()
-    except StopIteration as ex:
-        raise InvalidConfigurationException(f'Protocol "{protocol}" not found') from ex
-
-    while True:
-        loop = asyncio.get_running_loop()
-        transport, _ = await loop.create_datagram_endpoint(  # pragma: no cover
-            lambda: protocol_class(queue, **kwargs),
-            local_addr=(host, port),
+    if workers:
+        receiver = receive_from_workers(
+            queue,
+            workers,
+            protocol,
+            host,
+            port,
+            batch_size,
+            **kwargs,
         )
+    else:
+        receiver = receive(queue, protocol_class, host, port, **kwargs)
+
+    async with receiver:
         try:
             while True:
-                value = await queue.get()
-                yield {
-                    "timestamp": datetime.now(timezone.utc),
-                    "name": f"{prefix}.message",
-                    "value": value,
-                }
+                values = [await queue.get()]
+                while len(values) < batch_size and not queue.empty():
+                    values.append(queue.get_nowait())
+
+                now = datetime.now(timezone.utc)
+                for value in values:
+                    yield {
+                        "timestamp": now,
+                        "name": f"{prefix}.message",
+                        "value": value,
+                    }
         except asyncio.CancelledError:
-            break
-        finally:
-            transport.close()
+            pass
+
+
+@asynccontextmanager
+async def receive(
+    queue: asyncio.Queue,
+    protocol_class: Any,
+    host: str,
+    port: int,
+    **kwargs: Any,
+) -> AsyncIterator[None]:
+    """
+    Receive datagrams in the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: protocol_class(queue, **kwargs),
+        local_addr=(host, port),
+    )
+    try:
+        yield
+    finally:
+        transport.close()
+
+
+@asynccontextmanager
+async def receive_from_workers(  # pylint: disable=too-many-arguments, too-many-locals
+    queue: asyncio.Queue,
+    workers: int,
+    protocol: str,
+    host: str,
+    port: int,
+    batch_size: int,
+    **kwargs: Any,
+) -> AsyncIterator[None]:
+    """
+    Receive datagrams in worker processes.
+    """
+    loop = asyncio.get_running_loop()
+    context = multiprocessing.get_context("spawn")
+    processes: List[multiprocessing.process.BaseProcess] = []
+    connections: List[Connection] = []
+
+    def read(connection: Connection) -> None:
+        try:
+            values = connection.recv()
+        except EOFError:
+            _logger.error("UDP worker exited")
+            loop.remove_reader(connection.fileno())
+            return
+        for value in values:
+            queue.put_nowait(value)
+
+    try:
+        for _ in range(workers):
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(
+                target=worker,
+                args=(protocol, host, port, writer, batch_size, kwargs),
+                daemon=True,
+            )
+            process.start()
+            writer.close()
+            processes.append(process)
+            connections.append(reader)
+            loop.add_reader(reader.fileno(), read, reader)
+        yield
+    finally:
+        for connection in connections:
+            loop.remove_reader(connection.fileno())
+            connection.close()
+        for process in processes:
+            process.terminate()
+            process.join()
@@ -3,33 +3,74 @@ An UDP protocol for the Micron Bolt Mini 2 GPS tracker.
 """
 
 import asyncio
-import logging
-import re
-from datetime import datetime, timezone
-from typing import List, Optional, Tuple, TypedDict, cast
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-import requests
+from senor_octopus.sources.udp.decoders import (
+    DecoderProtocol,
+    Field,
+    Message,
+    Text,
+    text,
+    timestamp,
+)
+from senor_octopus.sources.udp.geolocation import Geolocator, WifiAccessPointType
 
-_logger = logging.getLogger(__name__)
+HEARTBEAT = b"+ACK:GTHBD"
+GPS_REPORTS = {b"+RESP:GTFRI", b"+BUFF:GTFRI"}
+WIFI_REPORTS = {b"+RESP:GTWIF", b"+BUFF:GTWIF"}
 
 
-def parse_timestamp(timestamp: str) -> datetime:
+def parse_access_points(tokens: List[bytes]) -> List[WifiAccessPointType]:
     """
-    Parse the GPS timestamp into a datetime object.
-    """
-    return datetime.strptime(timestamp, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
-
+    Parse the access points in a WiFi report.
 
-class WifiAccessPointType(TypedDict):
-    """
-    A WiFi access point.
+    Each access point has 5 fields, starting with the MAC address and the
+    signal strength.
     """
-
-    macAddress: str
-    signalStrength: int
-
-
-class MicronBoltMini2UDPProtocol(asyncio.DatagramProtocol):
+    return [
+        {
+            "macAddress": ":".join(
+                mac_address[i : i + 2].decode() for i in range(0, len(mac_address), 2)
+            ),
+            "signalStrength": int(signal_strength),
+        }
+        for mac_address, signal_strength in zip(tokens[::5], tokens[1::5])
+    ]
+
+
+GPS_FIELDS = [
+    Field("id", 2, text),
+    Field("accuracy", 7, float),
+    Field("speed", 8, float),
+    Field("azimuth", 9, float),
+    Field("altitude", 10, float),
+    Field("longitude", 11, float),
+    Field("latitude", 12, float),
+    Field("fix_time", 13, timestamp),
+    Field("battery", -3, float),
+    Field("send_time", -2, timestamp),
+]
+
+WIFI_FIELDS = [
+    Field("id", 2, text),
+    Field("access_points", slice(5, -7), parse_access_points),
+    Field("battery", -3, float),
+    Field("send_time", -2, timestamp),
+]
+
+LAYOUT = Text(
+    Field("type", 0),
+    Field("count", -1, text),
+    terminator=b"$",
+    variants={
+        HEARTBEAT: [Field("protocol", 1, text)],
+        **{type_: GPS_FIELDS for type_ in GPS_REPORTS},
+        **{type_: WIFI_FIELDS for type_ in WIFI_REPORTS},
+    },
+)
+
+
+class MicronBoltMini2UDPProtocol(DecoderProtocol):
     """
     An UDP protocol for the Micron Bolt Mini 2 GPS tracker.
 
@@ -43,88 +84,65 @@ class MicronBoltMini2UDPProtocol(asyncio.DatagramProtocol):
 
     If an API key is provided, the protocol will use the Google Geolocation service to
     determine the location of the device based on the WiFi access points it can see.
+    Lookups run in the background, so that the device is acknowledged immediately, at
+    most ``max_concurrency`` at a time. Locations are cached for ``cache_ttl`` seconds
+    for each set of access points, so that stationary devices don't repeat lookups.
     """
 
-    def __init__(self, queue: asyncio.Queue, api_key: Optional[str] = None) -> None:
-        self.queue = queue
+    layout = LAYOUT
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        queue: asyncio.Queue,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 4,
+        cache_size: int = 1024,
+        cache_ttl: float = 3600,
+    ) -> None:
+        super().__init__(queue)
         self.api_key = api_key
-        self.transport: Optional[asyncio.DatagramTransport] = None
 
-    def connection_made(self, transport: asyncio.BaseTransport) -> None:
-        self.transport = cast(asyncio.DatagramTransport, transport)
+        self.geolocator = (
+            Geolocator(api_key, max_concurrency, cache_size, cache_ttl)
+            if api_key
+            else None
+        )
+        self.tasks: Set["asyncio.Task[None]"] = set()
 
-    # pylint: disable=too-many-locals
-    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+    def handle(self, message: Message, addr: Tuple[str, int]) -> None:
         """
-        Handle incoming data.
+        Handle a decoded message, acknowledging it.
         """
-        if self.transport is None:
-            return
-
-        _logger.debug("Received %r from %s", data, addr)
-
-        message = data.decode().strip()
-        parts = message.split(",")
-        count = parts[-1].rstrip("$")
+        type_ = message.pop("type")
+        count = message.pop("count")
         reply = f"+SACK:{count}$\r\n"
 
         # heartbeat
-        if parts[0] == "+ACK:GTHBD":
-            protocol = parts[1]
-            reply = f"+SACK:GTHBD,{protocol},{count}$\r\n"
+        if type_ == HEARTBEAT:
+            reply = f"+SACK:GTHBD,{message['protocol']},{count}$\r\n"
 
         # WIFI information
-        elif self.api_key and parts[0] in {"+RESP:GTWIF", "+BUFF:GTWIF"}:
-            wifi_tokens = parts[5:-7]
-            wifi_access_points: List[WifiAccessPointType] = []
-            while wifi_tokens:
-                mac_address, signal_strength = wifi_tokens[:2]
-                wifi_tokens = wifi_tokens[5:]
-                wifi_access_points.append(
-                    {
-                        "macAddress": re.sub(r"(..)", r"\1:", mac_address),
-                        "signalStrength": int(signal_strength),
-                    },
-                )
-
-            payload = {
-                "considerIp": False,
-                "wifiAccessPoints": wifi_access_points,
-            }
-            response = requests.post(
-                "https://www.googleapis.com/geolocation/v1/geolocate",
-                params={"key": self.api_key},
-                json=payload,
-                timeout=60,
-            )
-            if response.ok:
-                result = response.json()
-                value = {
-                    "id": parts[2],
-                    "latitude": result["location"]["lat"],
-                    "longitude": result["location"]["lng"],
-                    "accuracy": result["accuracy"],
-                    "battery": float(parts[-3]),
-                    "send_time": parse_timestamp(parts[-2]),
-                    "source": "wifi",
-                }
-                self.queue.put_nowait(value)
+        elif self.geolocator and type_ in WIFI_REPORTS:
+            access_points = message.pop("access_points")
+            report = {**message, "source": "wifi"}
+            task = asyncio.create_task(self.geolocate(access_points, report))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
 
         # GPS information
-        elif parts[0] in {"+RESP:GTFRI", "+BUFF:GTFRI"}:
-            value = {
-                "id": parts[2],
-                "accuracy": float(parts[7]),
-                "speed": float(parts[8]),
-                "azimuth": float(parts[9]),
-                "altitude": float(parts[10]),
-                "longitude": float(parts[11]),
-                "latitude": float(parts[12]),
-                "fix_time": parse_timestamp(parts[13]),
-                "battery": float(parts[-3]),
-                "send_time": parse_timestamp(parts[-2]),
-                "source": "gps",
-            }
-            self.queue.put_nowait(value)
-
-        self.transport.sendto(reply.encode(), addr)
+        elif type_ in GPS_REPORTS:
+            self.queue.put_nowait({**message, "source": "gps"})
+
+        self.transport.sendto(reply.encode(), addr)  # type: ignore
+
+    async def geolocate(
+        self,
+        wifi_access_points: List[WifiAccessPointType],
+        report: Dict[str, Any],
+    ) -> None:
+        """
+        Find the location of a WiFi report, and send it to the queue.
+        """
+        location = await self.geolocator.locate(wifi_access_points)  # type: ignore
+        if location is not None:
+            self.queue.put_nowait({**report, **location})
@@ -0,0 +1,208 @@
+"""
+Receive UDP datagrams in worker processes.
+
+Each worker binds its own socket to the same address with ``SO_REUSEPORT``,
+so that the kernel balances datagrams between them, and drains the socket in
+batches with non-blocking ``recvfrom`` calls. Decoded messages are sent to
+the main process in batches through a pipe.
+"""
+
+import asyncio
+import logging
+import socket
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Tuple, Type
+
+from pkg_resources import iter_entry_points
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.sources.udp.decoders import Layout, get_protocol_class
+
+_logger = logging.getLogger(__name__)
+
+MAX_DATAGRAM_SIZE = 65535
+
+
+def load_protocol(name: str) -> Type[asyncio.DatagramProtocol]:
+    """
+    Load a protocol from the entry points.
+
+    Entry points can point to a protocol class, or to a layout from
+    ``senor_octopus.sources.udp.decoders``.
+    """
+    try:
+        protocol = next(
+            iter_entry_points("senor_octopus.source.udp.protocols", name),
+        ).load()
+    except StopIteration as ex:
+        raise InvalidConfigurationException(f'Protocol "{name}" not found') from ex
+
+    if isinstance(protocol, Layout):
+        return get_protocol_class(protocol)
+    return protocol
+
+
+class BoundedQueue(asyncio.Queue):
+    """
+    A queue that drops new items when full, counting them.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put_nowait(self, item: Any) -> None:
+        try:
+            super().put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                _logger.warning(
+                    "Queue is full, %d messages dropped so far",
+                    self.dropped,
+                )
+
+
+class Collector:
+    """
+    A queue replacement that sends messages to the main process in batches.
+
+    Messages are accumulated until the end of the current iteration of the
+    event loop, so that a burst of datagrams results in a single write.
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.values: List[Any] = []
+
+    def put_nowait(self, value: Any) -> None:
+        """
+        Add a message to the batch.
+        """
+        if not self.values:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.values.append(value)
+
+    def flush(self) -> None:
+        """
+        Send the batch to the main process.
+        """
+        values, self.values = self.values, []
+        self.connection.send(values)
+
+
+class SocketTransport:
+    """
+    A minimal datagram transport, so that protocols can send replies.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    def sendto(self, data: bytes, addr: Tuple[str, int]) -> None:
+        """
+        Send a datagram, dropping it if the socket buffer is full.
+        """
+        try:
+            self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            _logger.warning("Socket buffer is full, dropping reply to %s", addr)
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        """
+        Return information about the socket.
+        """
+        if name == "socket":
+            return self.sock
+        if name == "sockname":
+            return self.sock.getsockname()
+        return default
+
+    def close(self) -> None:
+        """
+        Close the socket.
+        """
+        self.sock.close()
+
+
+def create_socket(host: str, port: int, reuse_port: bool = False) -> socket.socket:
+    """
+    Create a non-blocking UDP socket bound to an address.
+    """
+    family, _, _, _, address = socket.getaddrinfo(
+        host,
+        port,
+        type=socket.SOCK_DGRAM,
+    )[0]
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def drain(
+    sock: socket.socket,
+    protocol: asyncio.DatagramProtocol,
+    batch_size: int,
+) -> int:
+    """
+    Read up to ``batch_size`` datagrams from a socket, without blocking.
+    """
+    for count in range(batch_size):
+        try:
+            data, addr = sock.recvfrom(MAX_DATAGRAM_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return count
+        protocol.datagram_received(data, addr)
+    return batch_size
+
+
+async def serve(  # pylint: disable=too-many-arguments
+    protocol_name: str,
+    host: str,
+    port: int,
+    connection: Connection,
+    batch_size: int,
+    kwargs: Dict[str, Any],
+) -> None:
+    """
+    Receive and decode datagrams until cancelled.
+    """
+    protocol_class = load_protocol(protocol_name)
+    sock = create_socket(host, port, reuse_port=True)
+    transport = SocketTransport(sock)
+    protocol = protocol_class(Collector(connection), **kwargs)  # type: ignore
+    protocol.connection_made(transport)  # type: ignore
+
+    loop = asyncio.get_running_loop()
+    loop.add_reader(sock.fileno(), drain, sock, protocol, batch_size)
+    try:
+        await asyncio.Future()
+    finally:
+        loop.remove_reader(sock.fileno())
+        transport.close()
+
+
+def worker(  # pylint: disable=too-many-arguments
+    protocol_name: str,
+    host: str,
+    port: int,
+    connection: Connection,
+    batch_size: int,
+    kwargs: Dict[str, Any],
+) -> None:  # pragma: no cover
+    """
+    Entry point of the worker processes.
+    """
+    try:
+        asyncio.run(serve(protocol_name, host, port, connection, batch_size, kwargs))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
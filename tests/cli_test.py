@@ -59,9 +59,17 @@ async def test_main(mocker) -> None:
     mock_scheduler.return_value.run = mocker.AsyncMock()
     mocker.patch("senor_octopus.cli.Scheduler", mock_scheduler)
 
+    close_state_stores = mocker.patch("senor_octopus.cli.close_state_stores")
+    run_shutdown_callbacks = mocker.patch(
+        "senor_octopus.cli.run_shutdown_callbacks",
+        new_callable=mocker.AsyncMock,
+    )
+
     await main(["config.yaml"])
 
     mock_scheduler.return_value.run.assert_called()
+    close_state_stores.assert_called()
+    run_shutdown_callbacks.assert_awaited()
 
 
 @pytest.mark.asyncio
@@ -2,8 +2,17 @@
 Pytest configuration.
 """
 
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List
+from unittest.mock import AsyncMock
+
 import pytest
+import pytest_asyncio
 import yaml
+from pytest_mock import MockerFixture
+
+from senor_octopus.mqtt import close_connections
 
 CONFIG_CONTENT = """
 random:
@@ -34,3 +43,64 @@ def mock_config():
     Mock config for testing.
     """
     yield yaml.load(CONFIG_CONTENT, Loader=yaml.SafeLoader)
+
+
+class FakeMQTTClient:
+    """
+    A fake ``asyncio_mqtt.Client``, delivering messages from a queue.
+
+    Exceptions put in the queue are raised from the message iterator, to
+    simulate disconnections, and ``None`` ends the iterator.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        self.args = args
+        self.kwargs = kwargs
+        self.inbox: "asyncio.Queue[Any]" = asyncio.Queue()
+        self.subscribe = AsyncMock()
+        self.unsubscribe = AsyncMock()
+        self.publish = AsyncMock()
+
+    async def __aenter__(self) -> "FakeMQTTClient":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        pass
+
+    @asynccontextmanager
+    async def unfiltered_messages(self) -> AsyncIterator[AsyncIterator[Any]]:
+        """
+        Return all the messages received.
+        """
+
+        async def messages() -> AsyncIterator[Any]:
+            while True:
+                message = await self.inbox.get()
+                if message is None:
+                    return
+                if isinstance(message, BaseException):
+                    raise message
+                yield message
+
+        yield messages()
+
+
+@pytest_asyncio.fixture
+async def fake_mqtt(mocker: MockerFixture) -> AsyncIterator[List[FakeMQTTClient]]:
+    """
+    Replace the MQTT client, returning the list of clients created.
+
+    The shared connections are closed at the end of the test.
+    """
+    clients: List[FakeMQTTClient] = []
+
+    def factory(*args: Any, **kwargs: Any) -> FakeMQTTClient:
+        client = FakeMQTTClient(*args, **kwargs)
+        clients.append(client)
+        return client
+
+    mocker.patch("senor_octopus.mqtt.Client", side_effect=factory)
+    mocker.patch.dict("senor_octopus.mqtt.connections", clear=True)
+    mocker.patch("senor_octopus.lib.shutdown_callbacks", [])
+    yield clients
+    await close_connections()
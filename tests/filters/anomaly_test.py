@@ -0,0 +1,145 @@
+"""
+Tests for the anomaly filter.
+"""
+
+import math
+import pickle
+import random
+from pathlib import Path
+from typing import Any, List, Sequence, Tuple
+
+import pytest
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.anomaly import Baseline, SeasonalBaseline, anomaly
+from senor_octopus.lib import SQLiteStateStore
+
+from .conftest import run_filter
+
+
+async def run(values: Sequence[Tuple[float, str, Any]], **kwargs: Any) -> List[Tuple]:
+    """
+    Run the filter, returning seconds since ``EPOCH``, names and scores.
+    """
+    return [
+        (seconds, name, round(value["score"], 1))
+        for seconds, name, value in await run_filter(anomaly, values, **kwargs)
+    ]
+
+
+def test_baseline() -> None:
+    """
+    Test the exponentially weighted mean and variance.
+    """
+    baseline = Baseline()
+    assert baseline.score(10) == 0
+
+    alpha = 0.1
+    values = [10.0, 12.0, 11.0, 9.0, 13.0]
+    for value in values:
+        baseline.update(value, alpha)
+
+    # compare with the explicit weighted sums
+    weights = [(1 - alpha) ** (len(values) - 1 - i) for i in range(len(values))]
+    weights[0] /= alpha
+    mean = sum(w * v for w, v in zip(weights, values)) / sum(weights)
+    assert baseline.count == 5
+    assert baseline.mean == pytest.approx(mean)
+    assert baseline.variance > 0
+    assert baseline.score(
+        baseline.mean + 2 * math.sqrt(baseline.variance),
+    ) == pytest.approx(2)
+
+    restored = pickle.loads(pickle.dumps(baseline))
+    assert (restored.count, restored.mean, restored.variance) == (
+        baseline.count,
+        baseline.mean,
+        baseline.variance,
+    )
+
+
+def test_seasonal_baseline() -> None:
+    """
+    Test picking the baseline for each slot of a season.
+    """
+    series = SeasonalBaseline(24)
+    assert series.get(0, 86400) is series.slots[0]
+    assert series.get(3600 * 25 + 1, 86400) is series.slots[1]
+    assert series.get(86399, 86400) is series.slots[23]
+    assert series.get(3600 * 5, None) is series.slots[0]
+    assert len(pickle.loads(pickle.dumps(series)).slots) == 24
+
+
+@pytest.mark.asyncio
+async def test_anomaly() -> None:
+    """
+    Test the filter.
+    """
+    random.seed(42)
+    values: List[Tuple[float, str, Any]] = [
+        (i, "hub.co2", 600 + random.gauss(0, 10)) for i in range(100)
+    ]
+    values[5] = (5, "hub.co2", 1500)
+    values[50] = (50, "hub.co2", 900)
+    values[60] = (60, "hub.co2", "invalid")
+    values[70] = (70, "hub.co2", 300)
+
+    # the first spike is during the warm-up
+    assert await run(values, warmup=30) == [
+        (50, "hub.co2.anomaly", 10.3),
+        (70, "hub.co2.anomaly", -7.9),
+    ]
+    # without a warm-up the first readings are noisy, since the variance is small
+    assert [seconds for seconds, _, _ in await run(values, warmup=0)] == [
+        2,
+        3,
+        5,
+        50,
+        70,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_anomaly_seasonality() -> None:
+    """
+    Test seasonal baselines.
+    """
+    # high values during the day, low values at night
+    values = [
+        (hour * 3600, "hub.co2", 1000.0 + hour % 2 if 8 <= hour % 24 < 20 else 400.0)
+        for hour in range(24 * 10)
+    ]
+    assert await run(values, warmup=2, seasonality="1 day") == []
+    assert len(await run(values, warmup=2)) > 0
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], seasonality="0 seconds")
+    assert str(excinfo.value) == "Invalid `seasonality` for anomaly"
+
+
+@pytest.mark.asyncio
+async def test_anomaly_state(tmp_path: Path) -> None:
+    """
+    Test that baselines are persisted across restarts.
+    """
+    path = str(tmp_path / "state.db")
+    values = [(i, "hub.co2", 600.0 + i % 2) for i in range(10)]
+
+    state = SQLiteStateStore(path, "anomaly")
+    assert await run(values, warmup=10, state=state) == []
+    state.close()
+
+    state = SQLiteStateStore(path, "anomaly")
+    assert await run([(10, "hub.co2", 700.0)], warmup=10, state=state) == [
+        (10, "hub.co2.anomaly", 210.0),
+    ]
+    state.close()
+
+
+def test_anomaly_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert anomaly.configuration_schema.load(
+        {"threshold": 4, "seasonality": "1 week", "slots": 168},
+    ) == {"threshold": 4.0, "seasonality": "1 week", "slots": 168}
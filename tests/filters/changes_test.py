@@ -0,0 +1,125 @@
+"""
+Tests for the changes filter.
+"""
+
+import math
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+from senor_octopus.filters.changes import changes, has_changed
+from senor_octopus.lib import MemoryStateStore, SQLiteStateStore
+
+from .conftest import run_filter
+
+run = partial(run_filter, changes)
+
+
+def test_has_changed() -> None:
+    """
+    Test comparing values.
+    """
+    assert not has_changed(1, 1)
+    assert has_changed(1, 1.1)
+    assert not has_changed(1, 1.1, deadband=0.5)
+    assert has_changed(1, 1.6, deadband=0.5)
+    assert not has_changed(100, 104, relative=0.05)
+    assert has_changed(100, 106, relative=0.05)
+    assert has_changed(100, 106, deadband=10, relative=0.05)
+    assert has_changed(100, 111, deadband=10, relative=0.5)
+    assert not has_changed(100, 101, deadband=10, relative=0.05)
+
+    assert has_changed(True, False, deadband=10)
+    assert has_changed(1, "1")
+    assert not has_changed("a", "a")
+    assert has_changed("a", "b")
+    assert not has_changed(math.nan, math.nan)
+    assert has_changed(math.nan, 1.0)
+    assert has_changed(1.0, math.nan, deadband=10)
+
+    assert not has_changed({"a": 1, "b": "x"}, {"a": 1.2, "b": "x"}, deadband=0.5)
+    assert has_changed({"a": 1, "b": "x"}, {"a": 1.2, "b": "y"}, deadband=0.5)
+    assert has_changed({"a": 1}, {"a": 1, "b": "x"})
+    assert has_changed({"a": {"b": 1}}, {"a": {"b": 2}})
+    assert has_changed({"a": 1}, 1)
+
+
+@pytest.mark.asyncio
+async def test_changes() -> None:
+    """
+    Test the filter.
+    """
+    values = [
+        (0, "hub.temp", 20.0),
+        (0, "hub.humid", 50),
+        (60, "hub.temp", 20.0),
+        (60, "hub.humid", 51),
+        (120, "hub.temp", 20.3),
+        (180, "hub.temp", 20.6),
+        (240, "hub.temp", 20.6),
+    ]
+    assert await run(values) == [
+        (0, "hub.temp", 20.0),
+        (0, "hub.humid", 50),
+        (60, "hub.humid", 51),
+        (120, "hub.temp", 20.3),
+        (180, "hub.temp", 20.6),
+    ]
+
+    # drift is compared with the last emitted value
+    assert await run(values, deadband=0.5) == [
+        (0, "hub.temp", 20.0),
+        (0, "hub.humid", 50),
+        (60, "hub.humid", 51),
+        (180, "hub.temp", 20.6),
+    ]
+
+    assert await run(values, relative=0.05) == [
+        (0, "hub.temp", 20.0),
+        (0, "hub.humid", 50),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_changes_heartbeat() -> None:
+    """
+    Test emitting unchanged values after a period of silence.
+    """
+    values = [(seconds, "hub.temp", 20.0) for seconds in range(0, 301, 60)]
+    assert await run(values, heartbeat="2 minutes") == [
+        (0, "hub.temp", 20.0),
+        (120, "hub.temp", 20.0),
+        (240, "hub.temp", 20.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_changes_state(tmp_path: Path) -> None:
+    """
+    Test that the last values are kept between runs and restarts.
+    """
+    state = MemoryStateStore()
+    assert await run([(0, "hub.temp", 20.0)], state=state) == [(0, "hub.temp", 20.0)]
+    assert await run([(60, "hub.temp", 20.0)], state=state) == []
+    assert await run([(120, "hub.temp", 21.0)], state=state) == [
+        (120, "hub.temp", 21.0),
+    ]
+
+    path = str(tmp_path / "state.db")
+    state = SQLiteStateStore(path, "changes")
+    assert await run([(0, "hub.temp", 20.0)], state=state) == [(0, "hub.temp", 20.0)]
+    state.close()
+
+    state = SQLiteStateStore(path, "changes")
+    assert await run([(60, "hub.temp", 20.0)], state=state) == []
+    state.close()
+
+
+def test_changes_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert changes.configuration_schema.load(
+        {"deadband": 0.5, "heartbeat": "1 hour"},
+    ) == {"deadband": 0.5, "heartbeat": "1 hour"}
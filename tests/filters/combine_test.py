@@ -2,39 +2,46 @@
 Tests for the combine filter.
 """
 
+import asyncio
+import statistics
 from datetime import datetime, timezone
 from math import isnan
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
 
+import aiotools
 import pytest
+from asyncstdlib.builtins import aiter as aiter_
 from freezegun import freeze_time
 
 from senor_octopus.filters.combine import (
+    Aggregation,
     AggregationType,
     AverageAggregation,
     CountAggregation,
+    DDSketch,
+    EWMAAggregation,
     FirstAggregation,
     LastAggregation,
     MaxAggregation,
     MinAggregation,
+    StddevAggregation,
     SumAggregation,
+    VarianceAggregation,
+    aggregation_map,
     combine,
 )
+from senor_octopus.lib import SQLiteStateStore
 from senor_octopus.types import Stream
 
+from .conftest import EPOCH, stream
 
-async def stream() -> Stream:
+
+def readings(*values: Dict[str, Any]) -> List[Tuple[float, str, Any]]:
     """
-    Generates events.
+    Build events received at the same time from their values.
     """
-    timestamp = datetime(2020, 1, 1, 0, 0, tzinfo=timezone.utc)
-    values = [
-        {"key": "a", "battery": 100},
-        {"key": "a", "location": "home"},
-        {"key": "a", "battery": 93, "location": "work"},
-        {"key": "b", "battery": 14},
-    ]
-    for value in values:
-        yield {"timestamp": timestamp, "name": "name", "value": value}
+    return [(0, "name", value) for value in values]
 
 
 @freeze_time("2021-01-01")
@@ -46,7 +53,14 @@ async def test_serialize() -> None:
     events = [
         event
         async for event in combine(
-            stream(),
+            stream(
+                readings(
+                    {"key": "a", "battery": 100},
+                    {"key": "a", "location": "home"},
+                    {"key": "a", "battery": 93, "location": "work"},
+                    {"key": "b", "battery": 14},
+                ),
+            ),
             "key",
             {"battery": AggregationType.AVERAGE, "location": AggregationType.LAST},
         )
@@ -57,6 +71,137 @@ async def test_serialize() -> None:
             "name": "hub.combine.key",
             "value": {"key": "a", "battery": 96.5, "location": "work"},
         },
+        {
+            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
+            "name": "hub.combine.key",
+            "value": {"key": "b", "battery": 14},
+        },
+    ]
+
+
+INTERLEAVED = readings(
+    {"key": "a", "battery": 100},
+    {"key": "b", "battery": 10},
+    {"key": "a", "battery": 90},
+    {"key": "c", "battery": 50},
+    {"key": "b", "battery": 20},
+    {"key": "a", "battery": 80},
+)
+
+
+@pytest.mark.asyncio
+async def test_combine_interleaved() -> None:
+    """
+    Test that interleaved keys are aggregated independently.
+    """
+    events = [
+        event["value"]
+        async for event in combine(
+            stream(INTERLEAVED),
+            "key",
+            {"battery": AggregationType.AVERAGE},
+            max_keys=1000,
+        )
+    ]
+    assert events == [
+        {"key": "c", "battery": 50.0},
+        {"key": "b", "battery": 15.0},
+        {"key": "a", "battery": 90.0},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_combine_max_keys() -> None:
+    """
+    Test that the least recently updated group is emitted when evicted.
+    """
+    events = [
+        event["value"]
+        async for event in combine(
+            stream(INTERLEAVED),
+            "key",
+            {"battery": AggregationType.MAX},
+            max_keys=2,
+        )
+    ]
+    assert events == [
+        {"key": "b", "battery": 10},
+        {"key": "a", "battery": 100},
+        {"key": "c", "battery": 50},
+        {"key": "b", "battery": 20},
+        {"key": "a", "battery": 80},
+    ]
+
+    events = [
+        event["value"]
+        async for event in combine(
+            stream(INTERLEAVED),
+            "key",
+            {"battery": AggregationType.COUNT},
+            max_keys=1,
+        )
+    ]
+    assert [event["key"] for event in events] == ["a", "b", "a", "c", "b", "a"]
+
+
+@pytest.mark.asyncio
+async def test_combine_timeout() -> None:
+    """
+    Test that idle groups are emitted after the timeout.
+    """
+    vclock = aiotools.VirtualClock()
+
+    async def slow_stream() -> Stream:
+        for key, sleep in [("a", 0), ("b", 30), ("a", 30), ("b", 200)]:
+            await asyncio.sleep(sleep)
+            yield {"timestamp": EPOCH, "name": "name", "value": {"key": key}}
+
+    with vclock.patch_loop():
+        loop = asyncio.get_running_loop()
+        events = [
+            (loop.time(), event["value"])
+            async for event in combine(
+                slow_stream(),
+                "key",
+                {"key": AggregationType.COUNT},
+                max_keys=10,
+                timeout="1 minute",
+            )
+        ]
+
+    assert events == [
+        (120.0, {"key": "b"}),
+        (120.0, {"key": "a"}),
+        (260.0, {"key": "b"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_combine_max_age() -> None:
+    """
+    Test that a key that is always active is emitted periodically.
+    """
+    vclock = aiotools.VirtualClock()
+    values = readings(*({"key": "a", "i": i} for i in range(10)))
+
+    with vclock.patch_loop():
+        loop = asyncio.get_running_loop()
+        events = [
+            (loop.time(), event["value"])
+            async for event in combine(
+                stream(values, delay=30),
+                "key",
+                {"i": AggregationType.COUNT},
+                max_keys=1000,
+                timeout="1 minute",
+                max_age="2 minutes",
+            )
+        ]
+
+    # the idle timeout alone would only emit the group when the stream ends
+    assert events == [
+        (150.0, {"key": "a", "i": 5}),
+        (300.0, {"key": "a", "i": 5}),
     ]
 
 
@@ -139,3 +284,285 @@ def test_sum_aggregation() -> None:
     with pytest.raises(TypeError) as excinfo:
         aggregation("invalid")
     assert str(excinfo.value) == "unsupported operand type(s) for +=: 'int' and 'str'"
+
+
+@pytest.mark.parametrize(
+    "aggregation_type,first,second,expected",
+    [
+        (AggregationType.AVERAGE, [1, 2], [6], 3.0),
+        (AggregationType.SUM, [1, 2], [6], 9),
+        (AggregationType.LAST, [1, 2], [6], 6),
+        (AggregationType.LAST, [1, 2], [], 2),
+        (AggregationType.FIRST, [1, 2], [6], 1),
+        (AggregationType.FIRST, [], [6], 6),
+        (AggregationType.MIN, [1, 2], [6], 1),
+        (AggregationType.MIN, [1, 2], [], 1),
+        (AggregationType.MAX, [1, 2], [6], 6),
+        (AggregationType.MAX, [1, 2], [], 2),
+        (AggregationType.COUNT, [1, 2], [6], 3),
+    ],
+)
+def test_aggregation_merge(
+    aggregation_type: AggregationType,
+    first: List[int],
+    second: List[int],
+    expected: Any,
+) -> None:
+    """
+    Test merging aggregations.
+    """
+    aggregation = aggregation_map[aggregation_type]()
+    for value in first:
+        aggregation(value)
+    other = aggregation_map[aggregation_type]()
+    for value in second:
+        other(value)
+
+    aggregation.merge(other)
+    assert aggregation.result == expected
+
+
+def test_average_aggregation_empty() -> None:
+    """
+    Test the result of an empty average.
+    """
+    assert isnan(AverageAggregation().result)
+
+
+def test_aggregation_base() -> None:
+    """
+    Test the base class.
+    """
+    aggregation = Aggregation()
+    with pytest.raises(NotImplementedError):
+        aggregation(1)
+    with pytest.raises(NotImplementedError):
+        aggregation.merge(aggregation)
+    with pytest.raises(NotImplementedError):
+        aggregation.result  # pylint: disable=pointless-statement
+
+
+def test_ddsketch() -> None:
+    """
+    Test the quantile sketch.
+    """
+    sketch = DDSketch()
+    assert isnan(sketch.quantile(0.5))
+
+    for value in range(1, 1001):
+        sketch.add(value)
+    for quantile, expected in [(0.5, 500.5), (0.95, 950.05), (0.99, 990.01)]:
+        assert sketch.quantile(quantile) == pytest.approx(expected, rel=0.02)
+    assert sketch.quantile(0) == pytest.approx(1, rel=0.01)
+    assert sketch.quantile(1) == pytest.approx(1000, rel=0.01)
+
+    sketch = DDSketch()
+    for value in [-10, -1, 0, 0, 1, 10]:
+        sketch.add(value)
+    assert sketch.quantile(0) == pytest.approx(-10, rel=0.01)
+    assert sketch.quantile(0.2) == pytest.approx(-1, rel=0.01)
+    assert sketch.quantile(0.5) == 0
+    assert sketch.quantile(1) == pytest.approx(10, rel=0.01)
+
+
+def test_ddsketch_merge() -> None:
+    """
+    Test that merging sketches is the same as adding all values to one.
+    """
+    first, second, both = DDSketch(), DDSketch(), DDSketch()
+    for value in range(-50, 100):
+        (first if value % 2 else second).add(value)
+        both.add(value)
+
+    first.merge(second)
+    assert first.count == both.count == 150
+    for quantile in [0, 0.1, 0.5, 0.9, 1]:
+        assert first.quantile(quantile) == both.quantile(quantile)
+
+
+def test_ddsketch_collapse() -> None:
+    """
+    Test that the number of buckets is bounded.
+    """
+    sketch = DDSketch(max_buckets=10)
+    for exponent in range(100):
+        sketch.add(1.1**exponent)
+    assert len(sketch.positive) == 10
+    assert sketch.count == 100
+    assert sketch.quantile(1) == pytest.approx(1.1**99, rel=0.01)
+
+
+@pytest.mark.parametrize(
+    "aggregation_type,expected",
+    [
+        (AggregationType.P50, 50),
+        (AggregationType.P95, 95),
+        (AggregationType.P99, 99),
+    ],
+)
+def test_quantile_aggregation(
+    aggregation_type: AggregationType,
+    expected: float,
+) -> None:
+    """
+    Test the quantile aggregations.
+    """
+    aggregation = aggregation_map[aggregation_type]()
+    for value in range(101):
+        result = aggregation(value)
+    assert result == pytest.approx(expected, rel=0.02)
+    assert isnan(aggregation("invalid"))
+
+    other = aggregation_map[aggregation_type]()
+    for value in range(101, 201):
+        other(value)
+    aggregation.merge(other)
+    assert aggregation.result == pytest.approx(expected * 2, rel=0.02)
+
+
+def test_variance_aggregation() -> None:
+    """
+    Test the variance and standard deviation aggregations.
+    """
+    values = [2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0]
+
+    variance = VarianceAggregation()
+    stddev = StddevAggregation()
+    assert isnan(variance(values[0]))
+    stddev(values[0])
+    for value in values[1:]:
+        variance(value)
+        stddev(value)
+    assert variance.result == pytest.approx(statistics.variance(values))
+    assert stddev.result == pytest.approx(statistics.stdev(values))
+    assert isnan(variance(None))
+
+    first, second = VarianceAggregation(), VarianceAggregation()
+    for value in values[:3]:
+        first(value)
+    for value in values[3:]:
+        second(value)
+    first.merge(second)
+    assert first.count == 8
+    assert first.result == pytest.approx(statistics.variance(values))
+
+    empty = VarianceAggregation()
+    empty.merge(VarianceAggregation())
+    assert empty.count == 0
+
+
+def test_ewma_aggregation() -> None:
+    """
+    Test the EWMA aggregation.
+    """
+    aggregation = EWMAAggregation()
+    assert isnan(aggregation.result)
+    assert aggregation(10) == 10
+    assert aggregation(20) == pytest.approx(11)
+    assert aggregation(0) == pytest.approx(9.9)
+    assert isnan(aggregation("invalid"))
+
+    values = [3.0, 8.0, 1.0, 7.0, 4.0, 9.0]
+    sequential = EWMAAggregation()
+    for value in values:
+        sequential(value)
+
+    first, second = EWMAAggregation(), EWMAAggregation()
+    for value in values[:2]:
+        first(value)
+    for value in values[2:]:
+        second(value)
+    first.merge(second)
+    assert first.result == pytest.approx(sequential.result)
+    assert first.count == 6
+
+    first.merge(EWMAAggregation())
+    assert first.result == pytest.approx(sequential.result)
+
+    empty = EWMAAggregation()
+    empty.merge(second)
+    assert empty.result == second.result
+
+
+@pytest.mark.asyncio
+async def test_combine_partial() -> None:
+    """
+    Test that partial aggregates from different nodes can be merged.
+    """
+
+    aggregate = {"latency": AggregationType.STDDEV}
+    partials = [
+        event
+        async for values in aiter_([[1.0, 2.0, 3.0], [10.0, 20.0]])
+        async for event in combine(
+            stream(readings(*({"key": "a", "latency": value} for value in values))),
+            "key",
+            aggregate,
+            partial=True,
+        )
+    ]
+    assert len(partials) == 2
+    assert isinstance(partials[0]["value"]["latency"], StddevAggregation)
+
+    events = [event async for event in combine(aiter_(partials), "key", aggregate)]
+    assert events[0]["value"] == {
+        "key": "a",
+        "latency": pytest.approx(statistics.stdev([1.0, 2.0, 3.0, 10.0, 20.0])),
+    }
+
+
+def test_combine_configuration_schema() -> None:
+    """
+    Test that aggregations are loaded by value.
+    """
+    assert combine.configuration_schema.load(
+        {"key": "id", "aggregate": {"latency": "p95", "battery": "average"}},
+    ) == {
+        "key": "id",
+        "aggregate": {
+            "latency": AggregationType.P95,
+            "battery": AggregationType.AVERAGE,
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_combine_state(tmp_path: Path) -> None:
+    """
+    Test that groups survive restarts.
+    """
+
+    async def gen(values: List[Dict[str, Any]]) -> Stream:
+        for value in values:
+            yield {"timestamp": EPOCH, "name": "name", "value": value}
+        # simulate a restart, before the stream ends
+        raise asyncio.CancelledError("Restart")
+
+    path = str(tmp_path / "state.db")
+    aggregate = {"battery": AggregationType.AVERAGE}
+
+    state = SQLiteStateStore(path, "combine")
+    with pytest.raises(asyncio.CancelledError):
+        async for _ in combine(
+            gen([{"key": "a", "battery": 100}, {"key": "b", "battery": 10}]),
+            "key",
+            aggregate,
+            max_keys=1,
+            state=state,
+        ):
+            pass
+    state.close()
+
+    state = SQLiteStateStore(path, "combine")
+    events = [
+        event
+        async for event in combine(
+            stream(readings({"key": "b", "battery": 20})),
+            "key",
+            aggregate,
+            state=state,
+        )
+    ]
+    assert [event["value"] for event in events] == [{"key": "b", "battery": 15}]
+    assert state.get("b") is None
+    state.close()
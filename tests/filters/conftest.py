@@ -0,0 +1,40 @@
+"""
+Helpers for the filter tests.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterable, List, Tuple
+
+from senor_octopus.types import Stream
+
+EPOCH = datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc)
+
+
+async def stream(values: Iterable[Tuple[float, str, Any]], delay: float = 0) -> Stream:
+    """
+    Generate events from seconds since ``EPOCH``, names and values.
+
+    The stream sleeps for ``delay`` seconds before each event.
+    """
+    for seconds, name, value in values:
+        await asyncio.sleep(delay)
+        yield {
+            "timestamp": EPOCH + timedelta(seconds=seconds),
+            "name": name,
+            "value": value,
+        }
+
+
+async def run_filter(
+    filter_: Callable[..., Stream],
+    values: Iterable[Tuple[float, str, Any]],
+    **kwargs: Any,
+) -> List[Tuple]:
+    """
+    Run a filter, returning seconds since ``EPOCH``, names and values.
+    """
+    return [
+        ((event["timestamp"] - EPOCH).total_seconds(), event["name"], event["value"])
+        async for event in filter_(stream(values), **kwargs)
+    ]
@@ -0,0 +1,209 @@
+"""
+Tests for the dedup filter.
+"""
+
+from typing import Any, List
+
+import aiotools
+import pytest
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.dedup import (
+    BloomFilter,
+    DedupMode,
+    LRUSet,
+    RotatingBloomFilter,
+    dedup,
+    fingerprint,
+)
+
+from .conftest import EPOCH, run_filter, stream
+
+
+async def run(values: List[Any], delay: float = 1, **kwargs: Any) -> List[Any]:
+    """
+    Run the filter with a virtual clock, receiving a value every ``delay`` seconds.
+    """
+    events = stream([(0, "hub.micron", value) for value in values], delay)
+    with aiotools.VirtualClock().patch_loop():
+        return [event["value"] async for event in dedup(events, **kwargs)]
+
+
+def test_fingerprint() -> None:
+    """
+    Test computing the digest of an event.
+    """
+    event = {
+        "timestamp": EPOCH,
+        "name": "hub.micron",
+        "value": {"serial": "123", "lat": 1.0, "nested": {"id": 1}},
+    }
+    digest = fingerprint(event, ["name", "value"])  # type: ignore
+    assert len(digest) == 16
+
+    # dictionary order doesn't matter
+    other = {
+        "timestamp": EPOCH,
+        "name": "hub.micron",
+        "value": {"nested": {"id": 1}, "lat": 1.0, "serial": "123"},
+    }
+    assert fingerprint(other, ["name", "value"]) == digest  # type: ignore
+
+    assert fingerprint(event, ["value.serial"]) != digest  # type: ignore
+    assert fingerprint(event, ["value.nested.id"]) == fingerprint(  # type: ignore
+        {"timestamp": EPOCH, "name": "other", "value": {"nested": {"id": 1}}},
+        ["value.nested.id"],
+    )
+    assert fingerprint(event, ["value.serial.missing"]) == fingerprint(  # type: ignore
+        event,  # type: ignore
+        ["value.missing"],
+    )
+    assert fingerprint(event, ["timestamp"]) != digest  # type: ignore
+
+    # fields can't run into each other
+    assert fingerprint(
+        {"timestamp": EPOCH, "name": "ab", "value": "c"},
+        ["name", "value"],
+    ) != fingerprint(
+        {"timestamp": EPOCH, "name": "a", "value": "bc"}, ["name", "value"]
+    )
+
+    # binary values are hashed directly
+    assert fingerprint(
+        {"timestamp": EPOCH, "name": "a", "value": b"bc"},
+        ["value"],
+    ) == fingerprint({"timestamp": EPOCH, "name": "a", "value": "bc"}, ["value"])
+
+
+def test_lru_set() -> None:
+    """
+    Test the exact set.
+    """
+    seen = LRUSet(max_keys=2, ttl=10)
+    assert not seen.check(b"a", 0)
+    assert seen.check(b"a", 1)
+    assert not seen.check(b"b", 2)
+    assert not seen.check(b"c", 3)
+    assert len(seen.entries) == 2
+
+    # "a" was evicted
+    assert not seen.check(b"a", 4)
+
+    # "b" and "c" expired
+    assert not seen.check(b"b", 13)
+    assert seen.entries == {b"a": 14, b"b": 23}
+    assert seen.memory == 300
+
+    seen = LRUSet(max_keys=2, ttl=None)
+    assert not seen.check(b"a", 0)
+    assert seen.check(b"a", 1e9)
+
+    # "a" was used more recently than "b", so "b" is evicted
+    assert not seen.check(b"b", 1)
+    assert seen.check(b"a", 2)
+    assert not seen.check(b"c", 3)
+    assert list(seen.entries) == [b"a", b"c"]
+
+    # seeing an entry refreshes its expiration
+    seen = LRUSet(max_keys=2, ttl=10)
+    assert not seen.check(b"a", 0)
+    assert seen.check(b"a", 8)
+    assert seen.check(b"a", 16)
+    assert seen.entries == {b"a": 26}
+
+
+def test_bloom_filter() -> None:
+    """
+    Test the Bloom filter.
+    """
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    assert bloom.size == 9586
+    assert bloom.hashes == 7
+    assert len(bloom.bits) == 1199
+
+    digests = [
+        fingerprint({"value": i}, ["value"]) for i in range(1000)  # type: ignore
+    ]
+    found = sum(bloom.add(bloom.positions(digest)) for digest in digests)
+    assert found < 10
+    assert all(bloom.positions(digest) in bloom for digest in digests)
+
+    others = [
+        fingerprint({"value": i}, ["value"]) for i in range(1000, 11000)  # type: ignore
+    ]
+    false_positives = sum(bloom.positions(digest) in bloom for digest in others)
+    assert false_positives / len(others) < 0.02
+
+
+def test_rotating_bloom_filter() -> None:
+    """
+    Test the rotating Bloom filter.
+    """
+    seen = RotatingBloomFilter(capacity=100, error_rate=0.001, period=10)
+    assert seen.memory == 360
+
+    assert not seen.check(b"a" * 16, 0)
+    assert seen.check(b"a" * 16, 5)
+
+    # after rotating "a" is still in the previous filter
+    assert not seen.check(b"b" * 16, 10)
+    assert seen.check(b"a" * 16, 11)
+
+    # "a" was added to the current filter when seen again
+    assert seen.check(b"a" * 16, 21)
+    assert seen.check(b"b" * 16, 22)
+    assert not seen.check(b"c" * 16, 25)
+
+    # idle for more than a period
+    assert not seen.check(b"c" * 16, 60)
+
+
+@pytest.mark.asyncio
+async def test_dedup() -> None:
+    """
+    Test the filter.
+    """
+    values = [1, 2, 1, 3, 2]
+    assert await run(values) == [1, 2, 3]
+    assert await run(values, ttl="2 seconds") == [1, 2, 1, 3, 2]
+    assert await run(values, max_keys=1) == [1, 2, 1, 3, 2]
+    assert await run(values, mode=DedupMode.BLOOM, ttl="1 hour") == [1, 2, 3]
+
+    reports = [
+        {"serial": "a", "report": 1, "retransmitted": False},
+        {"serial": "a", "report": 1, "retransmitted": True},
+        {"serial": "b", "report": 1, "retransmitted": False},
+    ]
+    keys = ["name", "value.serial", "value.report"]
+    assert await run(reports, delay=0, keys=keys) == [reports[0], reports[2]]
+
+    # readings that repeat a value at different times are kept by default
+    readings = [(0, "hub.co2", 400), (60, "hub.co2", 400), (60, "hub.co2", 400)]
+    assert await run_filter(dedup, readings) == readings[:2]
+
+
+@pytest.mark.asyncio
+async def test_dedup_invalid() -> None:
+    """
+    Test invalid configurations.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], keys=["id"])
+    assert str(excinfo.value) == 'Invalid key "id" for dedup'
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], mode=DedupMode.BLOOM)
+    assert str(excinfo.value) == "The bloom mode requires a `ttl`"
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], ttl="0 seconds")
+    assert str(excinfo.value) == "Invalid `ttl` for dedup"
+
+
+def test_dedup_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert dedup.configuration_schema.load(
+        {"keys": ["value.serial"], "mode": "bloom", "ttl": "10 minutes"},
+    ) == {"keys": ["value.serial"], "mode": DedupMode.BLOOM, "ttl": "10 minutes"}
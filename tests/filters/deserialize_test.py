@@ -2,13 +2,20 @@
 Tests for the deserializer filter.
 """
 
+import json
 from datetime import datetime, timezone
+from typing import Any
 
+import msgpack
 import pytest
 from freezegun import freeze_time
+from pytest_mock import MockerFixture
 
+from senor_octopus.exceptions import InvalidConfigurationException
 from senor_octopus.filters.deserialize import deserialize
+from senor_octopus.serialization import Codec
 from senor_octopus.sources.static import static
+from senor_octopus.types import Stream
 
 
 @freeze_time("2021-01-01")
@@ -36,3 +43,216 @@ async def test_deserialize() -> None:
             "value": {"foo": "bar"},
         },
     ]
+
+
+@freeze_time("2021-01-01")
+@pytest.mark.asyncio
+async def test_deserialize_binary() -> None:
+    """
+    Test that binary payloads are decoded directly.
+    """
+    events = [
+        event
+        async for event in deserialize(
+            static("name", memoryview(b"\x81\xa3foo\xa3bar")),
+            "msgpack",
+        )
+    ]
+    assert events == [
+        {
+            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
+            "name": "name",
+            "value": {"foo": "bar"},
+        },
+    ]
+
+    events = [
+        event async for event in deserialize(static("name", b'{"foo":"bar"}'), "orjson")
+    ]
+    assert events[0]["value"] == {"foo": "bar"}
+
+
+async def payload_stream(value: Any) -> Stream:
+    """
+    Generate a single event with a given payload.
+    """
+    yield {
+        "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
+        "name": "hub.mqtt.readings",
+        "value": value,
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "payload",
+    [
+        '{"a": 1}\n\n{"a": 2}\r\n  \n{"a": 3}\n',
+        b'{"a": 1}\n\n{"a": 2}\r\n  \n{"a": 3}\n',
+        memoryview(b'{"a": 1}\n\n{"a": 2}\r\n  \n{"a": 3}'),
+    ],
+)
+async def test_deserialize_split_lines(payload: Any) -> None:
+    """
+    Test splitting NDJSON payloads into one event per line.
+    """
+    events = [
+        event
+        async for event in deserialize(
+            payload_stream(payload),
+            "json",
+            split="lines",
+            suffix=".reading",
+        )
+    ]
+    assert events == [
+        {
+            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
+            "name": "hub.mqtt.readings.reading",
+            "value": {"a": i},
+        }
+        for i in range(1, 4)
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("format_", ["json", "orjson"])
+async def test_deserialize_split_array(format_: str) -> None:
+    """
+    Test splitting a JSON array into one event per element.
+    """
+    payload = b' [ {"a": 1} , [2, 3],"four, [five]\\"" ,\n5 ] '
+    events = [
+        event
+        async for event in deserialize(
+            payload_stream(memoryview(payload)),
+            format_,
+            split="array",
+            suffix=".{index}",
+        )
+    ]
+    assert [(event["name"], event["value"]) for event in events] == [
+        ("hub.mqtt.readings.0", {"a": 1}),
+        ("hub.mqtt.readings.1", [2, 3]),
+        ("hub.mqtt.readings.2", 'four, [five]"'),
+        ("hub.mqtt.readings.3", 5),
+    ]
+
+    for empty in (" [ ] ", memoryview(b" [ ] ")):
+        events = [
+            event
+            async for event in deserialize(
+                payload_stream(empty), format_, split="array"
+            )
+        ]
+        assert events == []
+
+
+@pytest.mark.asyncio
+async def test_deserialize_split_msgpack() -> None:
+    """
+    Test splitting a msgpack array.
+    """
+    payload = msgpack.packb([{"a": 1}, {"a": 2}])
+    events = [
+        event
+        async for event in deserialize(
+            payload_stream(payload),
+            "msgpack",
+            split="array",
+        )
+    ]
+    assert [(event["name"], event["value"]) for event in events] == [
+        ("hub.mqtt.readings", {"a": 1}),
+        ("hub.mqtt.readings", {"a": 2}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_deserialize_split_max_records(mocker: MockerFixture) -> None:
+    """
+    Test that records beyond ``max_records`` are dropped.
+    """
+    _logger = mocker.patch("senor_octopus.filters.deserialize._logger")
+    events = [
+        event
+        async for event in deserialize(
+            payload_stream("[1, 2, 3, 4]"),
+            "json",
+            split="array",
+            max_records=2,
+        )
+    ]
+    assert [event["value"] for event in events] == [1, 2]
+    _logger.warning.assert_called_with(
+        "Payload from %s has more than %d records, dropping the rest",
+        "hub.mqtt.readings",
+        2,
+    )
+
+    # records beyond the limit are not decoded
+    decode = mocker.MagicMock(side_effect=json.loads)
+    mocker.patch(
+        "senor_octopus.filters.deserialize.get_codec",
+        return_value=Codec(json.dumps, decode),
+    )
+    for split, payload in [("lines", "1\n2\n3\n4"), ("array", "[1, 2, [3, 4]")]:
+        events = [
+            event
+            async for event in deserialize(
+                payload_stream(payload),
+                "json",
+                split=split,
+                max_records=2,
+            )
+        ]
+        assert [event["value"] for event in events] == [1, 2]
+    assert decode.call_count == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "payload,message",
+    [
+        ('{"a": 1}', "Payload is not a JSON array"),
+        ("[1 2]", "Expecting ',' delimiter at position 3"),
+        ("[1, [2]", "Expecting ',' delimiter at position 7"),
+    ],
+)
+async def test_deserialize_split_invalid_array(payload: str, message: str) -> None:
+    """
+    Test splitting invalid arrays.
+    """
+    with pytest.raises(ValueError) as excinfo:
+        async for _ in deserialize(payload_stream(payload), "json", split="array"):
+            pass
+    assert str(excinfo.value) == message
+
+
+@pytest.mark.asyncio
+async def test_deserialize_split_orjson_not_array() -> None:
+    """
+    Test splitting a payload that is not an array with orjson.
+    """
+    with pytest.raises(ValueError) as excinfo:
+        async for _ in deserialize(
+            payload_stream(b'{"a": 1}'), "orjson", split="array"
+        ):
+            pass
+    assert str(excinfo.value) == "Payload is not a JSON array"
+
+
+@pytest.mark.asyncio
+async def test_deserialize_split_invalid_config() -> None:
+    """
+    Test invalid split configurations.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        async for _ in deserialize(payload_stream("[]"), "json", split="chunks"):
+            pass
+    assert str(excinfo.value) == 'Invalid split mode "chunks"'
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        async for _ in deserialize(payload_stream("[]"), "yaml", split="array"):
+            pass
+    assert str(excinfo.value) == 'Format "yaml" does not support splitting arrays'
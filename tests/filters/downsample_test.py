@@ -0,0 +1,159 @@
+"""
+Tests for the downsample filter.
+"""
+
+import random
+from typing import Any, List, Tuple
+
+import pytest
+from pytest_mock import MockerFixture
+
+from senor_octopus.filters.downsample import DownsampleMethod, downsample
+
+from .conftest import run_filter
+
+
+async def run(values: List[Tuple[str, Any]], **kwargs: Any) -> List[Tuple]:
+    """
+    Run the filter on names and values, one per second.
+    """
+    return await run_filter(
+        downsample,
+        [(seconds, name, value) for seconds, (name, value) in enumerate(values)],
+        **kwargs,
+    )
+
+
+def reference_lttb(points: List[Tuple[float, float]], bucket: int) -> List[int]:
+    """
+    A batch implementation of LTTB with fixed-size buckets.
+    """
+    if len(points) < 3:
+        return list(range(len(points)))
+
+    chunks = [
+        list(range(start, min(start + bucket, len(points) - 1)))
+        for start in range(1, len(points) - 1, bucket)
+    ]
+    selected = [0]
+    for i, chunk in enumerate(chunks):
+        if i + 1 < len(chunks):
+            following = chunks[i + 1]
+            cx = sum(points[j][0] for j in following) / len(following)
+            cy = sum(points[j][1] for j in following) / len(following)
+        else:
+            cx, cy = points[-1]
+        ax, ay = points[selected[-1]]
+        selected.append(
+            max(
+                chunk,
+                key=lambda j: abs(
+                    (ax - cx) * (points[j][1] - ay) - (ax - points[j][0]) * (cy - ay),
+                ),
+            ),
+        )
+    selected.append(len(points) - 1)
+    return selected
+
+
+@pytest.mark.asyncio
+async def test_downsample_nth() -> None:
+    """
+    Test keeping every Nth event.
+    """
+    values = [("hub.a", i) for i in range(7)] + [("hub.b", "x"), ("hub.b", "y")]
+    assert await run(values, method=DownsampleMethod.NTH, bucket=3) == [
+        (0, "hub.a", 0),
+        (3, "hub.a", 3),
+        (6, "hub.a", 6),
+        (7, "hub.b", "x"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_downsample_minmax() -> None:
+    """
+    Test keeping the minimum and maximum of each bucket.
+    """
+    values = [
+        ("hub.a", {"speed": 3}),
+        ("hub.a", {"speed": 1}),
+        ("hub.a", {"speed": 5}),
+        ("hub.a", {"speed": 4}),
+        ("hub.a", {"speed": None}),
+        ("hub.a", {"speed": 2}),
+        ("hub.a", {"speed": 2}),
+        ("hub.a", {"speed": 7}),
+        ("hub.a", "invalid"),
+    ]
+    assert await run(
+        values, method=DownsampleMethod.MINMAX, bucket=3, field="speed"
+    ) == [
+        (1, "hub.a", {"speed": 1}),
+        (2, "hub.a", {"speed": 5}),
+        (3, "hub.a", {"speed": 4}),
+        (5, "hub.a", {"speed": 2}),
+        (7, "hub.a", {"speed": 7}),
+    ]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 20, 21, 22, 100, 200, 201])
+@pytest.mark.parametrize("bucket", [1, 3, 64])
+@pytest.mark.asyncio
+async def test_downsample_lttb(size: int, bucket: int) -> None:
+    """
+    Test that the incremental LTTB matches a batch implementation.
+    """
+    random.seed(42)
+    values = [random.gauss(0, 1) for _ in range(size)]
+    points = [(float(i), value) for i, value in enumerate(values)]
+
+    events = await run(
+        [("hub.a", value) for value in values],
+        method=DownsampleMethod.LTTB,
+        bucket=bucket,
+    )
+    assert [int(seconds) for seconds, _, _ in events] == reference_lttb(points, bucket)
+
+
+@pytest.mark.asyncio
+async def test_downsample_without_numpy(mocker: MockerFixture) -> None:
+    """
+    Test that results are the same without NumPy.
+    """
+    random.seed(42)
+    values = [("hub.a", random.gauss(0, 1)) for _ in range(500)]
+    with_numpy = await run(values, method=DownsampleMethod.LTTB, bucket=100)
+    minmax_with_numpy = await run(values, method=DownsampleMethod.MINMAX, bucket=100)
+
+    mocker.patch("senor_octopus.filters.downsample.np", None)
+    assert await run(values, method=DownsampleMethod.LTTB, bucket=100) == with_numpy
+    assert (
+        await run(values, method=DownsampleMethod.MINMAX, bucket=100)
+        == minmax_with_numpy
+    )
+
+
+@pytest.mark.asyncio
+async def test_downsample_multiple_series() -> None:
+    """
+    Test that series are downsampled independently.
+    """
+    values = [("hub.a", 1), ("hub.b", 10), ("hub.a", 2), ("hub.b", 20), ("hub.a", 3)]
+    assert await run(values, method=DownsampleMethod.LTTB, bucket=5) == [
+        (0, "hub.a", 1),
+        (1, "hub.b", 10),
+        (2, "hub.a", 2),
+        (4, "hub.a", 3),
+        (3, "hub.b", 20),
+    ]
+
+
+def test_downsample_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert downsample.configuration_schema.load({"method": "lttb", "bucket": 5}) == {
+        "method": DownsampleMethod.LTTB,
+        "bucket": 5,
+    }
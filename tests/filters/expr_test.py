@@ -0,0 +1,162 @@
+"""
+Tests for the expr filter.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, List, Tuple
+
+import pytest
+from pytest_mock import MockerFixture
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.expr import CompiledExpression, expr
+from senor_octopus.types import Stream
+
+TIMESTAMP = datetime(2021, 1, 1, 12, 30, tzinfo=timezone.utc)
+
+
+async def stream(values: List[Tuple[str, Any]]) -> Stream:
+    """
+    Generate events from names and values.
+    """
+    for name, value in values:
+        yield {"timestamp": TIMESTAMP, "name": name, "value": value}
+
+
+async def run(values: List[Tuple[str, Any]], **kwargs: Any) -> List[Tuple]:
+    """
+    Run the filter, returning names and values.
+    """
+    return [
+        (event["name"], event["value"])
+        async for event in expr(stream(values), **kwargs)
+    ]
+
+
+def evaluate(expression: str, name: str = "hub.awair.temp", value: Any = 1) -> Any:
+    """
+    Evaluate an expression on a single event.
+    """
+    return CompiledExpression(expression).evaluate(
+        {"timestamp": TIMESTAMP, "name": name, "value": value},
+    )
+
+
+def test_compiled_expression() -> None:
+    """
+    Test evaluating expressions.
+    """
+    assert evaluate("value * 1.8 + 32", value=100) == 212
+    assert evaluate('value > 10 and name.startswith("hub.awair")', value=20)
+    assert not evaluate('value > 10 and name.startswith("hub.awair")', value=5)
+    assert evaluate("0 < value < 10 or not value", value=0)
+    assert evaluate('"high" if value > 10 else "low"', value=5) == "low"
+    assert evaluate('value["co2"] // 100 % 7', value={"co2": 1234}) == 5
+    assert evaluate('value.get("co2", 0) - 1', value={}) == -1
+    assert evaluate("timestamp.hour") == 12
+    assert evaluate("name.split('.')[-1].upper()") == "TEMP"
+    assert evaluate("abs(-value) ** 2 + round(max(1.4, min(value, 2)))") == 2
+    assert evaluate("value in [1, 2] and value is not None and value != 2")
+    assert evaluate("str(int(float(value))) + 'x'") == "1x"
+
+
+@pytest.mark.parametrize(
+    "expression,message",
+    [
+        ("__import__('os')", "Name `__import__` is not allowed"),
+        ("value.__class__", "Attribute `__class__` is not allowed"),
+        ("(lambda: 1)()", "`Lambda` is not allowed"),
+        ("[x for x in value]", "`ListComp` is not allowed"),
+        ("round(value, ndigits=2)", "Keyword arguments are not allowed"),
+        ("value +", "invalid syntax (<unknown>, line 1)"),
+    ],
+)
+def test_compiled_expression_invalid(expression: str, message: str) -> None:
+    """
+    Test that only allowed syntax is accepted.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        CompiledExpression(expression)
+    assert str(excinfo.value) == f'Invalid expression "{expression}": {message}'
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "value * 1.8 + 32",
+        "abs(value - 5) > 2",
+        "0 < value < 5 or value == 9",
+        "not value > 3",
+        "-value if value > 5 else value",
+        "min(value, 3)",
+        "value in [1, 2]",
+        "10 / (value - 3)",
+        # overflows 64-bit integers
+        "value * 2**62",
+    ],
+)
+@pytest.mark.parametrize("values", [list(range(10)), [i / 2 for i in range(10)]])
+def test_map(expression: str, values: List[float], mocker: MockerFixture) -> None:
+    """
+    Test that vectorized expressions match the per element results.
+    """
+    compiled = CompiledExpression(expression)
+    event = {"timestamp": TIMESTAMP, "name": "hub.a", "value": values}
+
+    try:
+        expected = [
+            compiled.evaluate({**event, "value": value})  # type: ignore
+            for value in values
+        ]
+    except ZeroDivisionError:
+        with pytest.raises(ZeroDivisionError):
+            compiled.map(event, values)  # type: ignore
+        return
+
+    assert compiled.map(event, values) == expected  # type: ignore
+
+    mocker.patch("senor_octopus.filters.expr.np", None)
+    assert CompiledExpression(expression).map(event, values) == expected  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_expr() -> None:
+    """
+    Test the filter.
+    """
+    values = [
+        ("hub.awair.temp", 35),
+        ("hub.awair.temp", 20),
+        ("hub.whistle.temp", 40),
+        ("hub.awair.temp", "invalid"),
+    ]
+    assert await run(
+        values,
+        filter='name.startswith("hub.awair") and value > 30',
+        value="value * 1.8 + 32",
+        name='name + ".fahrenheit"',
+    ) == [("hub.awair.temp.fahrenheit", 95.0)]
+
+    assert await run(values) == values
+
+
+@pytest.mark.asyncio
+async def test_expr_batch() -> None:
+    """
+    Test that lists of numbers are processed element-wise.
+    """
+    values = [("hub.a", [1, 5, 10, 20]), ("hub.a", [1, 2]), ("hub.a", [True, False])]
+    # lists of booleans are not batches
+    assert await run(values, filter="value > 4", value="value * 2") == [
+        ("hub.a", [10, 20, 40]),
+    ]
+    assert await run(values[:1], value="value * 2") == [("hub.a", [2, 10, 20, 40])]
+
+
+def test_expr_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert expr.configuration_schema.load({"filter": "value > 1"}) == {
+        "filter": "value > 1",
+    }
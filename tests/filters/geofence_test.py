@@ -0,0 +1,214 @@
+"""
+Tests for the geofence filter.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+import geohash
+import pytest
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.geofence import (
+    Circle,
+    GridIndex,
+    Polygon,
+    geofence,
+    get_point,
+    haversine,
+)
+from senor_octopus.lib import MemoryStateStore
+from senor_octopus.types import Stream
+
+EPOCH = datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc)
+
+HOME = (37.7749, -122.4194)
+
+FENCES = [
+    {"name": "home", "center": list(HOME), "radius": 100},
+    {
+        "name": "park",
+        "polygon": [[37.76, -122.46], [37.77, -122.46], [37.77, -122.51]],
+    },
+]
+
+
+async def stream(values: List[Tuple[str, Any]]) -> Stream:
+    """
+    Generate events from names and values, one second apart.
+    """
+    for seconds, (name, value) in enumerate(values):
+        yield {
+            "timestamp": EPOCH + timedelta(seconds=seconds),
+            "name": name,
+            "value": value,
+        }
+
+
+async def run(values: List[Tuple[str, Any]], **kwargs: Any) -> List[Dict[str, Any]]:
+    """
+    Run the filter, returning the values of the transitions.
+    """
+    kwargs.setdefault("fences", FENCES)
+    return [event["value"] async for event in geofence(stream(values), **kwargs)]
+
+
+def test_haversine() -> None:
+    """
+    Test the distance between two points.
+    """
+    assert haversine(HOME, HOME) == 0
+    assert haversine(HOME, (37.7749, -122.4194 + 0.01)) == pytest.approx(880, rel=0.01)
+
+
+def test_fences() -> None:
+    """
+    Test testing points against fences.
+    """
+    circle = Circle("home", HOME, 100)
+    assert HOME in circle
+    assert (37.7749 + 0.0008, -122.4194) in circle
+    assert (37.7749 + 0.001, -122.4194) not in circle
+    # inside the bounding box, but outside the circle
+    assert (37.7749 + 0.00085, -122.4194 + 0.00105) not in circle
+
+    triangle = Polygon("triangle", [(0, 0), (0, 10), (10, 0)])
+    assert (1, 1) in triangle
+    assert (6, 6) not in triangle
+    assert (20, 20) not in triangle
+
+
+def test_grid_index() -> None:
+    """
+    Test that the index returns the same results as testing every fence.
+    """
+    random.seed(42)
+    fences = [
+        Circle(
+            f"circle{i}",
+            (random.uniform(37, 38), random.uniform(-123, -122)),
+            random.uniform(100, 5000),
+        )
+        for i in range(200)
+    ] + [
+        Polygon(
+            f"polygon{i}",
+            [
+                (lat + random.uniform(-0.05, 0.05), lon + random.uniform(-0.05, 0.05))
+                for _ in range(5)
+            ],
+        )
+        for i, (lat, lon) in enumerate(
+            (random.uniform(37, 38), random.uniform(-123, -122)) for _ in range(200)
+        )
+    ]
+    index = GridIndex(fences)  # type: ignore
+    assert len(index.cells) > 1
+
+    for _ in range(1000):
+        point = (random.uniform(37, 38), random.uniform(-123, -122))
+        assert index.query(point) == {fence.name for fence in fences if point in fence}
+
+    assert GridIndex([]).query(HOME) == set()
+
+
+def test_grid_index_large_fence() -> None:
+    """
+    Test that fences much bigger than the others are not added to every cell.
+    """
+    fences = [
+        Circle("home", HOME, 100),
+        Circle("office", (37.79, -122.40), 100),
+        Circle("state", (37.0, -120.0), 500000),
+    ]
+    index = GridIndex(fences)  # type: ignore
+    assert [fence.name for fence in index.large] == ["state"]
+    assert sum(len(cell) for cell in index.cells.values()) <= 8
+
+    assert index.query(HOME) == {"home", "state"}
+    assert index.query((37.0, -120.0)) == {"state"}
+    assert index.query((0.0, 0.0)) == set()
+
+
+def test_get_point() -> None:
+    """
+    Test extracting points from event values.
+    """
+    assert get_point(HOME) == HOME
+    assert get_point([37, -122]) == (37, -122)
+    assert get_point({"latitude": 37, "longitude": -122}) == (37, -122)
+    assert get_point({"lat": "37", "lon": -122}) == (37, -122)
+    assert get_point(geohash.encode(*HOME)) == pytest.approx(HOME)
+    assert get_point("") is None
+    assert get_point("invalid") is None
+    assert get_point({"battery": 90}) is None
+    assert get_point(42) is None
+
+
+@pytest.mark.asyncio
+async def test_geofence() -> None:
+    """
+    Test the filter.
+    """
+    values = [
+        ("hub.whistle.rex.location", (37.0, -122.0)),
+        ("hub.whistle.rex.location", HOME),
+        ("hub.whistle.rex.battery_level", 90),
+        ("hub.whistle.rex.geohash", geohash.encode(*HOME)),
+        ("hub.whistle.rex.location", (37.7749, -122.4195)),
+        ("hub.micron", {"id": "1", "latitude": 37.765, "longitude": -122.47}),
+        ("hub.micron", {"id": "2", "latitude": 37.0, "longitude": -122.0}),
+        ("hub.micron", {"id": "1", "latitude": 37.7749, "longitude": -122.4194}),
+        ("hub.whistle.rex.location", (37.0, -122.0)),
+    ]
+    assert await run(values) == [
+        {"device": "hub.whistle.rex.location", "fence": "home", "transition": "enter"},
+        {"device": "hub.whistle.rex.geohash", "fence": "home", "transition": "enter"},
+        {"device": "hub.micron.1", "fence": "park", "transition": "enter"},
+        {"device": "hub.micron.1", "fence": "park", "transition": "exit"},
+        {"device": "hub.micron.1", "fence": "home", "transition": "enter"},
+        {"device": "hub.whistle.rex.location", "fence": "home", "transition": "exit"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_geofence_state() -> None:
+    """
+    Test that devices are tracked between runs.
+    """
+    state = MemoryStateStore()
+    values = [("hub.whistle.rex.location", HOME)]
+    assert await run(values, state=state) == [
+        {"device": "hub.whistle.rex.location", "fence": "home", "transition": "enter"},
+    ]
+    assert not await run(values, state=state)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "fence,message",
+    [
+        ({"center": [0, 0], "radius": 1}, "Geofences must have a `name`"),
+        ({"name": "a", "center": [0, 0]}, 'Invalid geofence "a"'),
+        ({"name": "a", "center": [0, 0], "radius": 0}, 'Invalid geofence "a"'),
+        ({"name": "a", "center": 0, "radius": 1}, 'Invalid geofence "a"'),
+        ({"name": "a", "polygon": [[0, 0], [1, 1]]}, 'Invalid geofence "a"'),
+    ],
+)
+async def test_geofence_invalid(fence: Dict[str, Any], message: str) -> None:
+    """
+    Test invalid configurations.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], fences=[fence])
+    assert str(excinfo.value) == message
+
+
+def test_geofence_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert geofence.configuration_schema.load({"fences": FENCES}) == {
+        "fences": FENCES,
+    }
@@ -0,0 +1,224 @@
+"""
+Tests for the join filter.
+"""
+
+import asyncio
+import pickle
+from typing import Any, List, Sequence, Tuple
+
+import pytest
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.join import MISSING, Buffer, Join, JoinType, join
+from senor_octopus.lib import MemoryStateStore
+
+from .conftest import EPOCH, run_filter, stream
+
+STREAMS = {"gps": "hub.micron", "awair": "hub.awair.*", "whistle": "hub.whistle"}
+
+
+async def run(values: Sequence[Tuple[float, str, Any]], **kwargs: Any) -> List[Tuple]:
+    """
+    Run the filter, returning seconds since ``EPOCH``, names and values.
+    """
+    kwargs.setdefault("streams", STREAMS)
+    kwargs.setdefault("left", "gps")
+    kwargs.setdefault("tolerance", "10 seconds")
+    return await run_filter(join, values, **kwargs)
+
+
+def test_buffer() -> None:
+    """
+    Test the time-indexed buffer.
+    """
+    buffer = Buffer()
+    assert buffer.latest(10, 5) is MISSING
+    assert buffer.nearest(10, 5) is MISSING
+
+    buffer.add(10, "a")
+    buffer.add(20, "b")
+    buffer.add(15, "c")
+    buffer.add(30, "d")
+    assert buffer.timestamps == [10, 15, 20, 30]
+    assert buffer.values == ["a", "c", "b", "d"]
+
+    assert buffer.latest(9, 5) is MISSING
+    assert buffer.latest(10, 5) == "a"
+    assert buffer.latest(19, 5) == "c"
+    assert buffer.latest(29, 5) is MISSING
+    assert buffer.latest(100, 100) == "d"
+
+    assert buffer.nearest(0, 5) is MISSING
+    assert buffer.nearest(12, 5) == "a"
+    assert buffer.nearest(13, 5) == "c"
+    assert buffer.nearest(26, 5) == "d"
+    assert buffer.nearest(36, 5) is MISSING
+
+    buffer.evict(16)
+    assert buffer.timestamps == [20, 30]
+    buffer.evict(0)
+    assert len(buffer) == 2
+
+
+@pytest.mark.asyncio
+async def test_join_asof() -> None:
+    """
+    Test an as-of join.
+    """
+    values = [
+        (0, "hub.awair.score", 90),
+        (1, "hub.micron", "fix1"),
+        (2, "hub.whistle", "home"),
+        (3, "hub.micron", "fix2"),
+        (5, "hub.other", "ignored"),
+        (8, "hub.awair.score", 80),
+        (12, "hub.micron", "fix3"),
+        (30, "hub.micron", "fix4"),
+    ]
+    assert await run(values) == [
+        (1, "hub.micron", {"gps": "fix1", "awair": 90, "whistle": None}),
+        (3, "hub.micron", {"gps": "fix2", "awair": 90, "whistle": "home"}),
+        (12, "hub.micron", {"gps": "fix3", "awair": 80, "whistle": "home"}),
+        (30, "hub.micron", {"gps": "fix4", "awair": None, "whistle": None}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_join_inner_and_left() -> None:
+    """
+    Test inner and left joins, which wait for events after the left one.
+    """
+    values = [
+        (0, "hub.micron", "fix1"),
+        (4, "hub.awair.score", 90),
+        (5, "hub.whistle", "home"),
+        (20, "hub.micron", "fix2"),
+        (25, "hub.awair.score", 80),
+        (40, "hub.micron", "fix3"),
+        (45, "hub.micron", "fix4"),
+        (48, "hub.awair.score", 70),
+        (49, "hub.whistle", "park"),
+    ]
+    assert await run(values, how=JoinType.INNER) == [
+        (0, "hub.micron", {"gps": "fix1", "awair": 90, "whistle": "home"}),
+        (40, "hub.micron", {"gps": "fix3", "awair": 70, "whistle": "park"}),
+        (45, "hub.micron", {"gps": "fix4", "awair": 70, "whistle": "park"}),
+    ]
+    assert await run(values, how=JoinType.LEFT) == [
+        (0, "hub.micron", {"gps": "fix1", "awair": 90, "whistle": "home"}),
+        (20, "hub.micron", {"gps": "fix2", "awair": 80, "whistle": None}),
+        (40, "hub.micron", {"gps": "fix3", "awair": 70, "whistle": "park"}),
+        (45, "hub.micron", {"gps": "fix4", "awair": 70, "whistle": "park"}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_join_key() -> None:
+    """
+    Test joining events by key.
+    """
+    values = [
+        (0, "hub.whistle", {"device": "a", "battery": 90}),
+        (1, "hub.whistle", {"device": "b", "battery": 10}),
+        (2, "hub.micron", {"device": "b", "lat": 1}),
+        (3, "hub.micron", {"device": "c", "lat": 2}),
+    ]
+    assert await run(
+        values,
+        streams={"gps": "hub.micron", "whistle": "hub.whistle"},
+        key="device",
+    ) == [
+        (
+            2,
+            "hub.micron",
+            {
+                "gps": {"device": "b", "lat": 1},
+                "whistle": {"device": "b", "battery": 10},
+            },
+        ),
+        (3, "hub.micron", {"gps": {"device": "c", "lat": 2}, "whistle": None}),
+    ]
+
+
+def test_join_eviction() -> None:
+    """
+    Test that memory is bounded by the tolerance.
+    """
+    current = Join("gps", ["awair"], JoinType.LEFT, 10)
+    for seconds in range(1000):
+        event = {"timestamp": EPOCH, "name": "gps", "value": seconds}
+        current.add("awair", seconds % 3, seconds, event)  # type: ignore
+        current.add("gps", seconds % 3, seconds, event)  # type: ignore
+        assert len(current.pending) <= 11
+        assert sum(len(buffer) for buffer in current.buffers.values()) < 3 * 20
+
+    current.add("awair", "idle", 2000, event)  # type: ignore
+    assert list(current.buffers) == ["idle"]
+
+
+@pytest.mark.asyncio
+async def test_join_multiple_parents() -> None:
+    """
+    Test that the state is shared between parents.
+    """
+    state = MemoryStateStore()
+    kwargs = {
+        "streams": {"gps": "hub.micron", "awair": "hub.awair.score"},
+        "left": "gps",
+        "tolerance": "10 seconds",
+        "how": JoinType.LEFT,
+        "state": state,
+    }
+
+    async def collect(values: List[Tuple[float, str, Any]], delay: float) -> List:
+        return [
+            (event["timestamp"] - EPOCH).total_seconds()
+            async for event in join(stream(values, delay), **kwargs)
+        ]
+
+    gps = collect([(0, "hub.micron", "fix1"), (20, "hub.micron", "fix2")], 0.01)
+    awair = collect([(5, "hub.awair.score", 90), (12, "hub.awair.score", 80)], 0.015)
+    assert await asyncio.gather(gps, awair) == [[0.0], [20.0]]
+    assert state.get("join").runs == 0
+
+
+def test_join_pickle() -> None:
+    """
+    Test that runs are not persisted.
+    """
+    current = Join("gps", ["awair"], JoinType.LEFT, 10)
+    current.runs = 2
+    assert pickle.loads(pickle.dumps(current)).runs == 0
+
+
+@pytest.mark.asyncio
+async def test_join_invalid() -> None:
+    """
+    Test invalid configurations.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], left="invalid")
+    assert str(excinfo.value) == 'Left stream "invalid" not in streams'
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], tolerance="0 seconds")
+    assert str(excinfo.value) == "Invalid `tolerance` for join"
+
+
+def test_join_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert join.configuration_schema.load(
+        {
+            "streams": {"gps": "hub.micron"},
+            "left": "gps",
+            "how": "inner",
+            "tolerance": "1 minute",
+        },
+    ) == {
+        "streams": {"gps": "hub.micron"},
+        "left": "gps",
+        "how": JoinType.INNER,
+        "tolerance": "1 minute",
+    }
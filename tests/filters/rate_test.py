@@ -0,0 +1,136 @@
+"""
+Tests for the rate filter.
+"""
+
+from functools import partial
+
+import pytest
+from pytest_mock import MockerFixture
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.rate import RateMode, deltas, rate
+from senor_octopus.lib import MemoryStateStore
+
+from .conftest import run_filter
+
+run = partial(run_filter, rate)
+
+
+@pytest.mark.parametrize("size", [5, 100])
+def test_deltas(size: int, mocker: MockerFixture) -> None:
+    """
+    Test computing differences, with and without NumPy.
+    """
+    values = [float(i % 10) for i in range(size)]
+    expected_counter = [1.0 if i % 10 else 0.0 for i in range(1, size)]
+    expected_wrap = [1.0] * (size - 1)
+    expected_gauge = [1.0 if i % 10 else -9.0 for i in range(1, size)]
+
+    for _ in range(2):
+        assert deltas(values, counter=True) == expected_counter
+        assert deltas(values, counter=True, wrap=10) == expected_wrap
+        assert deltas(values, counter=False, scale=2) == [
+            2 * delta for delta in expected_gauge
+        ]
+        mocker.patch("senor_octopus.filters.rate.np", None)
+
+
+@pytest.mark.asyncio
+async def test_rate() -> None:
+    """
+    Test the filter.
+    """
+    values = [
+        (0, "hub.meter", 100),
+        (10, "hub.meter", 150),
+        (10, "hub.other", 1),
+        (15, "hub.meter", 140),
+        (15, "hub.meter", 200),
+        (20, "hub.meter", "invalid"),
+        (25, "hub.meter", 20),
+    ]
+    assert await run(values) == [
+        (10, "hub.meter.rate", 5.0),
+        (15, "hub.meter.rate", 28.0),
+        (25, "hub.meter.rate", 2.0),
+    ]
+    assert await run(values, mode=RateMode.DELTA) == [
+        (10, "hub.meter.delta", 50.0),
+        (15, "hub.meter.delta", 140.0),
+        (25, "hub.meter.delta", 20.0),
+    ]
+    assert await run(values, mode=RateMode.DERIVATIVE, unit="1 minute") == [
+        (10, "hub.meter.derivative", 300.0),
+        (15, "hub.meter.derivative", -120.0),
+        (25, "hub.meter.derivative", -720.0),
+    ]
+    assert await run(values, mode=RateMode.DELTA, wrap=256) == [
+        (10, "hub.meter.delta", 50.0),
+        (15, "hub.meter.delta", 246.0),
+        (25, "hub.meter.delta", 136.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rate_batch() -> None:
+    """
+    Test events with lists of readings.
+    """
+    values = [
+        (0, "hub.meter", [0, 10]),
+        (4, "hub.meter", [20, 30, 5, 15]),
+        (6, "hub.meter", []),
+        (8, "hub.meter", [25]),
+    ]
+    assert await run(values) == [
+        (4, "hub.meter.rate", [10.0, 10.0, 5.0, 10.0]),
+        (8, "hub.meter.rate", [2.5]),
+    ]
+
+    # the first batch is compared from its second reading, when the time
+    # between readings is known
+    assert await run(values, mode=RateMode.DELTA) == [
+        (0, "hub.meter.delta", [10.0]),
+        (4, "hub.meter.delta", [10.0, 10.0, 5.0, 10.0]),
+        (8, "hub.meter.delta", [10.0]),
+    ]
+    assert await run(values, spacing="2 seconds") == [
+        (0, "hub.meter.rate", [5.0]),
+        (4, "hub.meter.rate", [5.0, 5.0, 2.5, 5.0]),
+        (8, "hub.meter.rate", [5.0]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rate_state() -> None:
+    """
+    Test that the last values are kept between runs.
+    """
+    state = MemoryStateStore()
+    assert not await run([(0, "hub.meter", 100)], state=state)
+    assert await run([(10, "hub.meter", 110)], state=state) == [
+        (10, "hub.meter.rate", 1.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rate_invalid() -> None:
+    """
+    Test invalid configurations.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], unit="0 seconds")
+    assert str(excinfo.value) == "Invalid `unit` for rate"
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], spacing="0 seconds")
+    assert str(excinfo.value) == "Invalid `spacing` for rate"
+
+
+def test_rate_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert rate.configuration_schema.load(
+        {"mode": "delta", "wrap": 4294967296},
+    ) == {"mode": RateMode.DELTA, "wrap": 4294967296}
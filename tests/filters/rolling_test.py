@@ -0,0 +1,145 @@
+"""
+Tests for the rolling filter.
+"""
+
+import random
+import statistics
+from functools import partial
+from typing import List
+
+import pytest
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.rolling import RollingOperation, RollingSeries, rolling
+from senor_octopus.lib import MemoryStateStore
+
+from .conftest import run_filter
+
+run = partial(run_filter, rolling)
+
+
+@pytest.mark.parametrize("operation", list(RollingOperation))
+def test_rolling_series(operation: RollingOperation) -> None:
+    """
+    Test the ring buffer against a reference implementation.
+    """
+    random.seed(42)
+    size = 7
+    current = RollingSeries(operation, size)
+    values: List[float] = []
+    for _ in range(100):
+        value = random.uniform(-100, 100)
+        values = (values + [value])[-size:]
+        current.add(value)
+
+        if operation == RollingOperation.MEAN:
+            expected = statistics.fmean(values)
+        elif operation == RollingOperation.MEDIAN:
+            expected = statistics.median(values)
+        elif operation == RollingOperation.MIN:
+            expected = min(values)
+        elif operation == RollingOperation.MAX:
+            expected = max(values)
+        else:
+            stddev = statistics.pstdev(values)
+            expected = (value - statistics.fmean(values)) / stddev if stddev else 0
+
+        assert current.result(value) == pytest.approx(expected)
+        assert len(current) == len(values)
+
+
+def test_rolling_series_expire() -> None:
+    """
+    Test removing old values from the window.
+    """
+    current = RollingSeries(RollingOperation.MEDIAN, 4, timed=True)
+    current.expire(100)
+    for timestamp in range(6):
+        current.add(timestamp * 10, timestamp)
+
+    current.expire(3)
+    assert len(current) == 3
+    assert current.result(50) == 40
+
+    current.expire(10)
+    assert len(current) == 0
+    assert [len(segment) for segment in current.segments()] == [0, 0]
+
+    # expiring without timestamps is a no-op
+    current = RollingSeries(RollingOperation.MEAN, 4)
+    current.add(1)
+    current.expire(100)
+    assert len(current) == 1
+
+
+@pytest.mark.asyncio
+async def test_rolling() -> None:
+    """
+    Test the filter.
+    """
+    values = [
+        (0, "hub.temp", 20),
+        (1, "hub.humid", 50),
+        (2, "hub.temp", 22.0),
+        (3, "hub.temp", "invalid"),
+        (4, "hub.temp", float("nan")),
+        (5, "hub.temp", True),
+        (6, "hub.temp", 30),
+        (7, "hub.temp", 24),
+    ]
+    assert await run(values, operation=RollingOperation.MEAN, size=3) == [
+        (0, "hub.temp.mean", 20.0),
+        (1, "hub.humid.mean", 50.0),
+        (2, "hub.temp.mean", 21.0),
+        (6, "hub.temp.mean", 24.0),
+        (7, "hub.temp.mean", 76 / 3),
+    ]
+    assert await run(values, operation=RollingOperation.MAX, size=2) == [
+        (0, "hub.temp.max", 20.0),
+        (1, "hub.humid.max", 50.0),
+        (2, "hub.temp.max", 22.0),
+        (6, "hub.temp.max", 30.0),
+        (7, "hub.temp.max", 30.0),
+    ]
+    assert await run(
+        values,
+        operation=RollingOperation.MIN,
+        size=10,
+        period="3 seconds",
+    ) == [
+        (0, "hub.temp.min", 20.0),
+        (1, "hub.humid.min", 50.0),
+        (2, "hub.temp.min", 20.0),
+        (6, "hub.temp.min", 30.0),
+        (7, "hub.temp.min", 24.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rolling_state() -> None:
+    """
+    Test that the windows are kept between runs.
+    """
+    state = MemoryStateStore()
+    kwargs = {"operation": RollingOperation.ZSCORE, "size": 3, "state": state}
+    assert await run([(0, "hub.temp", 20)], **kwargs) == [(0, "hub.temp.zscore", 0)]
+    assert await run([(1, "hub.temp", 30)], **kwargs) == [(1, "hub.temp.zscore", 1)]
+
+
+@pytest.mark.asyncio
+async def test_rolling_invalid() -> None:
+    """
+    Test invalid configurations.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], operation=RollingOperation.MEAN, period="0 seconds")
+    assert str(excinfo.value) == "Invalid `period` for rolling"
+
+
+def test_rolling_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert rolling.configuration_schema.load(
+        {"operation": "median", "size": 5, "period": "1 minute"},
+    ) == {"operation": RollingOperation.MEDIAN, "size": 5, "period": "1 minute"}
@@ -7,6 +7,7 @@ from datetime import datetime, timezone
 import pytest
 from freezegun import freeze_time
 
+from senor_octopus.exceptions import InvalidConfigurationException
 from senor_octopus.filters.serialize import serialize
 from senor_octopus.sources.static import static
 
@@ -38,3 +39,37 @@ async def test_serialize() -> None:
             "value": "foo: bar\n",
         },
     ]
+
+
+@freeze_time("2021-01-01")
+@pytest.mark.asyncio
+async def test_serialize_binary() -> None:
+    """
+    Test that binary formats produce bytes.
+    """
+    events = [
+        event async for event in serialize(static("name", {"foo": "bar"}), "msgpack")
+    ]
+    assert events == [
+        {
+            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
+            "name": "name",
+            "value": b"\x81\xa3foo\xa3bar",
+        },
+    ]
+
+    events = [
+        event async for event in serialize(static("name", {"foo": "bar"}), "orjson")
+    ]
+    assert events[0]["value"] == b'{"foo":"bar"}'
+
+
+@pytest.mark.asyncio
+async def test_serialize_invalid_format() -> None:
+    """
+    Test that the format is validated before events are processed.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        async for _ in serialize(static("name", {"foo": "bar"}), "xml"):
+            pass
+    assert str(excinfo.value) == 'Invalid format "xml"'
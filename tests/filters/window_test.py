@@ -0,0 +1,274 @@
+"""
+Tests for the window filter.
+"""
+
+from datetime import timedelta
+from typing import Any, List, Tuple
+
+import pytest
+from pytest_mock import MockerFixture
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.combine import AggregationType, MinAggregation
+from senor_octopus.filters.window import SlidingAggregation, WindowType, window
+
+from .conftest import EPOCH, run_filter, stream
+
+
+async def run(values: List[Tuple[float, Any]], **kwargs: Any) -> List[Tuple]:
+    """
+    Run the filter on pairs of seconds since ``EPOCH`` and values.
+    """
+    return await run_filter(
+        window,
+        [(seconds, "hub.co2", value) for seconds, value in values],
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_window_tumbling() -> None:
+    """
+    Test tumbling windows.
+    """
+    assert await run(
+        [(0, 10), (30, 20), (60, 30), (150, 40)],
+        window=WindowType.TUMBLING,
+        aggregation=AggregationType.AVERAGE,
+        size="1 minute",
+    ) == [
+        (60, "hub.co2.average", 15.0),
+        (120, "hub.co2.average", 30.0),
+        (180, "hub.co2.average", 40.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_window_hopping() -> None:
+    """
+    Test hopping windows.
+    """
+    assert await run(
+        [(0, 1), (30, 2), (60, 4), (90, 8), (200, 16)],
+        window=WindowType.HOPPING,
+        aggregation=AggregationType.SUM,
+        size="2 minutes",
+        slide="1 minute",
+    ) == [
+        (60, "hub.co2.sum", 3),
+        (120, "hub.co2.sum", 15),
+        (180, "hub.co2.sum", 12),
+        (240, "hub.co2.sum", 16),
+        (300, "hub.co2.sum", 16),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_window_hopping_gap() -> None:
+    """
+    Test that empty windows are skipped, and that idle series are freed.
+    """
+    assert await run(
+        [(0, 5), (30, 3), (1000, 7)],
+        window=WindowType.SLIDING,
+        aggregation=AggregationType.MIN,
+        size="1 minute",
+        slide="30 seconds",
+    ) == [
+        (30, "hub.co2.min", 5),
+        (60, "hub.co2.min", 3),
+        (90, "hub.co2.min", 3),
+        (1020, "hub.co2.min", 7),
+        (1050, "hub.co2.min", 7),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_window_lateness(mocker: MockerFixture) -> None:
+    """
+    Test that late events are accepted within the allowed lateness.
+    """
+    _logger = mocker.patch("senor_octopus.filters.window._logger")
+    assert await run(
+        [(0, 1), (65, 2), (20, 4), (95, 8), (10, 16)],
+        window=WindowType.TUMBLING,
+        aggregation=AggregationType.SUM,
+        size="1 minute",
+        lateness="30 seconds",
+    ) == [
+        (60, "hub.co2.sum", 5),
+        (120, "hub.co2.sum", 10),
+    ]
+    _logger.debug.assert_called_with(
+        "Dropping late event: %s",
+        {
+            "timestamp": EPOCH + timedelta(seconds=10),
+            "name": "hub.co2",
+            "value": 16,
+        },
+    )
+
+
+@pytest.mark.asyncio
+async def test_window_session(mocker: MockerFixture) -> None:
+    """
+    Test session windows.
+    """
+    _logger = mocker.patch("senor_octopus.filters.window._logger")
+    assert await run(
+        [(0, 1), (10, 1), (20, 1), (100, 1), (110, 1), (5, 1)],
+        window=WindowType.SESSION,
+        aggregation=AggregationType.COUNT,
+        gap="30 seconds",
+    ) == [
+        (20, "hub.co2.count", 3),
+        (110, "hub.co2.count", 2),
+    ]
+    _logger.debug.assert_called_with(
+        "Dropping late event: %s",
+        {
+            "timestamp": EPOCH + timedelta(seconds=5),
+            "name": "hub.co2",
+            "value": 1,
+        },
+    )
+
+    assert await run(
+        [(50, 1), (0, 1), (300, 1)],
+        window=WindowType.SESSION,
+        aggregation=AggregationType.COUNT,
+        gap="10 seconds",
+        lateness="100 seconds",
+    ) == [
+        (0, "hub.co2.count", 1),
+        (50, "hub.co2.count", 1),
+        (300, "hub.co2.count", 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_window_session_merge() -> None:
+    """
+    Test that late events can bridge sessions.
+    """
+    assert await run(
+        [(0, "a"), (20, "c"), (10, "b"), (-5, "z"), (100, "d")],
+        window=WindowType.SESSION,
+        aggregation=AggregationType.FIRST,
+        gap="10 seconds",
+        lateness="100 seconds",
+    ) == [
+        (20, "hub.co2.first", "z"),
+        (100, "hub.co2.first", "d"),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "window_type,kwargs,expected",
+    [
+        (
+            WindowType.TUMBLING,
+            {"size": "1 minute"},
+            [(60, "a.max", 1), (60, "b.max", 3), (240, "b.max", 4)],
+        ),
+        (
+            WindowType.SESSION,
+            {"gap": "30 seconds"},
+            [(0, "a.max", 1), (10, "b.max", 3), (200, "b.max", 4)],
+        ),
+    ],
+)
+async def test_window_multiple_series(
+    window_type: WindowType,
+    kwargs: Any,
+    expected: List[Tuple],
+) -> None:
+    """
+    Test that each series has its own windows, and idle series are freed.
+    """
+
+    events = [
+        ((event["timestamp"] - EPOCH).total_seconds(), event["name"], event["value"])
+        async for event in window(
+            stream([(0, "a", 1), (10, "b", 3), (200, "b", 4)]),
+            window=window_type,
+            aggregation=AggregationType.MAX,
+            **kwargs,
+        )
+    ]
+    assert events == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "kwargs,message",
+    [
+        ({"window": WindowType.TUMBLING}, "Missing `size` for window"),
+        ({"window": WindowType.SESSION}, "Missing `gap` for window"),
+        (
+            {"window": WindowType.TUMBLING, "size": "0 seconds"},
+            "Invalid `size` for window",
+        ),
+        (
+            {"window": WindowType.HOPPING, "size": "1 minute", "slide": "7 seconds"},
+            "Window size must be a multiple of the slide",
+        ),
+        (
+            {"window": WindowType.HOPPING, "size": "1 minute", "slide": "2 minutes"},
+            "Window size must be a multiple of the slide",
+        ),
+    ],
+)
+async def test_window_invalid_config(kwargs: Any, message: str) -> None:
+    """
+    Test invalid configurations.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        await run([], aggregation=AggregationType.SUM, **kwargs)
+    assert str(excinfo.value) == message
+
+
+def test_window_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert window.configuration_schema.load(
+        {"window": "hopping", "aggregation": "average", "size": "5 minutes"},
+    ) == {
+        "window": WindowType.HOPPING,
+        "aggregation": AggregationType.AVERAGE,
+        "size": "5 minutes",
+    }
+
+
+def test_sliding_aggregation() -> None:
+    """
+    Test the two-stacks sliding aggregation.
+    """
+
+    def pane(value: int) -> MinAggregation:
+        aggregation = MinAggregation()
+        aggregation(value)
+        return aggregation
+
+    sliding = SlidingAggregation(MinAggregation)
+    assert sliding.query().result is None
+
+    sliding.push(0, pane(5))
+    sliding.push(1, pane(3))
+    sliding.push(2, pane(4))
+    assert len(sliding) == 3
+    assert sliding.query().result == 3
+
+    sliding.evict(2)
+    assert len(sliding) == 1
+    assert sliding.query().result == 4
+
+    sliding.push(3, pane(6))
+    assert sliding.query().result == 4
+    sliding.evict(3)
+    assert sliding.query().result == 6
+    sliding.evict(10)
+    assert len(sliding) == 0
+    assert sliding.query().result is None
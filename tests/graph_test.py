@@ -11,7 +11,13 @@ import pytest
 import yaml
 from freezegun import freeze_time
 
-from senor_octopus.graph import Sink, Source, build_dag, connected
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.filters.changes import changes
+from senor_octopus.filters.dedup import dedup
+from senor_octopus.graph import Filter, Sink, Source, build_dag, connected
+from senor_octopus.lib import MemoryStateStore, SQLiteStateStore, close_state_stores
+from senor_octopus.sources.rand import rand
+from senor_octopus.sources.sqla import sqla
 
 
 def test_connected() -> None:
@@ -392,3 +398,45 @@ log:
 
         await asyncio.sleep(1800)
         assert len(_logger.log.mock_calls) == 3
+
+
+def test_filter_state(tmp_path) -> None:
+    """
+    Test that stateful filters receive a state store.
+    """
+    node = Filter("changes", changes, deadband=0.5)
+    assert node.kwargs["deadband"] == 0.5
+    assert isinstance(node.kwargs["state"], MemoryStateStore)
+    assert Filter("changes", changes).kwargs["state"] is node.kwargs["state"]
+
+    node = Filter("changes", changes, state=str(tmp_path / "state.db"))
+    assert isinstance(node.kwargs["state"], SQLiteStateStore)
+    assert node.kwargs["state"].namespace == "changes"
+
+    node = Filter("dedup", dedup, ttl="1 minute")
+    assert "state" not in node.kwargs
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        Filter("dedup", dedup, state=str(tmp_path / "state.db"))
+    assert (
+        str(excinfo.value)
+        == 'Node "dedup" has a `state`, but its plugin is not stateful'
+    )
+
+    close_state_stores()
+
+
+def test_source_state() -> None:
+    """
+    Test that stateful sources receive a state store.
+    """
+    node = Source("db", sqla, uri="sqlite://", sql="SELECT 1", watermark="id")
+    assert isinstance(node.kwargs["state"], MemoryStateStore)
+
+    node = Source("random", rand)
+    assert "state" not in node.kwargs
+
+    with pytest.raises(InvalidConfigurationException):
+        Source("random", rand, state="state.db")
+
+    close_state_stores()
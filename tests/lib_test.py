@@ -4,18 +4,32 @@ Tests for the helper functions.
 
 import asyncio
 import random
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
 
 import aiotools
 import pytest
 import yaml
 from marshmallow_jsonschema import JSONSchema
+from pytest_mock import MockerFixture
 
 from senor_octopus.graph import build_dag
 from senor_octopus.lib import (
+    MemoryStateStore,
+    SQLiteStateStore,
+    StateStore,
     build_marshmallow_schema,
+    close_state_stores,
     flatten,
+    heartbeat,
     merge_streams,
+    on_shutdown,
+    open_state_store,
     render_dag,
+    run_shutdown_callbacks,
+    state_stores,
 )
 from senor_octopus.sources.awair import awair
 
@@ -123,6 +137,42 @@ async def test_merge_streams() -> None:
     ]
 
 
+@pytest.mark.asyncio
+async def test_heartbeat() -> None:
+    """
+    Test the ``heartbeat`` function.
+    """
+    vclock = aiotools.VirtualClock()
+
+    async def gen():
+        """
+        Generate a stream of events.
+        """
+        for i, sleep in enumerate([1, 5, 1.5]):
+            await asyncio.sleep(sleep)
+            yield i
+
+    with vclock.patch_loop():
+        loop = asyncio.get_running_loop()
+        events = [(loop.time(), event) async for event in heartbeat(gen(), 2)]
+    assert events == [
+        (1.0, 0),
+        (3.0, None),
+        (5.0, None),
+        (6.0, 1),
+        (7.5, 2),
+    ]
+
+    with vclock.patch_loop():
+        events = [event async for event in heartbeat(gen(), None)]
+    assert events == [0, 1, 2]
+
+    with vclock.patch_loop():
+        stream = heartbeat(gen(), 0.5)
+        assert await stream.__anext__() is None
+        await stream.aclose()
+
+
 def test_build_marshmallow_schema() -> None:
     """
     Test the ``build_marshmallow_schema`` function.
@@ -212,3 +262,184 @@ def test_build_marshmallow_schema() -> None:
     with pytest.raises(TypeError) as excinfo:
         build_marshmallow_schema(some_func)  # type: ignore
     assert str(excinfo.value) == "Unsupported type <class 'object'> for parameter arg"
+
+
+def test_memory_state_store() -> None:
+    """
+    Test the in-memory state store.
+    """
+    store = MemoryStateStore()
+    assert store.get("a") is None
+    assert store.get("a", 0) == 0
+
+    store.set("a", 1)
+    assert store.get("a") == 1
+
+    store.delete("a")
+    store.delete("b")
+    assert store.get("a") is None
+
+    store.close()
+
+    with pytest.raises(NotImplementedError):
+        StateStore().get("a")
+    with pytest.raises(NotImplementedError):
+        StateStore().set("a", 1)
+    with pytest.raises(NotImplementedError):
+        StateStore().delete("a")
+
+
+def test_sqlite_state_store(mocker: MockerFixture, tmp_path: Path) -> None:
+    """
+    Test the SQLite state store.
+    """
+    monotonic = mocker.patch("senor_octopus.lib.time.monotonic")
+    monotonic.return_value = 0
+    path = str(tmp_path / "state.db")
+
+    store = SQLiteStateStore(path, "combine", interval=10)
+    assert store.get("a") is None
+    store.set("a", {"count": 1})
+    store.set(1, [1, 2])
+    store.set("b", 2)
+    store.delete("b")
+    assert store.get("a") == {"count": 1}
+    assert store.get("b", 0) == 0
+
+    # changes are written behind
+    other = SQLiteStateStore(path, "combine")
+    assert other.get("a") is None
+
+    monotonic.return_value = 10
+    store.set("c", 3)
+    assert not store.dirty
+    other = SQLiteStateStore(path, "combine")
+    assert other.get("a") == {"count": 1}
+    assert other.get(1) == [1, 2]
+    assert other.get("1") is None
+    assert other.get("b") is None
+
+    # namespaces are independent
+    assert SQLiteStateStore(path, "changes").get("a") is None
+
+    store.delete("a")
+    store.set("d", 4)
+    store.close()
+
+    # keys are loaded lazily
+    store = SQLiteStateStore(path, "combine")
+    assert store.cache == {}
+    assert store.get("d") == 4
+    assert store.get("a") is None
+    assert list(store.cache) == ["d", "a"]
+    store.flush()
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_state_store_background_flush(
+    mocker: MockerFixture,
+    tmp_path: Path,
+) -> None:
+    """
+    Test that changes are committed by a timer, in a background thread.
+    """
+    path = str(tmp_path / "state.db")
+    store = SQLiteStateStore(path, "combine", interval=0.05)
+    threads = []
+    write = store.write
+
+    def spy(*args: Any) -> None:
+        threads.append(threading.get_ident())
+        write(*args)
+
+    mocker.patch.object(store, "write", side_effect=spy)
+
+    store.set("a", 1)
+    store.set("b", 2)
+    assert store.timer is not None
+    assert SQLiteStateStore(path, "combine").get("a") is None
+
+    # the store is not modified again, but the changes are still written
+    await asyncio.sleep(0.2)
+    assert store.timer is None
+    assert not store.dirty
+    other = SQLiteStateStore(path, "combine")
+    assert other.get("a") == 1
+    assert other.get("b") == 2
+    assert threads and threading.get_ident() not in threads
+
+    # closing the store cancels the timer and writes pending changes
+    store.set("c", 3)
+    timer = store.timer
+    store.close()
+    assert timer.cancelled()  # type: ignore
+    assert SQLiteStateStore(path, "combine").get("c") == 3
+
+
+@pytest.mark.asyncio
+async def test_sqlite_state_store_write_error(
+    mocker: MockerFixture,
+    tmp_path: Path,
+) -> None:
+    """
+    Test that errors from background writes are logged.
+    """
+    _logger = mocker.patch("senor_octopus.lib._logger")
+    store = SQLiteStateStore(str(tmp_path / "state.db"), "combine", interval=0)
+    mocker.patch.object(store, "write", side_effect=sqlite3.OperationalError("locked"))
+
+    store.set("a", 1)
+    await asyncio.sleep(0.1)
+    _logger.error.assert_called_with(
+        "Unable to persist state: %s",
+        mocker.ANY,
+    )
+
+
+def test_open_state_store(tmp_path: Path) -> None:
+    """
+    Test opening and closing state stores.
+    """
+    path = str(tmp_path / "state.db")
+
+    store = open_state_store(None, "a")
+    assert isinstance(store, MemoryStateStore)
+    assert open_state_store(None, "a") is store
+    assert open_state_store(None, "b") is not store
+
+    store = open_state_store(path, "a")
+    assert isinstance(store, SQLiteStateStore)
+    store.set("key", "value")
+
+    close_state_stores()
+    assert not state_stores
+    assert open_state_store(path, "a").get("key") == "value"
+    close_state_stores()
+
+
+@pytest.mark.asyncio
+async def test_shutdown_callbacks(mocker: MockerFixture) -> None:
+    """
+    Test registering and running shutdown callbacks.
+    """
+    calls = []
+
+    async def first() -> None:
+        calls.append("first")
+
+    async def second() -> None:
+        calls.append("second")
+        raise Exception("Something went wrong")
+
+    _logger = mocker.patch("senor_octopus.lib._logger")
+    callbacks = mocker.patch("senor_octopus.lib.shutdown_callbacks", [])
+    on_shutdown(first)
+    on_shutdown(second)
+    on_shutdown(first)
+    assert callbacks == [first, second]
+
+    await run_shutdown_callbacks()
+    assert calls == ["second", "first"]
+    assert not callbacks
+    _logger.exception.assert_called_with("Error running shutdown callback")
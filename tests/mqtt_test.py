@@ -0,0 +1,171 @@
+"""
+Tests for the shared MQTT connections.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import List
+
+import pytest
+from asyncio_mqtt import MqttError
+from pytest_mock import MockerFixture
+
+from senor_octopus.lib import run_shutdown_callbacks
+from senor_octopus.mqtt import TopicTrie, connections, get_connection
+
+from .conftest import FakeMQTTClient
+
+
+@dataclass
+class FakeMessage:
+    """
+    Fake MQTT message.
+    """
+
+    topic: str
+    payload: bytes
+
+
+def test_topic_trie() -> None:
+    """
+    Test matching topics against filters with wildcards.
+    """
+    trie = TopicTrie()
+    trie.insert("home/+/temperature", "a")
+    trie.insert("home/#", "b")
+    trie.insert("home/kitchen/temperature", "c")
+    trie.insert("#", "d")
+    trie.insert("+/+", "e")
+
+    assert trie.match("home/kitchen/temperature") == {"a", "b", "c", "d"}
+    assert trie.match("home/office/temperature") == {"a", "b", "d"}
+    assert trie.match("home/office") == {"b", "d", "e"}
+    assert trie.match("home") == {"b", "d"}
+    assert trie.match("garden/temperature") == {"d", "e"}
+    # wildcards don't match topics starting with ``$``
+    assert trie.match("$SYS/broker") == set()
+
+    assert "home/#" in trie
+    assert "home/+" not in trie
+    assert "garden/#" not in trie
+    assert sorted(trie.filters()) == [
+        "#",
+        "+/+",
+        "home/#",
+        "home/+/temperature",
+        "home/kitchen/temperature",
+    ]
+
+    trie.remove("home/kitchen/temperature", "c")
+    trie.remove("home/kitchen/temperature", "c")
+    trie.remove("home/+/temperature", "c")
+    trie.remove("garden/temperature", "a")
+    assert "kitchen" not in trie.children["home"].children
+    assert trie.match("home/kitchen/temperature") == {"a", "b", "d"}
+
+    trie.insert("home/#", "f")
+    trie.remove("home/#", "b")
+    assert trie.match("home") == {"d", "f"}
+
+
+@pytest.mark.asyncio
+async def test_connection(fake_mqtt: List[FakeMQTTClient]) -> None:
+    """
+    Test routing messages to subscribers, and reconnecting.
+    """
+    connection = get_connection("localhost", client_id="hub.mqtt")
+    assert get_connection("localhost", client_id="hub.mqtt") is connection
+    assert get_connection("localhost") is connection
+    assert get_connection("localhost", client_id="other") is not connection
+    assert get_connection("localhost", username="bob") is not connection
+    connection.reconnect_interval = 0
+
+    async with connection.subscribe(["home/#"]) as home:
+        await connection.connected.wait()
+        client = fake_mqtt[0]
+        assert client.kwargs["client_id"] == "hub.mqtt"
+        assert client.kwargs["clean_session"] is False
+        client.subscribe.assert_awaited_with("home/#", qos=1)
+
+        async with connection.subscribe(["home/#", "garden/+"]) as both:
+            client.subscribe.assert_awaited_with("garden/+", qos=1)
+            assert client.subscribe.await_count == 2
+
+            client.inbox.put_nowait(FakeMessage("home/kitchen", b"1"))
+            client.inbox.put_nowait(FakeMessage("garden/lawn", b"2"))
+            assert (await home.get()).payload == b"1"
+            assert (await both.get()).payload == b"1"
+            assert (await both.get()).payload == b"2"
+            assert home.empty()
+
+        # only the filter with no subscribers left is removed
+        client.unsubscribe.assert_awaited_once_with(["garden/+"])
+
+        # after a disconnection the filters are subscribed again
+        client.inbox.put_nowait(MqttError("Disconnect"))
+        while len(fake_mqtt) < 2 or not connection.connected.is_set():
+            await asyncio.sleep(0)
+        fake_mqtt[1].subscribe.assert_awaited_once_with("home/#", qos=1)
+
+        await connection.publish("home/light", "on")
+        fake_mqtt[1].publish.assert_awaited_once_with("home/light", "on", qos=1)
+
+        # filters removed while disconnected are not subscribed again
+        async with connection.subscribe(["garden/+"]):
+            fake_mqtt[1].inbox.put_nowait(None)
+            while len(fake_mqtt) < 3 or not connection.connected.is_set():
+                await asyncio.sleep(0)
+            connection.reconnect_interval = 10
+            fake_mqtt[2].inbox.put_nowait(None)
+            await asyncio.sleep(0)
+            assert not connection.connected.is_set()
+        assert connection.trie.filters() == ["home/#"]
+
+    await run_shutdown_callbacks()
+    assert not connections
+    assert connection.task is None
+
+
+@pytest.mark.asyncio
+async def test_connection_publish(fake_mqtt: List[FakeMQTTClient]) -> None:
+    """
+    Test that publishing opens the connection.
+    """
+    connection = get_connection("localhost")
+    await connection.publish("topic", b"value", qos=0)
+    assert fake_mqtt[0].kwargs["clean_session"] is True
+    fake_mqtt[0].publish.assert_awaited_once_with("topic", b"value", qos=0)
+
+    # errors unsubscribing are ignored
+    fake_mqtt[0].unsubscribe.side_effect = MqttError("Disconnect")
+    async with connection.subscribe(["topic"]):
+        pass
+    fake_mqtt[0].unsubscribe.assert_awaited_once_with(["topic"])
+
+    await connection.close()
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_connection_unexpected_error(
+    mocker: MockerFixture,
+    fake_mqtt: List[FakeMQTTClient],
+) -> None:
+    """
+    Test that the connection is reopened after unexpected errors.
+    """
+    _logger = mocker.patch("senor_octopus.mqtt._logger")
+    connection = get_connection("localhost")
+    connection.reconnect_interval = 0
+
+    async with connection.subscribe(["home/#"]) as queue:
+        await connection.connected.wait()
+        fake_mqtt[0].inbox.put_nowait(RuntimeError("Boom"))
+        while len(fake_mqtt) < 2 or not connection.connected.is_set():
+            await asyncio.sleep(0)
+        _logger.exception.assert_called_once()
+
+        fake_mqtt[1].inbox.put_nowait(FakeMessage("home/kitchen", b"1"))
+        assert (await queue.get()).payload == b"1"
+
+    await connection.close()
@@ -0,0 +1,81 @@
+"""
+Tests for the serialization codecs.
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+from pytest_mock import MockerFixture
+
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.serialization import get_codec
+
+VALUE = {
+    "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
+    "name": "hub.awair.co2",
+    "value": 612,
+}
+
+
+@pytest.mark.parametrize("format_", ["json", "JSON", "yaml", "orjson"])
+def test_get_codec_text(format_: str) -> None:
+    """
+    Test codecs that round trip JSON compatible values.
+    """
+    codec = get_codec(format_)
+    value = {"foo": "bar", "baz": [1, 2.5, None]}
+    assert codec.decode(codec.encode(value)) == value
+
+
+@pytest.mark.parametrize("format_", ["msgpack", "cbor"])
+def test_get_codec_binary(format_: str) -> None:
+    """
+    Test binary codecs, which also support timestamps.
+    """
+    codec = get_codec(format_)
+    payload = codec.encode(VALUE)
+    assert isinstance(payload, bytes)
+    assert codec.decode(payload) == VALUE
+    assert codec.decode(memoryview(payload)) == VALUE
+
+
+@pytest.mark.parametrize("format_", ["json", "yaml", "orjson"])
+def test_get_codec_memoryview(format_: str) -> None:
+    """
+    Test that text codecs accept binary payloads without decoding them first.
+    """
+    codec = get_codec(format_)
+    assert codec.decode(memoryview(b'{"foo": "bar"}')) == {"foo": "bar"}
+    assert codec.decode(b'{"foo": "bar"}') == {"foo": "bar"}
+
+
+def test_get_codec_invalid() -> None:
+    """
+    Test an invalid format.
+    """
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        get_codec("xml")
+    assert str(excinfo.value) == 'Invalid format "xml"'
+
+
+@pytest.mark.parametrize(
+    "format_,module,package",
+    [
+        ("orjson", "orjson", "orjson"),
+        ("msgpack", "msgpack", "msgpack"),
+        ("CBOR", "cbor2", "cbor2"),
+    ],
+)
+def test_get_codec_missing_package(
+    mocker: MockerFixture,
+    format_: str,
+    module: str,
+    package: str,
+) -> None:
+    """
+    Test that a helpful error is raised when an optional package is missing.
+    """
+    mocker.patch(f"senor_octopus.serialization.{module}", None)
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        get_codec(format_)
+    assert str(excinfo.value) == f'Format "{format_}" requires the `{package}` package'
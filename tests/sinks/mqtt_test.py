@@ -2,31 +2,116 @@
 Tests for ``sink.mqtt``.
 """
 
+import asyncio
 import random
+from datetime import datetime, timezone
+from typing import Any, List
 
 import pytest
+from asyncio_mqtt import MqttError
+from asyncstdlib.builtins import aiter as aiter_
 
-from senor_octopus.sinks.mqtt import mqtt
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.mqtt import connections
+from senor_octopus.sinks.mqtt import check_template, mqtt
 from senor_octopus.sources.rand import rand
+from senor_octopus.sources.static import static
+
+from ..conftest import FakeMQTTClient
 
 
 @pytest.mark.asyncio
-async def test_mqtt(mocker) -> None:
+async def test_mqtt(mocker, fake_mqtt: List[FakeMQTTClient]) -> None:
     """
     Tests for the sink.
     """
-    mock = mocker.patch("senor_octopus.sinks.mqtt.Client")
-    mock__publish = (
-        mock.return_value.__aenter__.return_value.publish
-    ) = mocker.AsyncMock()
-    mock.return_value.__aexit__ = mocker.AsyncMock()
     random.seed(42)
 
     await mqtt(rand(2), "topic")
+    await mqtt(rand(1), "topic", qos=0)
+    await mqtt(static("hub.static", {"a": 1}), "topic")
 
-    mock__publish.assert_has_calls(
+    # the connection is reused between runs
+    assert len(fake_mqtt) == 1
+    fake_mqtt[0].publish.assert_has_calls(
         [
             mocker.call("topic", 0.6394267984578837, qos=1),
             mocker.call("topic", 0.025010755222666936, qos=1),
+            mocker.call("topic", 0.27502931836911926, qos=0),
+            mocker.call("topic", "{'a': 1}", qos=1),
+        ],
+    )
+
+
+@pytest.mark.asyncio
+async def test_mqtt_template(mocker, fake_mqtt: List[FakeMQTTClient]) -> None:
+    """
+    Test sending events to topics built from a template.
+    """
+    timestamp = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    events = [
+        {"timestamp": timestamp, "name": "hub.temp", "value": {"id": 1}},
+        {"timestamp": timestamp, "name": "hub.humid", "value": {"id": 2}},
+        {"timestamp": timestamp, "name": "hub.co2", "value": 600},
+    ]
+    await mqtt(aiter_(events), "sensors/{name}/{value[id]}")
+
+    fake_mqtt[0].publish.assert_has_calls(
+        [
+            mocker.call("sensors/hub.temp/1", "{'id': 1}", qos=1),
+            mocker.call("sensors/hub.humid/2", "{'id': 2}", qos=1),
         ],
     )
+    assert fake_mqtt[0].publish.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_mqtt_in_flight(fake_mqtt: List[FakeMQTTClient]) -> None:
+    """
+    Test that publishing is pipelined, with a bounded window.
+    """
+    in_flight = 0
+    highest = 0
+
+    async def publish(*args: Any, **kwargs: Any) -> None:
+        nonlocal in_flight, highest
+        in_flight += 1
+        highest = max(highest, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if args[1] == 3:
+            raise MqttError("Operation timed out")
+
+    await mqtt(static("hub.static", 0), "topic")
+    fake_mqtt[0].publish.side_effect = publish
+    timestamp = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    events = [{"timestamp": timestamp, "name": "hub", "value": i} for i in range(10)]
+    connections[("localhost", 1883, None, None)].reconnect_interval = 0
+    await mqtt(aiter_(events), "topic", max_in_flight=4)
+
+    assert highest == 4
+    assert in_flight == 0
+    # the failed message is retried 3 times, and then dropped
+    assert fake_mqtt[0].publish.await_count == 1 + 9 + 4
+
+
+def test_check_template() -> None:
+    """
+    Test validating topic templates.
+    """
+    assert check_template("sensors/{name}") is True
+    assert check_template("sensors/{value[id]}/{timestamp.year}") is True
+    assert check_template("sensors") is False
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        check_template("sensors/{device}/{id}")
+    assert str(excinfo.value) == "Invalid fields in topic template: device, id"
+
+
+def test_mqtt_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert mqtt.configuration_schema.load(
+        {"topic": "sensors/{name}", "qos": 0, "max_in_flight": 10},
+    ) == {"topic": "sensors/{name}", "qos": 0, "max_in_flight": 10}
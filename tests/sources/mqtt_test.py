@@ -5,13 +5,17 @@ Tests for the MQTT source.
 import asyncio
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from typing import List
 
-import aiotools
 import pytest
 from asyncio_mqtt import MqttError
 from freezegun import freeze_time
 
-from senor_octopus.sources.mqtt import mqtt
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.mqtt import connections
+from senor_octopus.sources.mqtt import get_decoder, mqtt
+
+from ..conftest import FakeMQTTClient
 
 
 @dataclass
@@ -26,146 +30,114 @@ class FakeMessage:
 
 @freeze_time("2021-01-01")
 @pytest.mark.asyncio
-async def test_mqtt(mocker) -> None:
+async def test_mqtt(fake_mqtt: List[FakeMQTTClient]) -> None:
     """
     Tests for the source.
     """
-    vclock = aiotools.VirtualClock()
-
-    async def gen(events, exception):
-        for i in range(events):
-            yield FakeMessage("topic/1", str(i).encode("utf-8"))
-
-        raise exception
-
-    client1 = mocker.AsyncMock()
-    client1.__aenter__.return_value = mocker.MagicMock()
-    client1.__aenter__.return_value.subscribe = mocker.AsyncMock()
-    filtered_messages = client1.__aenter__.return_value.filtered_messages
-    filtered_messages.return_value.__aenter__ = mocker.AsyncMock()
-    filtered_messages.return_value.__aenter__.return_value = gen(
-        3,
-        MqttError("Disconnect"),
-    )
-
-    client2 = mocker.AsyncMock()
-    client2.__aenter__.return_value = mocker.MagicMock()
-    client2.__aenter__.return_value.subscribe = mocker.AsyncMock()
-    filtered_messages = client2.__aenter__.return_value.filtered_messages
-    filtered_messages.return_value.__aenter__ = mocker.AsyncMock()
-    filtered_messages.return_value.__aenter__.return_value = gen(
-        0,
-        MqttError("Disconnect"),
-    )
-
-    client3 = mocker.AsyncMock()
-    client3.__aenter__.return_value = mocker.MagicMock()
-    client3.__aenter__.return_value.subscribe = mocker.AsyncMock()
-    filtered_messages = client3.__aenter__.return_value.filtered_messages
-    filtered_messages.return_value.__aenter__ = mocker.AsyncMock()
-    filtered_messages.return_value.__aenter__.return_value = gen(
-        3,
-        asyncio.CancelledError("Canceled"),
-    )
-
-    # pylint: disable=invalid-name
-    Client = mocker.patch("senor_octopus.sources.mqtt.Client")
-    Client.side_effect = [client1, client2, client3]
-
-    topics = ["topic/#"]
-    with vclock.patch_loop():
-        events = [event async for event in mqtt(topics)]
+    stream = mqtt(["topic/#", "other/1"], message_is_json=True, reconnect_interval=0)
+    first = asyncio.create_task(stream.__anext__())
+    while not fake_mqtt:
+        await asyncio.sleep(0)
+
+    client = fake_mqtt[0]
+    assert client.kwargs["client_id"] == "hub.mqtt"
+    client.inbox.put_nowait(FakeMessage("topic/1", b"0"))
+    client.inbox.put_nowait(FakeMessage("unrelated/1", b"1"))
+    client.inbox.put_nowait(FakeMessage("other/1", b"invalid"))
+    client.inbox.put_nowait(MqttError("Disconnect"))
+    events = [await first, await stream.__anext__()]
+
+    # the subscription survives reconnections
+    while len(fake_mqtt) < 2:
+        await asyncio.sleep(0)
+    fake_mqtt[1].inbox.put_nowait(FakeMessage("topic/2", b'{"a": 1}'))
+    events.append(await stream.__anext__())
+    await stream.aclose()
+
     assert events == [
         {
             "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
             "name": "hub.mqtt.topic/1",
-            "value": "0",
-        },
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": "1",
-        },
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": "2",
-        },
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": "0",
+            "value": 0,
         },
         {
             "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": "1",
+            "name": "hub.mqtt.other/1",
+            "value": "invalid",
         },
         {
             "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": "2",
+            "name": "hub.mqtt.topic/2",
+            "value": {"a": 1},
         },
     ]
+    assert not connections[("localhost", 1883, None, None)].trie.filters()
 
 
 @freeze_time("2021-01-01")
 @pytest.mark.asyncio
-async def test_mqtt_multiple_topics(mocker) -> None:
+async def test_mqtt_shared_connection(fake_mqtt: List[FakeMQTTClient]) -> None:
     """
-    Test that the source can listen to multiple topics.
+    Test that sources share a connection, receiving only their messages.
     """
-    vclock = aiotools.VirtualClock()
+    stream1 = mqtt(["topic/1"])
+    stream2 = mqtt(["topic/+"], prefix="hub.other")
+    event1 = asyncio.create_task(stream1.__anext__())
+    event2 = asyncio.create_task(stream2.__anext__())
+    while not fake_mqtt:
+        await asyncio.sleep(0)
 
-    mock = mocker.patch("senor_octopus.sources.mqtt.Client")
-    mock.return_value.__aenter__.return_value = mocker.MagicMock()
-    mock.return_value.__aenter__.return_value.subscribe = mocker.AsyncMock()
+    fake_mqtt[0].inbox.put_nowait(FakeMessage("topic/2", b"a"))
+    fake_mqtt[0].inbox.put_nowait(FakeMessage("topic/1", b"b"))
+    assert (await event1)["value"] == "b"
+    assert (await event2)["name"] == "hub.other.topic/2"
+    assert (await stream2.__anext__())["name"] == "hub.other.topic/1"
+    assert len(fake_mqtt) == 1
 
-    async def gen(topic):
-        sleep = 2 if topic == "topic/1" else 5
-        count = 3 if topic == "topic/1" else 2
+    await stream1.aclose()
+    await stream2.aclose()
 
-        for i in range(count):
-            await asyncio.sleep(sleep)
-            yield FakeMessage(topic, str(i).encode("utf-8"))
 
-        if topic == "other/1":
-            raise asyncio.CancelledError("Canceled")
+@freeze_time("2021-01-01", auto_tick_seconds=1)
+@pytest.mark.asyncio
+async def test_mqtt_batch(fake_mqtt: List[FakeMQTTClient]) -> None:
+    """
+    Test processing queued messages in batches, with raw payloads.
+    """
+    stream = mqtt(["topic/#"], raw=True, batch_size=2)
+    first = asyncio.create_task(stream.__anext__())
+    while not fake_mqtt:
+        await asyncio.sleep(0)
 
-    def get_stream(topic):
-        stream = mocker.MagicMock()
-        stream.__aenter__ = mocker.AsyncMock()
-        stream.__aenter__.return_value = gen(topic)
-        return stream
+    for i in range(3):
+        fake_mqtt[0].inbox.put_nowait(FakeMessage(f"topic/{i}", b"\x00\x01"))
+    events = [await first, await stream.__anext__(), await stream.__anext__()]
+    await stream.aclose()
 
-    mock.return_value.__aenter__.return_value.filtered_messages.side_effect = get_stream
-    topics = ["topic/1", "other/1"]
-    with vclock.patch_loop():
-        events = [event async for event in mqtt(topics, message_is_json=True)]
-    assert events == [
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": 0,
-        },
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": 1,
-        },
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.other/1",
-            "value": 0,
-        },
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.topic/1",
-            "value": 2,
-        },
-        {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.mqtt.other/1",
-            "value": 1,
-        },
-    ]
+    assert [event["value"] for event in events] == [b"\x00\x01"] * 3
+    # the first two messages are processed together
+    assert events[0]["timestamp"] == events[1]["timestamp"]
+    assert events[2]["timestamp"] > events[1]["timestamp"]
+
+
+def test_get_decoder() -> None:
+    """
+    Test decoding payloads.
+    """
+    assert get_decoder(False, False)(b"1") == "1"
+    assert get_decoder(True, False)(b'{"a": [1, 2]}') == {"a": [1, 2]}
+    assert get_decoder(True, False)(b"{") == "{"
+    assert get_decoder(False, True)(b"1") == b"1"
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        get_decoder(True, True)
+    assert str(excinfo.value) == "`raw` and `message_is_json` are mutually exclusive"
+
+
+def test_mqtt_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert mqtt.configuration_schema.load(
+        {"topics": ["topic/#"], "message_is_json": True, "batch_size": 100},
+    ) == {"topics": ["topic/#"], "message_is_json": True, "batch_size": 100}
@@ -3,20 +3,46 @@ Tests for ``source.sqla``.
 """
 
 from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, List, Tuple
 
 import pytest
 from freezegun import freeze_time
+from pytest_mock import MockerFixture
+from sqlalchemy import create_engine, text
 
-from senor_octopus.sources.sqla import sqla
+from senor_octopus.exceptions import InvalidConfigurationException
+from senor_octopus.lib import (
+    MemoryStateStore,
+    SQLiteStateStore,
+    StateStore,
+    run_shutdown_callbacks,
+)
+from senor_octopus.sources.sqla import dispose_engines, engines, get_engine, sqla
 
-results = [
-    {
-        "timestamp": datetime(2020, 12, 31, 0, 0, tzinfo=timezone.utc),
-        "name": "foo",
-        "value": "bar",
-    },
-    {"name": "foo", "value": "baz"},
-]
+
+@pytest.fixture(autouse=True)
+def clear_engines(mocker: MockerFixture) -> None:
+    """
+    Start every test without cached engines or shutdown callbacks.
+    """
+    mocker.patch.dict(engines, clear=True)
+    mocker.patch("senor_octopus.lib.shutdown_callbacks", [])
+
+
+def mock_result(mocker: MockerFixture, keys: List[str], rows: List[Tuple]) -> Any:
+    """
+    Build a mock streaming result, with one row per partition.
+    """
+
+    async def partitions(size: int) -> AsyncIterator[List[Tuple]]:
+        for row in rows:
+            yield [row]
+
+    result = mocker.MagicMock()
+    result.keys.return_value = keys
+    result.partitions = partitions
+    return result
 
 
 @freeze_time("2021-01-01")
@@ -29,10 +55,17 @@ async def test_sqla(mocker) -> None:
     mock_conn = (
         mock.return_value.connect.return_value.__aenter__.return_value
     ) = mocker.MagicMock()
-    mock_conn.execute = mocker.AsyncMock()
-    mock_conn.execute.return_value = results
+    mock_conn.stream = mocker.AsyncMock()
+    mock_conn.stream.return_value = mock_result(
+        mocker,
+        ["value", "name", "timestamp"],
+        [
+            ("bar", "foo", datetime(2020, 12, 31, 0, 0, tzinfo=timezone.utc)),
+            ("baz", "foo", datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc)),
+        ],
+    )
 
-    events = [event async for event in sqla("uri", "sql")]
+    events = [event async for event in sqla("uri", "sql", chunk_size=10)]
     assert events == [
         {
             "timestamp": datetime(2020, 12, 31, 0, 0, tzinfo=timezone.utc),
@@ -45,31 +78,190 @@ async def test_sqla(mocker) -> None:
             "value": "baz",
         },
     ]
+    assert mock_conn.stream.call_args.kwargs == {
+        "execution_options": {"max_row_buffer": 10},
+    }
 
 
 @freeze_time("2021-01-01")
 @pytest.mark.asyncio
-async def test_sqla_sync(mocker) -> None:
+async def test_sqla_sync(tmp_path: Path) -> None:
     """
-    Test the SQLA source in synchronous mode.
+    Test the SQLA source in synchronous mode, streaming rows from SQLite.
     """
-    mock = mocker.patch("senor_octopus.sources.sqla.create_engine")
-    mock_conn = (
-        mock.return_value.connect.return_value.__enter__.return_value
-    ) = mocker.MagicMock()
-    mock_conn.execute = mocker.Mock()
-    mock_conn.execute.return_value = results
+    uri = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = create_engine(uri)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (name TEXT, value INTEGER)"))
+        conn.execute(
+            text("INSERT INTO t (name, value) VALUES (:name, :value)"),
+            [{"name": f"foo{i}", "value": i} for i in range(25)],
+        )
+    engine.dispose()
 
-    events = [event async for event in sqla("uri", "sql", sync=True)]
-    assert events == [
-        {
-            "timestamp": datetime(2020, 12, 31, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.sqla.foo",
-            "value": "bar",
-        },
+    events = [
+        event
+        async for event in sqla(
+            uri,
+            "SELECT value, name FROM t ORDER BY value",
+            sync=True,
+            chunk_size=10,
+        )
+    ]
+    assert len(events) == 25
+    assert events[-1] == {
+        "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
+        "name": "hub.sqla.foo24",
+        "value": 24,
+    }
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        async for event in sqla(uri, "SELECT name FROM t", sync=True):
+            pass
+    assert str(excinfo.value) == "The query must return the `name` and `value` columns"
+
+
+@pytest.mark.asyncio
+async def test_sqla_engine_reused(mocker) -> None:
+    """
+    Test that engines are created once and shared between runs.
+    """
+    mock = mocker.patch("senor_octopus.sources.sqla.create_async_engine")
+    mock_conn = mock.return_value.connect.return_value.__aenter__.return_value
+    mock_conn.stream = mocker.AsyncMock(
+        side_effect=lambda *args, **kwargs: mock_result(mocker, ["name", "value"], []),
+    )
+
+    for _ in range(3):
+        assert not [
+            event
+            async for event in sqla(
+                "uri",
+                "sql",
+                pool_size=2,
+                max_overflow=0,
+                pool_pre_ping=True,
+                pool_recycle=3600,
+            )
+        ]
+    mock.assert_called_once_with(
+        "uri",
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_size=2,
+    )
+
+    mock.return_value.dispose = mocker.AsyncMock()
+    await run_shutdown_callbacks()
+    mock.return_value.dispose.assert_awaited()
+    assert not engines
+
+
+@pytest.mark.asyncio
+async def test_get_engine(tmp_path: Path) -> None:
+    """
+    Test the engine registry with a real database.
+    """
+    uri = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = get_engine(uri, True)
+    assert get_engine(uri, True) is engine
+    assert get_engine(uri, True, pool_pre_ping=True) is not engine
+    assert len(engines) == 2
+
+    await dispose_engines()
+    assert not engines
+
+
+@pytest.mark.asyncio
+async def test_sqla_watermark(tmp_path: Path) -> None:
+    """
+    Test incremental queries, resuming from a persisted watermark.
+    """
+    uri = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = create_engine(uri)
+    insert = text("INSERT INTO t (id, name, value) VALUES (:id, :name, :value)")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER, name TEXT, value INTEGER)"))
+        conn.execute(insert, [{"id": i, "name": "foo", "value": i} for i in range(5)])
+
+    async def run(state: StateStore) -> List[int]:
+        return [
+            event["value"]
+            async for event in sqla(
+                uri,
+                "SELECT id, name, value FROM t WHERE id > :watermark",
+                sync=True,
+                chunk_size=2,
+                watermark="id",
+                initial_watermark=1,
+                state=state,
+            )
+        ]
+
+    path = str(tmp_path / "state.db")
+    state = SQLiteStateStore(path, "sqla")
+    assert await run(state) == [2, 3, 4]
+    assert await run(state) == []
+    state.close()
+
+    with engine.begin() as conn:
+        conn.execute(insert, [{"id": 5, "name": "foo", "value": 5}])
+        conn.execute(insert, [{"id": None, "name": "foo", "value": None}])
+    engine.dispose()
+
+    # after a restart only the new row is read
+    state = SQLiteStateStore(path, "sqla")
+    assert await run(state) == [5]
+    assert state.get("watermark") == 5
+    state.close()
+
+
+@pytest.mark.asyncio
+async def test_sqla_watermark_async(mocker: MockerFixture) -> None:
+    """
+    Test incremental queries in asynchronous mode.
+    """
+    mock = mocker.patch("senor_octopus.sources.sqla.create_async_engine")
+    mock_conn = mock.return_value.connect.return_value.__aenter__.return_value
+    mock_conn.stream = mocker.AsyncMock(
+        return_value=mock_result(
+            mocker,
+            ["name", "value", "id"],
+            [("foo", 1, 10), ("foo", 2, 5), ("foo", 3, None)],
+        ),
+    )
+
+    state = MemoryStateStore()
+    events = [event async for event in sqla("uri", "sql", watermark="id", state=state)]
+    assert len(events) == 3
+    assert mock_conn.stream.call_args.args[1] == {"watermark": None}
+    assert state.get("watermark") == 10
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        async for event in sqla("uri", "sql", watermark="ts"):
+            pass
+    assert str(excinfo.value) == 'The query must return the watermark column "ts"'
+
+
+def test_sqla_configuration_schema() -> None:
+    """
+    Test loading the configuration.
+    """
+    assert sqla.configuration_schema.load(
         {
-            "timestamp": datetime(2021, 1, 1, 0, 0, tzinfo=timezone.utc),
-            "name": "hub.sqla.foo",
-            "value": "baz",
+            "uri": "postgresql://localhost/db",
+            "sql": "SELECT name, value FROM t WHERE id > :watermark",
+            "sync": True,
+            "pool_size": 5,
+            "watermark": "id",
+            "initial_watermark": 0,
         },
-    ]
+    ) == {
+        "uri": "postgresql://localhost/db",
+        "sql": "SELECT name, value FROM t WHERE id > :watermark",
+        "sync": True,
+        "pool_size": 5,
+        "watermark": "id",
+        "initial_watermark": 0,
+    }
@@ -0,0 +1,329 @@
+"""
+Tests for the TCP source.
+"""
+
+import asyncio
+import socket
+import struct
+from datetime import datetime, timezone
+from typing import Any, List, Tuple
+
+import pytest
+from asyncstdlib.builtins import anext as anext_
+from pytest_mock import MockerFixture
+
+from senor_octopus.exceptions import FramingException, InvalidConfigurationException
+from senor_octopus.sources.tcp import (
+    DelimiterFramer,
+    LengthPrefixFramer,
+    Server,
+    StreamTransport,
+    get_framer,
+    tcp,
+)
+
+GPS_REPORT = (
+    b"+RESP:GTFRI,423136,352009117419957,,0,0,1,1.0,0.0,62,"
+    b"28.3,-122.990623,38.313342,20230414193420,310,260,38F2,"
+    b"2D01A05,00,77,20230414193424,0297$"
+)
+HEARTBEAT = b"+ACK:GTHBD,423136,352009117419957,,20230413184216,010C$"
+
+
+class EchoProtocol(asyncio.DatagramProtocol):
+    """
+    A protocol that sends messages to the queue, and replies with their size.
+    """
+
+    def __init__(self, queue: asyncio.Queue) -> None:
+        self.queue = queue
+        self.transport: Any = None
+
+    def connection_made(self, transport: Any) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.queue.put_nowait(data.decode())
+        self.transport.sendto(str(len(data)).encode(), addr)
+
+
+def get_free_port() -> int:
+    """
+    Find a free TCP port.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+async def connect(port: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    Connect to a port, waiting for the server to start.
+    """
+    attempts = 0
+    while True:
+        try:
+            return await asyncio.open_connection("localhost", port)
+        except OSError:
+            attempts += 1
+            if attempts == 100:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def start(stream: Any) -> Tuple["asyncio.Task[None]", List[Any]]:
+    """
+    Consume a stream in the background, collecting its events.
+    """
+    events: List[Any] = []
+
+    async def consume() -> None:
+        async for event in stream:
+            events.append(event)
+
+    return asyncio.create_task(consume()), events
+
+
+def test_delimiter_framer() -> None:
+    """
+    Test splitting messages by a delimiter.
+    """
+    framer = DelimiterFramer(b"\r\n", 10)
+    buffer = bytearray(b"a\r\nbc\r\n\r\nde")
+    assert framer.split(buffer) == ([b"a", b"bc", b""], 9)
+    assert framer.split(bytearray(b"de")) == ([], 0)
+
+    # messages before one that is too big are still returned
+    buffer = bytearray(b"a\r\n" + b"b" * 11)
+    assert framer.split(buffer) == ([b"a"], 3)
+    with pytest.raises(FramingException) as excinfo:
+        framer.split(buffer[3:])
+    assert str(excinfo.value) == "Message exceeds the maximum size of 10 bytes"
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        DelimiterFramer(b"", 10)
+    assert str(excinfo.value) == "The delimiter can't be empty"
+
+
+def test_length_prefix_framer() -> None:
+    """
+    Test splitting messages prefixed by their length.
+    """
+    framer = LengthPrefixFramer("!H", 10)
+    buffer = bytearray(b"\x00\x01a\x00\x02bc\x00\x03de")
+    assert framer.split(buffer) == ([b"a", b"bc"], 7)
+    assert framer.split(bytearray(b"\x00")) == ([], 0)
+
+    buffer = bytearray(b"\x00\x01a" + struct.pack("!H", 11))
+    assert framer.split(buffer) == ([b"a"], 3)
+    with pytest.raises(FramingException) as excinfo:
+        framer.split(buffer[3:])
+    assert (
+        str(excinfo.value) == "Message of 11 bytes exceeds the maximum size of 10 bytes"
+    )
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        LengthPrefixFramer("!X", 10)
+    assert str(excinfo.value) == 'Invalid length format "!X"'
+
+
+def test_get_framer() -> None:
+    """
+    Test building framers from their names.
+    """
+    framer = get_framer("newline", "$", "!H", 100)
+    assert isinstance(framer, DelimiterFramer)
+    assert framer.delimiter == b"\n"
+
+    framer = get_framer("delimiter", "$", "!H", 100)
+    assert isinstance(framer, DelimiterFramer)
+    assert framer.delimiter == b"$"
+
+    framer = get_framer("length", "$", "!I", 100)
+    assert isinstance(framer, LengthPrefixFramer)
+    assert framer.header.size == 4
+
+    with pytest.raises(InvalidConfigurationException) as excinfo:
+        get_framer("json", "$", "!H", 100)
+    assert (
+        str(excinfo.value)
+        == 'Invalid framing "json", must be one of: newline, delimiter, length'
+    )
+
+
+def test_stream_transport(mocker: MockerFixture) -> None:
+    """
+    Test routing replies to connections.
+    """
+    _logger = mocker.patch("senor_octopus.sources.tcp._logger")
+    transport = StreamTransport()
+    assert transport.get_extra_info("peername", "default") == "default"
+
+    open_writer = mocker.MagicMock()
+    open_writer.is_closing.return_value = False
+    closed_writer = mocker.MagicMock()
+    closed_writer.is_closing.return_value = True
+    transport.writers = {"a": open_writer, "b": closed_writer}
+
+    transport.sendto(b"1", "a")
+    transport.sendto(b"2", "b")
+    transport.sendto(b"3", "c")
+    open_writer.write.assert_called_once_with(b"1")
+    closed_writer.write.assert_not_called()
+    assert _logger.warning.call_count == 2
+
+    transport.close()
+    open_writer.close.assert_called()
+    closed_writer.close.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_server_connection_error(mocker: MockerFixture) -> None:
+    """
+    Test that connections are cleaned up after errors.
+    """
+    _logger = mocker.patch("senor_octopus.sources.tcp._logger")
+    queue: asyncio.Queue = asyncio.Queue()
+    server = Server(EchoProtocol(queue), DelimiterFramer(b"\n", 100), 1024, 60)
+
+    reader = mocker.MagicMock()
+    reader.read = mocker.AsyncMock(side_effect=[b"a\nb", ConnectionResetError()])
+    writer = mocker.MagicMock()
+    writer.get_extra_info.return_value = ("localhost", 1234)
+    writer.is_closing.return_value = False
+
+    await server.handle(reader, writer)
+    assert queue.get_nowait() == "a"
+    assert queue.empty()
+    writer.close.assert_called()
+    assert server.transport.writers == {}
+    assert server.last_seen == {}
+    _logger.warning.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_tcp(mocker: MockerFixture) -> None:
+    """
+    Tests for the ``tcp`` source.
+    """
+    mock_datetime = mocker.patch("senor_octopus.sources.tcp.datetime")
+    mock_datetime.now.return_value = datetime(2022, 1, 1, 19, 0, tzinfo=timezone.utc)
+    mocker.patch("senor_octopus.sources.tcp.load_protocol", return_value=EchoProtocol)
+    port = get_free_port()
+
+    task, events = await start(tcp("echo", port=port, prefix="hub.test"))
+    connections = [await connect(port) for _ in range(3)]
+    for i, (reader, writer) in enumerate(connections):
+        # messages can be split across reads
+        writer.write(f"hello,{i}\nwor".encode())
+        await writer.drain()
+        await asyncio.sleep(0.01)
+        writer.write(b"ld\n")
+        await writer.drain()
+        assert await reader.readexactly(2) == b"75"
+
+    task.cancel()
+    await task
+    for _, writer in connections:
+        writer.close()
+
+    assert events == [
+        {
+            "timestamp": datetime(2022, 1, 1, 19, 0, tzinfo=timezone.utc),
+            "name": "hub.test.message",
+            "value": value,
+        }
+        for i in range(3)
+        for value in (f"hello,{i}", "world")
+    ]
+
+
+@pytest.mark.asyncio
+async def test_tcp_micron() -> None:
+    """
+    Test the ``tcp`` source with a protocol from the UDP entry points.
+    """
+    port = get_free_port()
+    task, events = await start(
+        tcp(
+            "micron_bolt_mini_2",
+            port=port,
+            framing="delimiter",
+            delimiter="$",
+            idle_timeout=0,
+        ),
+    )
+    reader, writer = await connect(port)
+    writer.write(HEARTBEAT + GPS_REPORT)
+    await writer.drain()
+    reply = b"+SACK:GTHBD,423136,010C$\r\n+SACK:0297$\r\n"
+    assert await reader.readexactly(len(reply)) == reply
+
+    task.cancel()
+    await task
+    writer.close()
+
+    assert len(events) == 1
+    assert events[0]["name"] == "hub.tcp.message"
+    assert events[0]["value"]["id"] == "352009117419957"
+    assert events[0]["value"]["source"] == "gps"
+
+
+@pytest.mark.asyncio
+async def test_tcp_length_prefix(mocker: MockerFixture) -> None:
+    """
+    Test length-prefixed messages, closing connections with invalid ones.
+    """
+    mocker.patch("senor_octopus.sources.tcp.load_protocol", return_value=EchoProtocol)
+    port = get_free_port()
+
+    task, events = await start(
+        tcp("echo", port=port, framing="length", max_frame_size=10),
+    )
+    reader, writer = await connect(port)
+    writer.write(b"\x00\x05hello\x00\x05world\x00\x0bhello world")
+    await writer.drain()
+    assert await reader.read() == b"55"
+
+    task.cancel()
+    await task
+    writer.close()
+
+    assert [event["value"] for event in events] == ["hello", "world"]
+
+
+@pytest.mark.asyncio
+async def test_tcp_idle_timeout(mocker: MockerFixture) -> None:
+    """
+    Test that idle connections are closed.
+    """
+    mocker.patch("senor_octopus.sources.tcp.load_protocol", return_value=EchoProtocol)
+    port = get_free_port()
+
+    task, _ = await start(tcp("echo", port=port, idle_timeout=0.1))
+    active_reader, active_writer = await connect(port)
+    idle_reader, idle_writer = await connect(port)
+
+    for _ in range(4):
+        active_writer.write(b"ping\n")
+        await active_writer.drain()
+        assert await active_reader.readexactly(1) == b"4"
+        await asyncio.sleep(0.05)
+
+    assert await asyncio.wait_for(idle_reader.read(), 1) == b""
+    assert not active_reader.at_eof()
+
+    task.cancel()
+    await task
+    assert await asyncio.wait_for(active_reader.read(), 1) == b""
+    active_writer.close()
+    idle_writer.close()
+
+
+@pytest.mark.asyncio
+async def test_tcp_invalid_framing() -> None:
+    """
+    Test the ``tcp`` source with an invalid framing.
+    """
+    with pytest.raises(InvalidConfigurationException):
+        await anext_(tcp("micron_bolt_mini_2", framing="json"))
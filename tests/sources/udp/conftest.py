@@ -0,0 +1,21 @@
+"""
+Fixtures for the UDP source tests.
+"""
+
+from typing import AsyncIterator
+
+import pytest_asyncio
+from pytest_mock import MockerFixture
+
+from senor_octopus.sources.udp.geolocation import close_client
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def http_client(mocker: MockerFixture) -> AsyncIterator[None]:
+    """
+    Close the shared HTTP client after each test.
+    """
+    mocker.patch("senor_octopus.sources.udp.geolocation.clients", [])
+    mocker.patch("senor_octopus.lib.shutdown_callbacks", [])
+    yield
+    await close_client()
@@ -0,0 +1,146 @@
+"""
+Tests for the declarative UDP decoders.
+"""
+
+import asyncio
+import struct
+from datetime import datetime, timezone
+
+import pytest
+from pytest_mock import MockerFixture
+
+from senor_octopus.sources.udp.decoders import (
+    DecoderProtocol,
+    Field,
+    Layout,
+    Struct,
+    Text,
+    get_protocol_class,
+    text,
+    timestamp,
+)
+
+
+def test_timestamp() -> None:
+    """
+    Test parsing timestamps.
+    """
+    assert timestamp(b"20230414193420") == datetime(
+        2023,
+        4,
+        14,
+        19,
+        34,
+        20,
+        tzinfo=timezone.utc,
+    )
+
+
+def test_layout() -> None:
+    """
+    Test that layouts must implement ``decode``.
+    """
+    with pytest.raises(NotImplementedError):
+        Layout().decode(b"")
+
+
+def test_text() -> None:
+    """
+    Test decoding delimited text.
+    """
+    layout = Text(
+        Field("name", 0, text),
+        Field("value", 1, float),
+        Field("raw", -1),
+        terminator=b"$",
+    )
+    assert layout.decode(b" temperature,21.5,1,2$\r\n") == {
+        "name": "temperature",
+        "value": 21.5,
+        "raw": b"2",
+    }
+    assert layout.decode(memoryview(b"humidity,0.6,3")) == {
+        "name": "humidity",
+        "value": 0.6,
+        "raw": b"3",
+    }
+
+
+def test_text_no_conversions() -> None:
+    """
+    Test decoding delimited text without conversions.
+    """
+    layout = Text(Field("a", 0), Field("rest", slice(1, None)), delimiter=b";")
+    assert layout.decode(b"1;2;3") == {"a": b"1", "rest": [b"2", b"3"]}
+
+    layout = Text(Field("a", 1))
+    assert layout.decode(b"1,2,3") == {"a": b"2"}
+
+
+def test_text_variants() -> None:
+    """
+    Test decoding messages with different fields.
+    """
+    layout = Text(
+        Field("type", 0, text),
+        variants={
+            b"T": [Field("temperature", 1, float)],
+            b"E": [],
+        },
+    )
+    assert layout.decode(b"T,21.5") == {"type": "T", "temperature": 21.5}
+    assert layout.decode(b"E,21.5") == {"type": "E"}
+    assert layout.decode(b"X,21.5") == {"type": "X"}
+
+    with pytest.raises(ValueError):
+        layout.decode(b"T,hot")
+
+
+def test_struct() -> None:
+    """
+    Test decoding binary messages.
+    """
+    layout = Struct(
+        "!HhB",
+        Field("id", 0),
+        Field("temperature", 1, lambda value: value / 10),
+        Field("battery", 2),
+        offset=1,
+    )
+    data = b"\x01" + struct.pack("!HhB", 42, -35, 99)
+    assert layout.decode(memoryview(data)) == {
+        "id": 42,
+        "temperature": -3.5,
+        "battery": 99,
+    }
+
+    with pytest.raises(struct.error):
+        layout.decode(b"\x01")
+
+
+@pytest.mark.asyncio
+async def test_decoder_protocol(mocker: MockerFixture) -> None:
+    """
+    Test a protocol built from a layout.
+    """
+    _logger = mocker.patch("senor_octopus.sources.udp.decoders._logger")
+    protocol_class = get_protocol_class(Text(Field("value", 1, int)))
+    assert protocol_class.__name__ == "TextProtocol"
+    assert issubclass(protocol_class, DecoderProtocol)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    protocol = protocol_class(queue)
+    addr = ("localhost", 5000)
+
+    # no connection
+    protocol.datagram_received(b"a,1", addr)
+    assert queue.empty()
+
+    protocol.connection_made(mocker.MagicMock())
+    protocol.datagram_received(b"a,1", addr)
+    assert queue.get_nowait() == {"value": 1}
+
+    protocol.datagram_received(b"a", addr)
+    protocol.datagram_received(b"a,b", addr)
+    assert queue.empty()
+    assert _logger.warning.call_count == 2
@@ -0,0 +1,116 @@
+"""
+Tests for the WiFi geolocation.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from pytest_httpx import HTTPXMock
+from pytest_mock import MockerFixture
+
+from senor_octopus.sources.udp.geolocation import (
+    GEOLOCATION_URL,
+    Geolocator,
+    LocationCache,
+    get_cache_key,
+    get_client,
+    normalize_mac_address,
+)
+
+LOCATION = {"latitude": 38.3, "longitude": -122.9, "accuracy": 20}
+
+
+def test_get_cache_key() -> None:
+    """
+    Test that keys ignore the order, format and signal of the access points.
+    """
+    assert normalize_mac_address("B0E4D556FBC6") == "b0:e4:d5:56:fb:c6"
+    assert normalize_mac_address("b0:e4:d5:56:fb:c6:") == "b0:e4:d5:56:fb:c6"
+    assert normalize_mac_address("b0-e4-d5-56-fb-c6") == "b0:e4:d5:56:fb:c6"
+
+    assert get_cache_key(
+        [
+            {"macAddress": "b0:e4:d5:56:fb:c6:", "signalStrength": -58},
+            {"macAddress": "a4:d7:95:04:10:2d:", "signalStrength": -73},
+        ],
+    ) == get_cache_key(
+        [
+            {"macAddress": "A4D79504102D", "signalStrength": -70},
+            {"macAddress": "B0E4D556FBC6", "signalStrength": -60},
+        ],
+    )
+
+
+def test_location_cache(mocker: MockerFixture) -> None:
+    """
+    Test expiring and evicting cached locations.
+    """
+    monotonic = mocker.patch(
+        "senor_octopus.sources.udp.geolocation.time.monotonic",
+        return_value=0,
+    )
+    cache = LocationCache(size=2, ttl=60)
+    cache.set(frozenset("a"), LOCATION)
+    cache.set(frozenset("b"), LOCATION)
+    assert cache.get(frozenset("a")) == LOCATION
+
+    # ``b`` is the least recently used
+    cache.set(frozenset("c"), LOCATION)
+    assert cache.get(frozenset("b")) is None
+    assert cache.get(frozenset("a")) == LOCATION
+
+    monotonic.return_value = 61
+    assert cache.get(frozenset("a")) is None
+    assert list(cache.entries) == [frozenset("c")]
+
+
+@pytest.mark.asyncio
+async def test_geolocator(httpx_mock: HTTPXMock) -> None:
+    """
+    Test looking up locations.
+    """
+    httpx_mock.add_response(
+        method="POST",
+        url=f"{GEOLOCATION_URL}?key=SECRET",
+        json={"location": {"lat": 38.3, "lng": -122.9}, "accuracy": 20},
+    )
+    httpx_mock.add_exception(httpx.ConnectTimeout("Timeout"))
+
+    geolocator = Geolocator("SECRET")
+    access_points = [{"macAddress": "b0:e4:d5:56:fb:c6", "signalStrength": -58}]
+    assert await geolocator.locate(access_points) == LOCATION
+    assert await geolocator.locate(access_points) == LOCATION
+    assert await geolocator.locate([]) is None
+    assert get_client() is get_client()
+
+
+@pytest.mark.asyncio
+async def test_geolocator_concurrency(mocker: MockerFixture) -> None:
+    """
+    Test that the number of concurrent requests is bounded.
+    """
+    in_flight = 0
+    highest = 0
+
+    async def post(*args, **kwargs):
+        nonlocal in_flight, highest
+        in_flight += 1
+        highest = max(highest, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(
+            200,
+            json={"location": {"lat": 38.3, "lng": -122.9}, "accuracy": 20},
+        )
+
+    mocker.patch.object(get_client(), "post", side_effect=post)
+    geolocator = Geolocator("SECRET", max_concurrency=2)
+    locations = await asyncio.gather(
+        *(
+            geolocator.locate([{"macAddress": f"{i:012x}", "signalStrength": -50}])
+            for i in range(6)
+        ),
+    )
+    assert locations == [LOCATION] * 6
+    assert highest == 2
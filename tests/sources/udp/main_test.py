@@ -3,49 +3,130 @@ Tests for the UDP source.
 """
 
 import asyncio
+import itertools
+import socket
 from datetime import datetime, timezone
+from typing import Any, List, Tuple
 
-import aiotools
 import pytest
 from asyncstdlib.builtins import anext as anext_
-from freezegun import freeze_time
 from pytest_mock import MockerFixture
 
 from senor_octopus.sources.udp.main import udp
 
+GPS_REPORT = (
+    b"+RESP:GTFRI,423136,352009117419957,,0,0,1,1.0,0.0,62,"
+    b"28.3,-122.990623,38.313342,20230414193420,310,260,38F2,"
+    b"2D01A05,00,77,20230414193424,0297$"
+)
+
+
+class EchoProtocol(asyncio.DatagramProtocol):
+    """
+    A protocol that sends comma-separated values to the queue.
+    """
+
+    def __init__(self, queue: asyncio.Queue, suffix: str = "") -> None:
+        self.queue = queue
+        self.suffix = suffix
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        for value in data.decode().split(","):
+            self.queue.put_nowait(value + self.suffix)
+
+
+def get_free_port() -> int:
+    """
+    Find a free UDP port.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+async def collect(stream: Any, port: int, datagrams: List[bytes]) -> List[Any]:
+    """
+    Send datagrams to a port, returning the events from a stream.
+    """
+    events: List[Any] = []
+
+    async def consume() -> None:
+        async for event in stream:
+            events.append(event)
+
+    task = asyncio.create_task(consume())
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _ in range(200):
+            await asyncio.sleep(0.05)
+            for datagram in datagrams:
+                sock.sendto(datagram, ("localhost", port))
+            if events:
+                break
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await task
+    return events
+
 
-@freeze_time("2022-01-01T12:00:00-07:00")
 @pytest.mark.asyncio
 async def test_udp(mocker: MockerFixture) -> None:
     """
     Tests for the ``udp`` source.
     """
-    mocker.patch("senor_octopus.sources.udp.main.iter_entry_points")
+    mock_datetime = mocker.patch("senor_octopus.sources.udp.main.datetime")
+    mock_datetime.now.return_value = datetime(2022, 1, 1, 19, 0, tzinfo=timezone.utc)
+    mocker.patch(
+        "senor_octopus.sources.udp.main.load_protocol",
+        return_value=EchoProtocol,
+    )
+    port = get_free_port()
+
+    events = await collect(udp("echo", port=port, suffix="!"), port, [b"foo"])
+    assert events[0] == {
+        "name": "hub.udp.message",
+        "timestamp": datetime(2022, 1, 1, 19, 0, tzinfo=timezone.utc),
+        "value": "foo!",
+    }
+
+
+@pytest.mark.asyncio
+async def test_udp_batch(mocker: MockerFixture) -> None:
+    """
+    Test that queued messages are processed in batches.
+    """
+    mock_datetime = mocker.patch("senor_octopus.sources.udp.main.datetime")
+    mock_datetime.now.side_effect = itertools.count()
+    mocker.patch(
+        "senor_octopus.sources.udp.main.load_protocol",
+        return_value=EchoProtocol,
+    )
+    port = get_free_port()
 
-    mock_asyncio = mocker.patch("senor_octopus.sources.udp.main.asyncio")
-    mock_asyncio.CancelledError = asyncio.CancelledError
-    mock_asyncio.Queue().get = mocker.AsyncMock(
-        side_effect=[
-            {"foo": "bar"},
-            asyncio.CancelledError("Canceled"),
-        ],
+    events = await collect(
+        udp("echo", port=port, batch_size=2, queue_size=3),
+        port,
+        [b"a,b,c,d"],
     )
-    loop = mock_asyncio.get_running_loop.return_value = mocker.AsyncMock()
-    transport = mocker.MagicMock()
-    protocol = mocker.MagicMock()
-    loop.create_datagram_endpoint.return_value = transport, protocol
+    # the fourth message is dropped, since the queue is full
+    assert [event["value"] for event in events[:3]] == ["a", "b", "c"]
+    assert events[0]["timestamp"] == events[1]["timestamp"]
+    assert events[2]["timestamp"] > events[1]["timestamp"]
 
-    vclock = aiotools.VirtualClock()
-    with vclock.patch_loop():
-        events = [event async for event in udp("DummyProtocol")]
 
-    assert events == [
-        {
-            "name": "hub.udp.message",
-            "timestamp": datetime(2022, 1, 1, 19, 0, tzinfo=timezone.utc),
-            "value": {"foo": "bar"},
-        },
-    ]
+@pytest.mark.asyncio
+async def test_udp_workers() -> None:
+    """
+    Test receiving datagrams in worker processes.
+    """
+    port = get_free_port()
+
+    events = await collect(
+        udp("micron_bolt_mini_2", port=port, workers=2),
+        port,
+        [GPS_REPORT],
+    )
+    assert events[0]["value"]["id"] == "352009117419957"
+    assert events[0]["value"]["source"] == "gps"
 
 
 @pytest.mark.asyncio
@@ -54,11 +135,34 @@ async def test_udp_invalid_protocol(mocker: MockerFixture) -> None:
     Test the ``udp`` source when the protocol is invalid.
     """
     mocker.patch(
-        "senor_octopus.sources.udp.main.iter_entry_points",
+        "senor_octopus.sources.udp.workers.iter_entry_points",
         return_value=iter([]),
     )
 
-    mocker.patch("senor_octopus.sources.udp.main.asyncio")
-
     with pytest.raises(Exception, match='Protocol "DummyProtocol" not found'):
         await anext_(udp("DummyProtocol"))
+
+
+@pytest.mark.asyncio
+async def test_udp_worker_exited(mocker: MockerFixture, caplog) -> None:
+    """
+    Test that workers exiting are logged.
+    """
+    # the protocol is found in the main process, but not in the workers
+    mocker.patch(
+        "senor_octopus.sources.udp.main.load_protocol",
+        return_value=EchoProtocol,
+    )
+
+    async def consume() -> None:
+        async for _ in udp("invalid", port=get_free_port(), workers=1):
+            pass
+
+    task = asyncio.create_task(consume())
+    for _ in range(200):
+        await asyncio.sleep(0.05)
+        if "UDP worker exited" in caplog.text:
+            break
+    task.cancel()
+    await task
+    assert "UDP worker exited" in caplog.text
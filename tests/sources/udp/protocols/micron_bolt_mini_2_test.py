@@ -6,11 +6,12 @@ import asyncio
 from datetime import datetime, timezone
 
 import pytest
+from pytest_httpx import HTTPXMock
 from pytest_mock import MockerFixture
-from requests_mock.mocker import Mocker
 
 from senor_octopus.sources.udp.protocols.micron_bolt_mini_2 import (
     MicronBoltMini2UDPProtocol,
+    parse_access_points,
 )
 
 
@@ -20,7 +21,7 @@ async def test_micron_bolt_mini_2_no_connection(mocker: MockerFixture):
     Test protocol when ``data_received`` is called before ``connection_made``.
     """
     _logger = mocker.patch(
-        "senor_octopus.sources.udp.protocols.micron_bolt_mini_2._logger",
+        "senor_octopus.sources.udp.decoders._logger",
     )
     queue: asyncio.Queue = asyncio.Queue()
     protocol = MicronBoltMini2UDPProtocol(queue)
@@ -49,6 +50,40 @@ async def test_micron_bolt_mini_2_hearbeat(mocker: MockerFixture):
     transport.sendto.assert_called_with(b"+SACK:GTHBD,423136,010C$\r\n", addr)
 
 
+@pytest.mark.asyncio
+async def test_micron_bolt_mini_2_other_messages(mocker: MockerFixture):
+    """
+    Test protocol acknowledging unknown and invalid messages.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    protocol = MicronBoltMini2UDPProtocol(queue)
+    transport = mocker.MagicMock()
+    addr = ("localhost", 5000)
+
+    protocol.connection_made(transport)
+    protocol.datagram_received(b"+RESP:GTSTT,423136,352009117419957,,0298$", addr)
+    transport.sendto.assert_called_with(b"+SACK:0298$\r\n", addr)
+    assert queue.empty()
+
+    # invalid messages are not acknowledged
+    transport.reset_mock()
+    protocol.datagram_received(b"+RESP:GTFRI,423136,352009117419957,,0299$", addr)
+    transport.sendto.assert_not_called()
+    assert queue.empty()
+
+
+def test_parse_access_points():
+    """
+    Test parsing the access points in a WiFi report.
+    """
+    assert parse_access_points(
+        [b"b0e4d556fbc6", b"-58", b"", b"", b"", b"a4d79504102d", b"-73"],
+    ) == [
+        {"macAddress": "b0:e4:d5:56:fb:c6", "signalStrength": -58},
+        {"macAddress": "a4:d7:95:04:10:2d", "signalStrength": -73},
+    ]
+
+
 @pytest.mark.asyncio
 async def test_micron_bolt_mini_2_gps(mocker: MockerFixture):
     """
@@ -109,13 +144,14 @@ async def test_micron_bolt_mini_2_wifi_no_api_key(mocker: MockerFixture):
 @pytest.mark.asyncio
 async def test_micron_bolt_mini_2_wifi(
     mocker: MockerFixture,
-    requests_mock: Mocker,
+    httpx_mock: HTTPXMock,
 ):
     """
     Test protocol on a Wifi report.
     """
-    requests_mock.post(
-        "https://www.googleapis.com/geolocation/v1/geolocate?key=SECRET",
+    httpx_mock.add_response(
+        method="POST",
+        url="https://www.googleapis.com/geolocation/v1/geolocate?key=SECRET",
         json={"location": {"lat": 38.3130657, "lng": -122.9903798}, "accuracy": 20},
     )
 
@@ -133,7 +169,12 @@ async def test_micron_bolt_mini_2_wifi(
         ),
         addr,
     )
-    value = await queue.get()
+    # the device is acknowledged before the lookup finishes
+    transport.sendto.assert_called_with(b"+SACK:0295$\r\n", addr)
+    assert queue.empty()
+
+    await asyncio.gather(*protocol.tasks)
+    value = queue.get_nowait()
     assert value == {
         "accuracy": 20,
         "battery": 77.0,
@@ -148,13 +189,14 @@ async def test_micron_bolt_mini_2_wifi(
 @pytest.mark.asyncio
 async def test_micron_bolt_mini_2_wifi_not_found(
     mocker: MockerFixture,
-    requests_mock: Mocker,
+    httpx_mock: HTTPXMock,
 ):
     """
     Test protocol on a Wifi report when the geolocation fails.
     """
-    requests_mock.post(
-        "https://www.googleapis.com/geolocation/v1/geolocate?key=SECRET",
+    httpx_mock.add_response(
+        method="POST",
+        url="https://www.googleapis.com/geolocation/v1/geolocate?key=SECRET",
         json={
             "error": {
                 "code": 404,
@@ -185,4 +227,41 @@ async def test_micron_bolt_mini_2_wifi_not_found(
         ),
         addr,
     )
+    await asyncio.gather(*protocol.tasks)
     assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_micron_bolt_mini_2_wifi_cache(
+    mocker: MockerFixture,
+    httpx_mock: HTTPXMock,
+):
+    """
+    Test that repeated reports from the same place use the cached location.
+    """
+    httpx_mock.add_response(
+        method="POST",
+        url="https://www.googleapis.com/geolocation/v1/geolocate?key=SECRET",
+        json={"location": {"lat": 38.3130657, "lng": -122.9903798}, "accuracy": 20},
+    )
+
+    queue: asyncio.Queue = asyncio.Queue()
+    protocol = MicronBoltMini2UDPProtocol(queue, "SECRET")
+    transport = mocker.MagicMock()
+    addr = ("localhost", 5000)
+
+    protocol.connection_made(transport)
+    for signal_strength in (b"-58", b"-61"):
+        protocol.datagram_received(
+            (
+                b"+RESP:GTWIF,423136,352009117419957,,4,b0e4d556fbc6,"
+                + signal_strength
+                + b",,,,a4d79504102d,-73,,,,322f23291e0b,-78,,,,"
+                b"44a56edcdae8,-88,,,,,,,,77,20230414193408,0295$"
+            ),
+            addr,
+        )
+        await asyncio.gather(*protocol.tasks)
+
+    assert len(httpx_mock.get_requests()) == 1
+    assert queue.qsize() == 2
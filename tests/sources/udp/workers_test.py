@@ -0,0 +1,166 @@
+"""
+Tests for the UDP worker processes.
+"""
+
+import asyncio
+import multiprocessing
+import socket
+from typing import Any, Tuple
+
+import pytest
+from pytest_mock import MockerFixture
+
+from senor_octopus.sources.udp.decoders import DecoderProtocol, Field, Text
+from senor_octopus.sources.udp.protocols.micron_bolt_mini_2 import (
+    MicronBoltMini2UDPProtocol,
+)
+from senor_octopus.sources.udp.workers import (
+    BoundedQueue,
+    Collector,
+    SocketTransport,
+    create_socket,
+    drain,
+    load_protocol,
+    serve,
+)
+
+
+class ReplyProtocol(asyncio.DatagramProtocol):
+    """
+    A protocol that sends the datagrams to the queue, and replies to them.
+    """
+
+    def __init__(self, queue: Any, reply: bytes = b"ACK") -> None:
+        self.queue = queue
+        self.reply = reply
+        self.transport: Any = None
+
+    def connection_made(self, transport: Any) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.queue.put_nowait(data)
+        self.transport.sendto(self.reply, addr)
+
+
+def test_bounded_queue(caplog: pytest.LogCaptureFixture) -> None:
+    """
+    Test that items are dropped when the queue is full.
+    """
+    queue = BoundedQueue(2)
+    for i in range(1003):
+        queue.put_nowait(i)
+    assert queue.qsize() == 2
+    assert queue.dropped == 1001
+    assert caplog.messages == [
+        "Queue is full, 1 messages dropped so far",
+        "Queue is full, 1001 messages dropped so far",
+    ]
+
+
+def test_load_protocol(mocker: MockerFixture) -> None:
+    """
+    Test loading protocol classes and layouts from the entry points.
+    """
+    assert load_protocol("micron_bolt_mini_2") is MicronBoltMini2UDPProtocol
+
+    layout = Text(Field("name", 0), Field("value", 1, int))
+    entry_point = mocker.MagicMock()
+    entry_point.load.return_value = layout
+    mocker.patch(
+        "senor_octopus.sources.udp.workers.iter_entry_points",
+        return_value=iter([entry_point]),
+    )
+    protocol_class = load_protocol("layout")
+    assert issubclass(protocol_class, DecoderProtocol)
+    assert protocol_class.layout is layout
+
+
+@pytest.mark.asyncio
+async def test_collector() -> None:
+    """
+    Test that messages are sent in batches, once per loop iteration.
+    """
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    collector = Collector(writer)
+    collector.put_nowait(1)
+    collector.put_nowait(2)
+    assert not reader.poll()
+    await asyncio.sleep(0)
+    collector.put_nowait(3)
+    await asyncio.sleep(0)
+    assert reader.recv() == [1, 2]
+    assert reader.recv() == [3]
+
+
+def test_socket_transport(mocker: MockerFixture, caplog) -> None:
+    """
+    Test the transport used by the workers.
+    """
+    sock = create_socket("localhost", 0)
+    transport = SocketTransport(sock)
+    assert transport.get_extra_info("socket") is sock
+    assert transport.get_extra_info("sockname") == sock.getsockname()
+    assert transport.get_extra_info("peername", "default") == "default"
+
+    mock_sock = mocker.MagicMock()
+    mock_sock.sendto.side_effect = BlockingIOError()
+    SocketTransport(mock_sock).sendto(b"ACK", ("localhost", 5000))
+    assert "Socket buffer is full, dropping reply to" in caplog.text
+
+    # the port is in use
+    with pytest.raises(OSError):
+        create_socket(*sock.getsockname())
+    transport.close()
+
+
+def test_drain() -> None:
+    """
+    Test reading datagrams in batches.
+    """
+    queue = BoundedQueue()
+    receiver = create_socket("localhost", 0)
+    protocol = ReplyProtocol(queue)
+    protocol.connection_made(SocketTransport(receiver))
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        sender.settimeout(1)
+        for i in range(5):
+            sender.sendto(str(i).encode(), receiver.getsockname())
+        # at most 2 datagrams are read at a time
+        while queue.qsize() < 5:
+            assert drain(receiver, protocol, 2) <= 2
+        assert sender.recvfrom(10)[0] == b"ACK"
+
+    assert [queue.get_nowait() for _ in range(5)] == [b"0", b"1", b"2", b"3", b"4"]
+    receiver.close()
+
+
+@pytest.mark.asyncio
+async def test_serve(mocker: MockerFixture) -> None:
+    """
+    Test the worker loop.
+    """
+    mocker.patch(
+        "senor_octopus.sources.udp.workers.load_protocol",
+        return_value=ReplyProtocol,
+    )
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("localhost", 0))
+        host, port = sock.getsockname()
+
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    task = asyncio.create_task(
+        serve("reply", host, port, writer, 64, {"reply": b"OK"}),
+    )
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        while not reader.poll():
+            sender.sendto(b"hello", (host, port))
+            await asyncio.sleep(0.01)
+        assert reader.recv() == [b"hello"]
+        assert sender.recvfrom(10)[0] == b"OK"
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task